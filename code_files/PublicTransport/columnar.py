@@ -0,0 +1,145 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+COLUMNAR_FOLDER = os.path.join("raw_data", "2_columnar")
+COLUMNAR_FILE = "Timetable_{date}.parquet"
+ROW_GROUP_SIZE = 1 << 16
+
+def check_pyarrow():
+    if pa is None:
+        raise ImportError("The columnar store needs `pyarrow` (pip install pyarrow)")
+
+def get_schema(dtypes, dictionary = False):
+    # Arrow schema for the pandas `dtypes` ("str", "Int64", "Int32", "boolean", "float64" or "float32")
+    string = pa.dictionary(pa.int32(), pa.string()) if dictionary else pa.string()
+    types = {"str": string, "Int64": pa.int64(), "Int32": pa.int32(), "boolean": pa.bool_(), "float64": pa.float64(), "float32": pa.float32()}
+    return pa.schema([pa.field(column, types[dtype]) for column, dtype in dtypes.items()])
+
+def infer_dtypes(df: pd.DataFrame):
+    # `dtypes` (as used by `get_schema`) of the columns of a DataFrame : numbers and booleans keep their type, the
+    # other columns are strings
+    def name(dtype):
+        if str(dtype) in ("Int64", "Int32", "boolean", "float64", "float32"):
+            return str(dtype)
+        if dtype.kind in "iu":
+            return "Int32" if dtype.itemsize < 8 else "Int64"
+        if dtype.kind == "f":
+            return "float64"
+        if dtype.kind == "b":
+            return "boolean"
+        return "str"
+    return {column: name(dtype) for column, dtype in df.dtypes.items()}
+
+def to_pandas(table_or_batch):
+    # Dictionary-encoded strings become categories, integers and booleans keep their nullable pandas dtype
+    types_mapper = {pa.int64(): pd.Int64Dtype(), pa.int32(): pd.Int32Dtype(), pa.bool_(): pd.BooleanDtype()}.get
+    return table_or_batch.to_pandas(types_mapper=types_mapper)
+
+def ingest_timetable(chunks, parquet_path, dtypes, sort_by, n_buckets = 1, row_group_size = ROW_GROUP_SIZE):
+    # Convert the raw timetable (an iterable of DataFrame chunks with the columns of `dtypes`) into a parquet file
+    # sorted by `sort_by`. The rows are first spread over `n_buckets` temporary files (by hash of the first sort
+    # column), so that only one bucket at a time has to be sorted in memory. String columns are dictionary-encoded.
+    check_pyarrow()
+    bucket_folder = parquet_path + ".buckets"
+    os.makedirs(bucket_folder, exist_ok=True)
+
+    schema = get_schema(dtypes)
+    writers = {}
+    try:
+        for chunk in chunks:
+            buckets = pd.util.hash_array(chunk[sort_by[0]].to_numpy(dtype=str)) % n_buckets if n_buckets > 1 else np.zeros(len(chunk), dtype=int)
+            for bucket, part in chunk.groupby(buckets):
+                table = pa.Table.from_pandas(part, schema=schema, preserve_index=False)
+                if bucket not in writers:
+                    writers[bucket] = pq.ParquetWriter(os.path.join(bucket_folder, f"{bucket}.parquet"), schema)
+                writers[bucket].write_table(table)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    # Sort each bucket, and append it to the final file
+    final_schema = get_schema(dtypes, dictionary=True)
+    with pq.ParquetWriter(parquet_path + ".part", final_schema) as writer:
+        for bucket in sorted(writers):
+            table = pq.read_table(os.path.join(bucket_folder, f"{bucket}.parquet"))
+            table = table.sort_by([(column, "ascending") for column in sort_by])
+            writer.write_table(table.cast(final_schema), row_group_size=row_group_size)
+    os.replace(parquet_path + ".part", parquet_path)
+    shutil.rmtree(bucket_folder)
+
+def iter_parquet(parquet_path, columns, batch_size, filters = None):
+    # Read `columns` of the parquet file by batches of `batch_size` rows. `filters` is a dict {column: values};
+    # the row groups whose statistics exclude the values are not read.
+    check_pyarrow()
+    dataset = ds.dataset(parquet_path, format="parquet")
+    expression = None
+    for column, values in (filters or {}).items():
+        condition = ds.field(column).isin(list(values))
+        expression = condition if expression is None else expression & condition
+    for batch in dataset.to_batches(columns=columns, filter=expression, batch_size=batch_size):
+        if batch.num_rows > 0:
+            yield to_pandas(batch)[columns]
+
+class TableWriter:
+    # Write a DataFrame chunk by chunk, as parquet (typed, dictionary-encoded strings) and/or as csv.
+    # `path` has no extension. Without pyarrow, only the csv is written. `csv_format` (a function of a chunk) gives
+    # the chunk as exported in the csv.
+    def __init__(self, path, dtypes, parquet = True, csv = False, csv_format = None):
+        self.path = path
+        self.dtypes = dtypes
+        self.parquet = parquet and pa is not None
+        self.csv = csv or not self.parquet
+        self.csv_format = csv_format
+        self.writer = None
+        self.empty = True
+
+    def write(self, df: pd.DataFrame):
+        if self.parquet:
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path + ".parquet", get_schema(self.dtypes, dictionary=True))
+            table = pa.Table.from_pandas(df[list(self.dtypes)], preserve_index=False)
+            self.writer.write_table(table.cast(self.writer.schema))
+        if self.csv:
+            (self.csv_format(df) if self.csv_format is not None else df).to_csv(self.path + ".csv", sep=";", index=False, mode="w" if self.empty else "a", header=self.empty)
+        self.empty = False
+
+    def close(self):
+        if self.empty:
+            self.write(pd.DataFrame({column: pd.Series(dtype="object" if dtype == "str" else dtype) for column, dtype in self.dtypes.items()}))
+        if self.writer is not None:
+            self.writer.close()
+        # Remove the parquet file of a previous run if only the csv was written now (it would be read instead). An
+        # existing csv is never removed : it is only an export (possibly tracked), and the parquet file is read first.
+        if not self.parquet and os.path.isfile(self.path + ".parquet"):
+            os.remove(self.path + ".parquet")
+
+def write_table(df: pd.DataFrame, path, dtypes, parquet = True, csv = False, csv_format = None):
+    writer = TableWriter(path, dtypes, parquet=parquet, csv=csv, csv_format=csv_format)
+    writer.write(df)
+    writer.close()
+
+def table_exists(path):
+    return os.path.isfile(path + ".parquet") or os.path.isfile(path + ".csv")
+
+def read_table(path, dtypes = None, categorical = False):
+    # Read a table written by `TableWriter` (the parquet file if there is one). String columns are decoded to plain
+    # strings (or kept as categories with `categorical`), the other columns are converted to `dtypes` (e.g. to
+    # non-nullable types).
+    if pa is not None and os.path.isfile(path + ".parquet"):
+        table = pq.read_table(path + ".parquet")
+        if not categorical:
+            table = table.cast(pa.schema([pa.field(f.name, f.type.value_type if pa.types.is_dictionary(f.type) else f.type) for f in table.schema]))
+        df = to_pandas(table)
+    else:
+        df = pd.read_csv(path + ".csv", sep = "[ \t]*;[ \t]*", engine="python")
+    return df.astype({column: dtype for column, dtype in (dtypes or {}).items() if column in df and dtype != "str"})
@@ -0,0 +1,39 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+FINGERPRINT_FILE = "fingerprint.json"
+
+def compute_fingerprint(params: dict):
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+def frame_digest(df: pd.DataFrame):
+    # Digest of the content of a DataFrame (values and column names, not the index)
+    h = hashlib.sha256(",".join(map(str, df.columns)).encode())
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
+
+def read_fingerprint(folder):
+    path = os.path.join(folder, FINGERPRINT_FILE)
+    if os.path.isfile(path):
+        with open(path) as f:
+            return json.load(f)
+
+def write_fingerprint(folder, params: dict):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, FINGERPRINT_FILE), "w") as f:
+        json.dump({"fingerprint": compute_fingerprint(params), "params": params}, f, indent=1, default=str)
+
+def matches_fingerprint(folder, params: dict, unknown = ()):
+    # Whether the fingerprint saved in `folder` was computed with `params`. The keys in `unknown` (inputs that cannot
+    # be checked right now, e.g. a source file that has been removed) are compared only if they are not None.
+    saved = read_fingerprint(folder)
+    if saved is None:
+        return False
+    if saved["fingerprint"] == compute_fingerprint(params):
+        return True
+    saved_params = saved["params"]
+    known = {key: value for key, value in params.items() if not (key in unknown and value is None)}
+    return all(key in saved_params for key in known) and compute_fingerprint(known) == compute_fingerprint({key: saved_params[key] for key in known})
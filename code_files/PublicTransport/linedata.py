@@ -1,34 +1,216 @@
 import os
 import re
+from collections import OrderedDict
 
 import numpy as np
 import pandas as pd
 
 from matplotlib.axes import Axes
+from scipy.spatial import cKDTree
 
 from ..area import Area
+from .columnar import read_table, table_exists, write_table
+from .ragged import RaggedTimetable
+from .timetable import pack_routes, parse_datetimes
+
+# Binary bundle of a line (see `LineData.save_data`), and the justified csv files it can also be saved as
+BUNDLE_FILE = "{line_name}_data.npz"
+CSV_TABLES = ["planned", "real", "full", "stops", "journeys", "routes"]
+
+# The RaggedTimetable arrays saved in the bundle (as "timetable.<name>")
+RAGGED_ARRAYS = ["journey_ids", "stop_names", "stop_numbers", "offsets", "stop_index", "event", "planned", "real", "row_stop", "row_event"]
+
+# Number of points per query of the stops KD-tree (bounds the memory of `get_nearest_stops`)
+NEAREST_CHUNK_SIZE = 1 << 16
+
+# Index of the saved lines of a folder (see `LinesCatalog`)
+LINES_INDEX = "lines_index"
+LINES_INDEX_DTYPES = {"LINE_ID": "str", "LINE_NAME": "str", "MODE": "str", "FOLDER": "str", "FILE": "str", "SIZE": "Int64", "MTIME": "float64",
+                      "N_STOPS": "Int64", "X_MIN": "float64", "X_MAX": "float64", "Y_MIN": "float64", "Y_MAX": "float64"}
+
+def get_line_path(parent_path, line_id):
+    line_ref = re.sub(r'[^\w\d-]','_',line_id)
+    return os.path.join(parent_path, line_ref)
+
+def column_arrays(values, key):
+    # Arrays saved for a column (or an index) : numbers, booleans and datetimes as they are, other values as strings
+    # with a mask of the missing values. Object columns of booleans (without missing values) are saved as booleans.
+    if values.dtype.kind in "biufM":
+        return {key: np.asarray(values)}
+    missing = np.asarray(pd.isna(values))
+    if not missing.any() and pd.api.types.infer_dtype(values) == "boolean":
+        return {key: np.asarray(values, dtype=bool)}
+    text = np.asarray(values, dtype=object).astype(str)
+    text[missing] = ""
+    return {key: text, key + ".missing": missing} if missing.any() else {key: text}
+
+def read_column(bundle, key):
+    values = bundle[key]
+    if values.dtype.kind == "U":
+        values = values.astype(object)
+        if key + ".missing" in bundle.files:
+            values[bundle[key + ".missing"]] = np.nan
+    return values
+
+def frame_arrays(df: pd.DataFrame, name):
+    # Arrays saved for a DataFrame with a single index. The columns are saved by position, as their names can be
+    # anything (e.g. stop names).
+    arrays = {f"{name}.columns": np.asarray(df.columns, dtype=str), f"{name}.index_name": np.array([df.index.name or ""])}
+    arrays.update(column_arrays(df.index, f"{name}.index"))
+    for i in range(df.shape[1]):
+        arrays.update(column_arrays(df.iloc[:, i], f"{name}.{i}"))
+    return arrays
+
+def read_frame(bundle, name):
+    columns = bundle[f"{name}.columns"]
+    index = pd.Index(read_column(bundle, f"{name}.index"), name=str(bundle[f"{name}.index_name"][0]) or None)
+    df = pd.DataFrame({i: read_column(bundle, f"{name}.{i}") for i in range(len(columns))}, index=index)
+    df.columns = pd.Index(columns, dtype=object)
+    return df
+
+def read_line_info(bundle):
+    # Id, name and mode of the line saved in a bundle
+    return {key: str(bundle[f"line.{key}"][0]) or None for key in ["id", "name", "mode"]}
+
+def ragged_arrays(ragged: RaggedTimetable):
+    arrays = {f"timetable.{array}": np.asarray(getattr(ragged, array)) for array in RAGGED_ARRAYS}
+    arrays["timetable.journey_ids"] = np.asarray(ragged.journey_ids, dtype=str)
+    arrays["timetable.stop_names"] = np.asarray(ragged.stop_names, dtype=str)
+    arrays["timetable.service_day"] = np.array([ragged.service_day], dtype="M8[D]")
+    return arrays
+
+def read_ragged(bundle):
+    arrays = {array: bundle[f"timetable.{array}"] for array in RAGGED_ARRAYS}
+    arrays["journey_ids"] = arrays["journey_ids"].astype(object)
+    return RaggedTimetable(service_day=pd.Timestamp(bundle["timetable.service_day"][0]).date(), **arrays)
+
+def filtered_lines(parent_path):
+    # {line folder: (LINE_ID, MEAN_OF_TRANSPORT)} of the lines in the `lines` tables of the filtered data saved in
+    # `parent_path` (in <parent_path>/<filtered folder>/<name>/lines)
+    lines = {}
+    for folder in os.scandir(parent_path):
+        if not folder.is_dir():
+            continue
+        for subfolder in os.scandir(folder.path):
+            if subfolder.is_dir() and table_exists(os.path.join(subfolder.path, "lines")):
+                df = read_table(os.path.join(subfolder.path, "lines"))
+                modes = df["MEAN_OF_TRANSPORT"] if "MEAN_OF_TRANSPORT" in df else pd.Series(None, index=df.index)
+                for line_id, mode in zip(df["LINE_ID"].astype(str), modes):
+                    lines[os.path.basename(get_line_path(parent_path, line_id))] = (line_id, mode if isinstance(mode, str) else None)
+    return lines
 
 class LineData:
-    def __init__(self, id, name, parent_path, timetable=None, stops=None, routes = None, journeys=None, **kwargs):
+    def __init__(self, id, name, parent_path, timetable=None, stops=None, routes = None, journeys=None, mode = None, **kwargs):
         self.line_id = id
         self.line_name = name
+        self.mode = mode
 
-        line_ref = re.sub(r'[^\w\d-]','_',id)
-        self.path = os.path.join(parent_path, line_ref)        
+        self.path = get_line_path(parent_path, id)
         os.makedirs(self.path, exist_ok=True)
 
+        # The timetable is kept as a DataFrame and/or as a RaggedTimetable (see `compact`). When the line is loaded from
+        # its files, only the stops are read : the other tables are read when they are first accessed.
+        self._timetable = None
+        self._ragged = None
+        self._routes = None
+        self._journeys = None
+        self._pending = set()
+        self._compact = False
+        self._stop_tree = None
         if timetable is not None and stops is not None and journeys is not None:
             self.timetable = timetable
             self.stops = stops
             self.routes = routes
             self.journeys = journeys
         else:
-            self.timetable, self.stops, self.journeys = self.load_data()
+            self.stops = self.load_table("stops")
+            self._pending = {"timetable", "routes", "journeys"}
+            if mode is None and os.path.isfile(self.bundle_path()):
+                with np.load(self.bundle_path()) as bundle:
+                    self.mode = read_line_info(bundle)["mode"]
+
+    def load_pending(self, name):
+        # Read a table of the saved line if it has not been accessed yet
+        if name in self._pending:
+            self._pending.discard(name)
+            setattr(self, name, self.load_table(name))
+
+    @property
+    def timetable(self) -> pd.DataFrame:
+        # DataFrame version of the timetable, built from the ragged one if needed. It is then kept, unless the line was
+        # compacted (see `compact`) : it is built again at each access instead.
+        self.load_pending("timetable")
+        if self._timetable is None and self._ragged is not None:
+            if self._compact:
+                return self._ragged.to_frame()
+            self._timetable = self._ragged.to_frame()
+        return self._timetable
+
+    @timetable.setter
+    def timetable(self, timetable):
+        self._pending.discard("timetable")
+        self._compact = False
+        if isinstance(timetable, RaggedTimetable):
+            self._timetable, self._ragged = None, timetable
+        else:
+            self._timetable, self._ragged = timetable, None
+
+    @property
+    def routes(self) -> pd.DataFrame:
+        self.load_pending("routes")
+        return self._routes
+
+    @routes.setter
+    def routes(self, routes):
+        self._pending.discard("routes")
+        self._routes = routes
+
+    @property
+    def journeys(self) -> pd.DataFrame:
+        self.load_pending("journeys")
+        return self._journeys
+
+    @journeys.setter
+    def journeys(self, journeys):
+        self._pending.discard("journeys")
+        self._journeys = journeys
+
+    @property
+    def ragged(self) -> RaggedTimetable:
+        self.load_pending("timetable")
+        if self._ragged is None and self._timetable is not None:
+            self._ragged = RaggedTimetable.from_frame(self._timetable)
+        return self._ragged
+
+    def compact(self):
+        # Only keep the ragged version of the timetable in memory (the DataFrame is rebuilt, and not kept, when accessed)
+        self.ragged
+        self._timetable = None
+        self._compact = True
+        return self
 
     def path_join (self, *args):
         return os.path.join(self.path, *args)
     
-    def save_data (self):
+    def bundle_path(self):
+        return self.path_join(BUNDLE_FILE.format(line_name=self.line_name))
+
+    def save_data (self, csv = False):
+        # Save the line as a binary bundle (typed arrays, read back without parsing), and also as justified csv files
+        # with `csv`. Existing csv files are left as they are otherwise (the bundle is read first, see `load_table`).
+        # A line whose journeys were all dropped is saved too, with empty timetable arrays.
+        arrays = ragged_arrays(self.ragged)
+        arrays.update({f"line.{key}": np.array([value or ""], dtype=str) for key, value in [("id", self.line_id), ("name", self.line_name), ("mode", self.mode)]})
+        for name in ["stops", "routes", "journeys"]:
+            arrays.update(frame_arrays(getattr(self, name), name))
+        with open(self.bundle_path() + ".part", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(self.bundle_path() + ".part", self.bundle_path())
+
+        if csv:
+            self.save_csv()
+
+    def save_csv (self):
         # Separate between "planned" (to the minute) and "real" (to the sec) data
         mask = self.timetable.index.get_level_values("EVENT").str[-4:] == "REAL"
         planned = self.timetable.loc[~mask]
@@ -58,25 +240,81 @@ class LineData:
                 .apply(lambda x: x.str.rjust(max_len[x.name]), axis=0)
                 .to_csv(self.path_join(f"{self.line_name}_{name}.csv"), sep=";", index=False, header = df_for_export.columns.map(lambda x: x.center(max_len[x]))))
             
+    def read_csv(self, name):
+        # Read back a justified csv written by `save_csv` (all values as strings, empty cells as NaN)
+        df = pd.read_csv(self.path_join(f"{self.line_name}_{name}.csv"), sep=";", dtype=str, keep_default_na=False)
+        df.columns = df.columns.str.strip()
+        return df.apply(lambda x: x.str.strip()).replace("", np.nan)
+
+    def load_table(self, name):
+        # Read one table ("timetable", "stops", "routes" or "journeys") of the saved line : from the bundle if there is
+        # one (the timetable is then a RaggedTimetable), otherwise from the csv files
+        if os.path.isfile(self.bundle_path()):
+            with np.load(self.bundle_path()) as bundle:
+                return read_ragged(bundle) if name == "timetable" else read_frame(bundle, name)
+
+        assert os.path.isfile(self.path_join(f"{self.line_name}_{'full' if name == 'timetable' else name}.csv")), f"Line {self.line_name} has no saved {name}"
+        if name == "stops":
+            stops = self.read_csv("stops").set_index("STOP_NAME")
+            stops = stops.astype({"STOP_NUMBER": "int64", "POSITION_X": "float64", "POSITION_Y": "float64", "DISTANCE": "float64"})
+            route_columns = stops.columns[stops.columns.str[:5] == "Route"]
+            stops[route_columns] = stops[route_columns] == "Yes"
+            return stops
+
+        if name == "routes":
+            routes = self.read_csv("routes").set_index("index").rename_axis(None)
+            routes["Count"] = routes["Count"].astype("int64")
+            stop_columns = routes.columns.drop(["Count", "Direction"], errors="ignore")
+            routes[stop_columns] = routes[stop_columns] == "Yes"
+            return routes
+
+        if name == "timetable":
+            timetable = self.read_csv("full").astype({"STOP_NUMBER": "int64"}).set_index(["STOP_NAME", "STOP_NUMBER", "EVENT"])
+            times = parse_datetimes(timetable.to_numpy(dtype=object).ravel()).reshape(timetable.shape)
+            return pd.DataFrame(times, index=timetable.index, columns=timetable.columns.rename("JOURNEY_ID"))
+
+        if name == "journeys":
+            journeys = self.read_csv("journeys").set_index("JOURNEY_ID").astype({"Number_of_stops": "int64"})
+            for column in journeys.columns[journeys.columns.str.contains("_time_")]:
+                journeys[column] = parse_datetimes(journeys[column])
+            return journeys
+
+        raise ValueError(f"Unknown table '{name}'")
+
     def load_data(self):
-        # Check files exist:
-        assert os.path.isfile(self.path_join(f"{self.line_name}_stops.csv"))
-        assert os.path.isfile(self.path_join(f"{self.line_name}_full.csv"))
-        assert os.path.isfile(self.path_join(f"{self.line_name}_journeys.csv"))
-
-        # Load the data
-        self.stops = pd.read_csv(self.path_join(f"{self.line_name}_stops.csv"), sep="[ \t]*;[ \t]*", engine="python")
-        self.routes = pd.read_csv(self.path_join(f"{self.line_name}_routes.csv"), sep="[ \t]*;[ \t]*", engine="python")
-        self.timetable = pd.read_csv(self.path_join(f"{self.line_name}_full.csv"), sep="[ \t]*;[ \t]*", engine="python")
-        self.journeys = pd.read_csv(self.path_join(f"{self.line_name}_journeys.csv"), sep="[ \t]*;[ \t]*", engine="python")
-
-    def get_nearest_stops(self, x, y):
-        x, y = x.reshape((-1, 1)), y.reshape((-1, 1))
-        stops_x, stops_y = self.stops[["POSITION_X", "POSITION_Y"]].values.T
-        stops_x, stops_y = stops_x.reshape((1, -1)), stops_y.reshape((1, -1))
-        i = np.argmin(((x-stops_x)**2 + (y-stops_y)**2)**0.5, axis=1)
-        return stops_x[0, i], stops_y[0, i]
+        # Read all the tables of the saved line
+        return tuple(self.load_table(name) for name in ["timetable", "stops", "routes", "journeys"])
+
+    def get_stop_tree(self):
+        # KD-tree of the stop positions, built once (and again if `stops` is replaced)
+        if self._stop_tree is None or self._stop_tree[0] is not self.stops:
+            positions = self.stops[["POSITION_X", "POSITION_Y"]].to_numpy(dtype=np.float64)
+            self._stop_tree = self.stops, cKDTree(positions), positions
+        return self._stop_tree[1:]
+
+    def get_nearest_stops(self, x, y, return_index = False, chunk_size = NEAREST_CHUNK_SIZE):
+        # Position of the nearest stop of each point, and with `return_index` also its row in `self.stops` and its
+        # distance. The points are queried by chunks of `chunk_size`.
+        tree, positions = self.get_stop_tree()
+        x, y = np.asarray(x, dtype=np.float64).ravel(), np.asarray(y, dtype=np.float64).ravel()
+        i = np.empty(len(x), dtype=np.intp)
+        distance = np.empty(len(x))
+        for start in range(0, len(x), chunk_size):
+            end = min(start + chunk_size, len(x))
+            distance[start:end], i[start:end] = tree.query(np.column_stack((x[start:end], y[start:end])))
+        if return_index:
+            return positions[i, 0], positions[i, 1], i, distance
+        return positions[i, 0], positions[i, 1]
     
+    def get_route_signatures(self, stop_numbers = None):
+        # Bitset signature of each route (rows in the order of `self.routes`) over `stop_numbers` (by default the stops
+        # of the line, in their order). With the same `stop_numbers`, the routes of different lines or dates can be
+        # compared with `count_stops`.
+        mask = self.stops.set_index("STOP_NUMBER")[self.routes.index].astype(bool)
+        if stop_numbers is not None:
+            mask = mask.groupby(level=0).any().reindex(stop_numbers, fill_value=False)
+        return pack_routes(mask)
+
     def get_min_max_coords(self):
         x_min, y_min = self.stops[['POSITION_X', 'POSITION_Y']].min()
         x_max, y_max = self.stops[['POSITION_X', 'POSITION_Y']].max()
@@ -122,7 +360,7 @@ class LinesData(dict):
         name = str(line.line_name)
         if name in self.name_to_id:
             if type(self.name_to_id[name]) is set:
-                self.name_to_id[name].append(id)
+                self.name_to_id[name].add(id)
             elif type(self.name_to_id[name]) is str:
                 if id != self.name_to_id[name] :
                     self.name_to_id[name] = {self.name_to_id[name], id}
@@ -195,5 +433,166 @@ Registered keys to access lines : {', '.join(map("'{}'".format, self.key_to_id))
             if same_color:
                 kwargs["c"] = ax.get_lines()[-1].get_c()
                 label = ""
-    
-        
\ No newline at end of file
+
+
+class LinesCatalog:
+    # Lines saved in a folder (e.g. transport_data/<date>), described by a small persisted index (id, name, mode, folder,
+    # number of stops and bounding box of each line). The lines are only loaded when accessed (as with `LinesData`, by
+    # key, id or name), and at most `max_resident` of them are kept in memory (the least recently used are dropped).
+    # `query` selects lines by bounding box and mode without loading them.
+    def __init__(self, parent_path, max_resident = 64, refresh = True):
+        self.parent_path = parent_path
+        self.max_resident = max_resident
+        self.resident = OrderedDict()
+
+        index_path = os.path.join(parent_path, LINES_INDEX)
+        if table_exists(index_path):
+            self.index = read_table(index_path, LINES_INDEX_DTYPES).set_index("LINE_ID", drop=False)
+        else:
+            self.index = pd.DataFrame({column: pd.Series(dtype="object" if dtype == "str" else dtype) for column, dtype in LINES_INDEX_DTYPES.items()}).set_index("LINE_ID", drop=False)
+            refresh = True
+        if refresh:
+            self.refresh()
+        self.name_to_ids = self.index.groupby("LINE_NAME", sort=False).LINE_ID.agg(list).to_dict()
+
+    def index_line(self, folder, csv_lines = None):
+        # Index row of the line saved in a sub-folder, from its bundle or else from its stops csv file (None if there is
+        # no line in it). The csv files do not tell the line id and mode : they are taken from `csv_lines` (see
+        # `filtered_lines`), or the id is the folder name.
+        files = os.listdir(os.path.join(self.parent_path, folder))
+        bundles = [file for file in files if file.endswith(BUNDLE_FILE.format(line_name=""))]
+        if len(bundles) == 1:
+            path = os.path.join(self.parent_path, folder, bundles[0])
+            with np.load(path) as bundle:
+                if "line.id" not in bundle.files:
+                    return None
+                info = read_line_info(bundle)
+                x, y = (bundle[f"stops.{list(bundle['stops.columns']).index(column)}"] for column in ["POSITION_X", "POSITION_Y"])
+            file = bundles[0]
+        else:
+            stops = [file for file in files if file.endswith("_stops.csv")]
+            if len(stops) != 1:
+                return None
+            file = stops[0]
+            path = os.path.join(self.parent_path, folder, file)
+            df = pd.read_csv(path, sep=";", skipinitialspace=True)
+            df.columns = df.columns.str.strip()
+            if not {"POSITION_X", "POSITION_Y"} <= set(df.columns):
+                return None
+            x, y = df["POSITION_X"].to_numpy(dtype=np.float64), df["POSITION_Y"].to_numpy(dtype=np.float64)
+            line_id, mode = (csv_lines or {}).get(folder, (folder, None))
+            info = {"id": line_id, "name": file[:-len("_stops.csv")], "mode": mode}
+        stat = os.stat(path)
+        return {"LINE_ID": info["id"], "LINE_NAME": info["name"], "MODE": info["mode"], "FOLDER": folder, "FILE": file, "SIZE": stat.st_size, "MTIME": stat.st_mtime,
+                "N_STOPS": len(x), "X_MIN": np.min(x, initial=np.inf), "X_MAX": np.max(x, initial=-np.inf), "Y_MIN": np.min(y, initial=np.inf), "Y_MAX": np.max(y, initial=-np.inf)}
+
+    def refresh(self):
+        # Update the index with the lines saved, changed or removed since it was written. The unchanged lines (same
+        # bundle, or stops csv file, size and modification time) are not read again.
+        known = self.index.set_index("FOLDER", drop=False)
+        rows = []
+        changed = False
+        csv_lines = None
+        for entry in os.scandir(self.parent_path):
+            if not entry.is_dir():
+                continue
+            if entry.name in known.index:
+                row = known.loc[entry.name]
+                path = os.path.join(self.parent_path, entry.name, row.FILE)
+                if os.path.isfile(path) and os.stat(path).st_size == row.SIZE and os.stat(path).st_mtime == row.MTIME:
+                    rows.append(row.to_dict())
+                    continue
+            if csv_lines is None:
+                csv_lines = filtered_lines(self.parent_path)
+            row = self.index_line(entry.name, csv_lines)
+            changed |= row is not None or entry.name in known.index
+            if row is not None:
+                rows.append(row)
+        changed |= len(rows) != len(known)
+
+        if rows:
+            self.index = pd.DataFrame(rows, columns=list(LINES_INDEX_DTYPES)).astype({column: dtype for column, dtype in LINES_INDEX_DTYPES.items() if dtype != "str"})
+            self.index = self.index.sort_values("LINE_ID").set_index("LINE_ID", drop=False)
+        else:
+            self.index = self.index.iloc[:0]
+        if changed or not table_exists(os.path.join(self.parent_path, LINES_INDEX)):
+            write_table(self.index, os.path.join(self.parent_path, LINES_INDEX), LINES_INDEX_DTYPES)
+        for line_id in set(self.resident) - set(self.index.index):
+            del self.resident[line_id]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index.index)
+
+    def __contains__(self, line_id):
+        return line_id in self.index.index
+
+    def keys(self):
+        return list(self.index.index)
+
+    def values(self):
+        return (self.get_line(line_id) for line_id in self.index.index)
+
+    def items(self):
+        return ((line_id, self.get_line(line_id)) for line_id in self.index.index)
+
+    def get_line(self, line_id):
+        # Load a line (or take it from the resident lines)
+        if line_id in self.resident:
+            self.resident.move_to_end(line_id)
+            return self.resident[line_id]
+        row = self.index.loc[line_id]
+        line = LineData(row.LINE_ID, row.LINE_NAME, self.parent_path, mode=row.MODE)
+        self.resident[line_id] = line
+        while len(self.resident) > self.max_resident:
+            self.resident.popitem(last=False)
+        return line
+
+    def __getitem__(self, key):
+        key = str(key)
+        # Try if key is a line id, then a line name
+        if key in self.index.index:
+            return self.get_line(key)
+        if key in self.name_to_ids:
+            ids = self.name_to_ids[key]
+            if len(ids) > 1:
+                # Multiple lines with the same name
+                print("Warning ! Multiple lines with this name. Returning a LinesData object")
+                return self.select(ids)
+            return self.get_line(ids[0])
+        e = KeyError(key)
+        e.add_note(f"Key {key} has not been found in the lines of {self.parent_path}. Valid values are line ids and line names "
+                   f"(e.g. {', '.join(self.index.LINE_ID.head(5))} or {', '.join(self.index.LINE_NAME.head(5))}).")
+        raise e
+
+    def query(self, area: Area | tuple = None, modes = None):
+        # Index rows of the lines whose bounding box intersects `area` (an Area, or (x_min, x_max, y_min, y_max)), and
+        # whose mode is in `modes`
+        mask = np.ones(len(self.index), dtype=bool)
+        if area is not None:
+            x_min, x_max, y_min, y_max = (area.x_min, area.x_max, area.y_min, area.y_max) if isinstance(area, Area) else area
+            mask &= ((self.index.X_MAX >= x_min) & (self.index.X_MIN <= x_max) & (self.index.Y_MAX >= y_min) & (self.index.Y_MIN <= y_max)).to_numpy()
+        if modes is not None:
+            if type(modes) is not tuple:
+                modes = (modes, ) # Make it a tuple (avoid strings)
+            mask &= self.index.MODE.str.lower().isin([m.lower() for m in modes]).to_numpy()
+        return self.index.loc[mask]
+
+    def select(self, line_ids):
+        # LinesData of some lines
+        return LinesData(*(self.get_line(line_id) for line_id in line_ids))
+
+    def get_lines(self, area: Area | tuple = None, modes = None):
+        # LinesData of the lines selected by `query`
+        return self.select(self.query(area, modes).index)
+
+    def get_area(self, margin = 500):
+        return Area(self.index.X_MIN.min() - margin, self.index.X_MAX.max() + margin, self.index.Y_MIN.min() - margin, self.index.Y_MAX.max() + margin)
+
+    def __repr__(self):
+        return f"""
+LinesCatalog of {self.parent_path}, with {len(self)} line{'' if len(self)==1 else 's'} indexed ({len(self.resident)} loaded)
+Modes : {', '.join(self.index.MODE.dropna().drop_duplicates())}
+        """
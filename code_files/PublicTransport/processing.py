@@ -1,6 +1,7 @@
 import datetime
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
@@ -8,16 +9,78 @@ from scipy.interpolate import interp1d
 
 from ..download import DownloadManager
 from ..area import Area
-from .linedata import LineData, LinesData
+from .linedata import BUNDLE_FILE, CSV_TABLES, LineData, LinesCatalog, LinesData, get_line_path
+from .fingerprint import frame_digest, matches_fingerprint, write_fingerprint
+from .timetable import classify_routes, correct_real_times, count_stops, format_seconds, journey_bounds, journey_directions, nullable_seconds, pack_routes, pivot_timetable, service_seconds, stop_orders, times_array, to_frame
+from .columnar import COLUMNAR_FOLDER, COLUMNAR_FILE, TableWriter, ingest_timetable, iter_parquet, read_table, table_exists, write_table
 
 TRANSPORT_FOLDER = "transport_data"
 FILTERED_SUBFOLDER = "0_filtered_data"
 TIMETABLE_FILE = "Timetable_{date}.csv"
 STOPS_FILE = "Stops_{date}.csv"
 
+# Columns kept from the raw timetable, and their new names
+TIMETABLE_COLUMNS = {
+    "LINIEN_ID" : "LINE_ID",
+    "LINIEN_TEXT" : "LINE_NAME",
+    "BETREIBER_ABK" : "TRANSPORTER",
+    "PRODUKT_ID" : "MEAN_OF_TRANSPORT",
+    "FAHRT_BEZEICHNER" : "JOURNEY_ID",
+    "BPUIC" : "STOP_NUMBER",
+    "FAELLT_AUS_TF" : "CANCELLED",
+    "ANKUNFTSZEIT" : "ARRIVAL",
+    "AN_PROGNOSE" : "ARRIVAL_REAL",
+    "AN_PROGNOSE_STATUS" : "ARRIVAL_REAL_STATUS",
+    "ABFAHRTSZEIT" : "DEPARTURE",
+    "AB_PROGNOSE" : "DEPARTURE_REAL",
+    "AB_PROGNOSE_STATUS" : "DEPARTURE_REAL_STATUS"
+}
+# Columns that are not read as strings
+TIMETABLE_DTYPES = {"BPUIC": "Int64", "FAELLT_AUS_TF": "boolean"}
+# Time columns, stored in the filtered timetable as seconds since the start of the service day
+TIME_COLUMNS = ["ARRIVAL", "ARRIVAL_REAL", "DEPARTURE", "DEPARTURE_REAL"]
+# Types of the filtered tables when saved, and when read back
+FILTERED_DTYPES = {
+    "timetable": {new: "Int32" if new in TIME_COLUMNS else TIMETABLE_DTYPES.get(raw, "str") for raw, new in TIMETABLE_COLUMNS.items()},
+    "stops": {"number": "Int64", "designationOfficial": "str", "lv95East": "float64", "lv95North": "float64"},
+    "lines": {"LINE_ID": "str", "LINE_NAME": "str", "TRANSPORTER": "str", "MEAN_OF_TRANSPORT": "str"}
+}
+FILTERED_READ_DTYPES = {
+    "timetable": {"STOP_NUMBER": "int64", "CANCELLED": "bool", **{column: "Int32" for column in TIME_COLUMNS}},
+    "stops": {"number": "int64"},
+    "lines": {}
+}
+# Parameters of a line fingerprint that `TransportData.get_status` cannot know
+LINE_UNKNOWN_PARAMS = ("rows", "stops", "correct_times", "threshold")
+# Layouts of the times in the csv export of the filtered timetable (as in the raw data)
+CSV_TIME_FORMATS = {column: "%d.%m.%Y %H:%M:%S" if column.endswith("_REAL") else "%d.%m.%Y %H:%M" for column in TIME_COLUMNS}
+
+# Columns kept in the columnar store
+COLUMNAR_COLUMNS = list(TIMETABLE_COLUMNS) + ["BETREIBER_NAME", "VERKEHRSMITTEL_TEXT"]
+STOPS_COLUMNS = ['number', 'designationOfficial', 'lv95East', 'lv95North', 'validFrom', 'validTo', 'stopPoint']
+
+# Memory allowed for each chunk of the raw timetable, and estimated size of one parsed cell
+MEMORY_BUDGET = 512 * 2**20
+TIMETABLE_CELL_BYTES = 80
+
+# Versions of the filtering and timetable generation : changing them invalidates the previous outputs
+FILTER_VERSION = 2
+TIMETABLE_VERSION = 3
+
 DIDOK_URL =  "https://opentransportdata.swiss/fr/dataset/service-points-full/permalink"
 TIMETABLE_URL = "https://opentransportdata.swiss/fr/dataset/istdaten/resource_permalink/{date}_istdaten.csv"
 
+def format_times(timetable: pd.DataFrame, service_day):
+    # Filtered timetable with its times as timestamps, for the csv export
+    return timetable.assign(**{column: format_seconds(timetable[column], service_day, CSV_TIME_FORMATS[column]) for column in TIME_COLUMNS})
+
+def read_timetable(path, service_day):
+    # Filtered timetable with its times as seconds since the start of the service day (parsed back from the
+    # timestamps when read from the csv export)
+    df = read_table(path, {column: dtype for column, dtype in FILTERED_READ_DTYPES["timetable"].items() if column not in TIME_COLUMNS})
+    return df.assign(**{column: df[column] if str(df[column].dtype) == "Int32" else nullable_seconds(service_seconds(df[column], service_day))
+                        for column in TIME_COLUMNS})
+
 class TooFastError(Exception):
     def __init__(self, transport_data, needed_status):
         super().__init__("You're going too fast ! Try running previous steps first, or use `solve_too_fast = True` argument")
@@ -56,6 +119,7 @@ class TransportData:
 
         self.transport_folder: str = kwargs.get("folder", TRANSPORT_FOLDER)
         self.filtered_folder: str = kwargs.get("filtered_folder", FILTERED_SUBFOLDER)
+        self.columnar_folder: str = kwargs.get("columnar_folder", COLUMNAR_FOLDER)
         self.path = os.path.join(self.transport_folder, self.date.strftime("%Y_%m_%d"))
 
         # Create folder
@@ -68,21 +132,27 @@ class TransportData:
         return os.path.join(self.path, *args)
 
     def get_status(self):
-        # Status unknows, determine status based on files
-        # Try at status = 3
-        # TODO
-
-        # Try at status = 2
-        filename = self.path_join(self.filtered_folder, self.name, "{df}.csv")
-        if os.path.isfile(filename.format(df="lines")) and \
-           os.path.isfile(filename.format(df="stops")) and \
-           os.path.isfile(filename.format(df="timetable")):
+        # Status unknows, determine status based on files (and on the fingerprints of the filtered and line data)
+        if table_exists(self.get_filtered_path("lines")) and \
+           table_exists(self.get_filtered_path("stops")) and \
+           table_exists(self.get_filtered_path("timetable")) and \
+           self.is_filtered_up_to_date():
+
+            # Try at status = 3 : every line built for this version, day, name and mode (the digests of its rows are
+            # not checked, as they need the whole filtered timetable)
+            lines_df = read_table(self.get_filtered_path("lines"))
+            if all(matches_fingerprint(get_line_path(self.path, line_id), line_params(line_id, line_name, mode, self.date), unknown=LINE_UNKNOWN_PARAMS)
+                   for line_id, line_name, mode in zip(lines_df.LINE_ID, lines_df.LINE_NAME, lines_df.MEAN_OF_TRANSPORT)):
+                self.status = 3
+                return 3
+
+            # Status = 2
             self.status = 2
             return 2
 
         # Try at status = 1
-        if self.dl.is_file_downloaded(TIMETABLE_FILE.format(date=self.date)) and \
-            self.dl.is_file_downloaded(STOPS_FILE.format(date=self.date)):
+        if (self.is_ingested() or self.dl.is_file_downloaded(TIMETABLE_FILE.format(date=self.date))) and \
+            self.dl.is_file_downloaded(STOPS_FILE.format(date=self.date), zip=True):
 
             self.status = 1
             return 1
@@ -90,7 +160,30 @@ class TransportData:
         self.status = 0
         return 0
 
-    def download_data(self, date_strict = True, stops_url = DIDOK_URL, timetable_url = TIMETABLE_URL, return_data = True):
+    def source_fingerprint(self):
+        # Signature of the downloaded files (size, and ETag/Last-Modified or modification time), None if not available
+        signature = []
+        for path in [self.dl.get_path(TIMETABLE_FILE.format(date=self.date)), self.dl.get_zip_path(STOPS_FILE.format(date=self.date))]:
+            entry = self.dl.cache.entries.get(os.path.normpath(path))
+            if entry is None or not os.path.isfile(path):
+                return None
+            signature.append((entry["size"], entry.get("etag") or entry.get("last_modified") or entry["mtime"]))
+        return signature
+
+    def filter_params(self):
+        # Everything the filtered data depends on
+        return {
+            "version": FILTER_VERSION,
+            "date": self.date,
+            "source": self.source_fingerprint(),
+            "area": (self.area.x_min, self.area.x_max, self.area.y_min, self.area.y_max) if self.by_area else None,
+            "line_id": None if self.by_area else self.line_id
+        }
+
+    def is_filtered_up_to_date(self):
+        return matches_fingerprint(self.path_join(self.filtered_folder, self.name), self.filter_params(), unknown=("source", ))
+
+    def download_data(self, date_strict = True, stops_url = DIDOK_URL, timetable_url = TIMETABLE_URL, return_data = True, ingest = False):
         if not date_strict:
             date = self.dl.get_latest_date(timetable_url, self.date)
             if date != self.date:
@@ -101,13 +194,18 @@ class TransportData:
         else:
             date = self.date
 
-        # Download
-        stops_file = self.dl.download_with_cache(stops_url, STOPS_FILE.format(date=date), zip=True)
-        timetable_file = self.dl.download_with_cache(timetable_url.format(date=date), TIMETABLE_FILE.format(date=date))
+        # Download (the stops are kept zipped : `stops_file` is the archive, read with `open_stops`)
+        stops_file, timetable_file = self.dl.download_many([
+            dict(url=stops_url, name=STOPS_FILE.format(date=date), zip=True, extract=False),
+            dict(url=timetable_url.format(date=date), name=TIMETABLE_FILE.format(date=date))
+        ])
 
         # Save
         self.stops_file, self.timetable_file = stops_file, timetable_file
 
+        if ingest:
+            self.ingest_timetable()
+
         # Update status
         self.get_status()
 
@@ -122,7 +220,7 @@ class TransportData:
             stops_file, timetable_file = self.stops_file, self.timetable_file
         elif self.get_status() >= 1:
             # File had been downloaded previously
-            stops_file = self.dl.get_path(STOPS_FILE.format(date=self.date))
+            stops_file = self.dl.get_zip_path(STOPS_FILE.format(date=self.date))
             timetable_file = self.dl.get_path(TIMETABLE_FILE.format(date=self.date))
         elif solve_too_fast:
             # Download the files
@@ -131,99 +229,210 @@ class TransportData:
             raise TooFastError(self, 1)
         
         return stops_file, timetable_file
+
+    def open_stops(self):
+        # File-like object over the stops csv, read from the zip archive if it has not been extracted
+        return self.dl.open_downloaded(STOPS_FILE.format(date=self.date), zip=True)
         
-    def search_lines(self, line_name, solve_too_fast= True):
-        stops_file, timetable_file = self.get_downloaded_filenames(solve_too_fast=solve_too_fast, date_strict = False)
-        timetable_df = pd.read_csv(timetable_file, delimiter= ";", low_memory=False)
+    def get_columnar_path(self):
+        return os.path.join(self.columnar_folder, COLUMNAR_FILE.format(date=self.date))
 
-        return timetable_df[timetable_df.LINIEN_TEXT == line_name][["BETREIBER_ABK", "BETREIBER_NAME", "PRODUKT_ID", "LINIEN_ID", "LINIEN_TEXT", "VERKEHRSMITTEL_TEXT"]].drop_duplicates(subset = "LINIEN_ID")
+    def is_ingested(self):
+        return os.path.isfile(self.get_columnar_path())
 
-    def filter_data(self, line_id = None, solve_too_fast = False, return_data = True):
+    def ingest_timetable(self, memory_budget = None, solve_too_fast = False):
+        # One-time conversion of the raw timetable into a parquet file sorted by LINIEN_ID and BPUIC, with
+        # dictionary-encoded strings. `iter_timetable` then only reads the row groups and columns it needs.
+        if self.is_ingested():
+            return self.get_columnar_path()
         stops_file, timetable_file = self.get_downloaded_filenames(solve_too_fast=solve_too_fast)
 
-        # Get DataFrames
-        # --------------
-        stops_df = pd.read_csv(stops_file, delimiter= ";", low_memory=False)
-        timetable_df = pd.read_csv(timetable_file, delimiter= ";", low_memory=False)
+        # Keep the position of each row, to give the rows back in the order of the raw file
+        def chunks():
+            row = 0
+            for chunk in self.iter_timetable(COLUMNAR_COLUMNS, memory_budget, columnar=False):
+                yield chunk.assign(ROW=np.arange(row, row + len(chunk)))
+                row += len(chunk)
+
+        memory_budget = memory_budget or MEMORY_BUDGET
+        # Each bucket (and its sorted copy) must fit in the memory budget
+        n_buckets = 1 + 2 * os.path.getsize(timetable_file) // memory_budget
+        dtypes = {column: TIMETABLE_DTYPES.get(column, "str") for column in COLUMNAR_COLUMNS} | {"ROW": "Int64"}
+        os.makedirs(self.columnar_folder, exist_ok=True)
+        ingest_timetable(chunks(), self.get_columnar_path(), dtypes, sort_by=["LINIEN_ID", "BPUIC"], n_buckets=n_buckets)
+        return self.get_columnar_path()
+
+    def iter_timetable(self, columns, memory_budget = None, lines = None, columnar = None):
+        # Read the raw timetable by chunks of (about) `memory_budget` bytes, only parsing `columns`.
+        # If `lines` is given, only the rows of those lines are returned (in the order of the raw file).
+        # The columnar store is used if the day has been ingested (or if `columnar` is True, ingesting it first).
+        chunksize = max(1, (memory_budget or MEMORY_BUDGET) // (TIMETABLE_CELL_BYTES * len(columns)))
+        if columnar or (columnar is None and self.is_ingested()):
+            parquet_path = self.ingest_timetable(memory_budget)
+            if lines is None:
+                yield from iter_parquet(parquet_path, columns, chunksize)
+                return
+            # The rows of a few lines are small enough to be sorted back in memory
+            parts = list(iter_parquet(parquet_path, columns + ["ROW"], chunksize, filters={"LINIEN_ID": lines}))
+            if len(parts) == 0:
+                return
+            timetable = pd.concat(parts).sort_values("ROW")
+            for start in range(0, len(timetable), chunksize):
+                yield timetable.iloc[start:start + chunksize][columns]
+            return
+
+        stops_file, timetable_file = self.get_downloaded_filenames()
+        dtypes = {column: TIMETABLE_DTYPES.get(column, "str") for column in columns}
+        with pd.read_csv(timetable_file, delimiter= ";", usecols=columns, dtype=dtypes, chunksize=chunksize) as reader:
+            for chunk in reader:
+                if lines is not None:
+                    chunk = chunk.loc[chunk.LINIEN_ID.isin(lines)]
+                yield chunk[columns]
+
+    def search_lines(self, line_name, solve_too_fast= True, memory_budget = None):
+        self.get_downloaded_filenames(solve_too_fast=solve_too_fast, date_strict = False)
+        columns = ["BETREIBER_ABK", "BETREIBER_NAME", "PRODUKT_ID", "LINIEN_ID", "LINIEN_TEXT", "VERKEHRSMITTEL_TEXT"]
+
+        found = [chunk.loc[chunk.LINIEN_TEXT == line_name].drop_duplicates(subset = "LINIEN_ID") for chunk in self.iter_timetable(columns, memory_budget)]
+        found = [df for df in found if len(df) > 0]
+        if len(found) == 0:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(found).drop_duplicates(subset = "LINIEN_ID")
+
+    def filter_data(self, line_id = None, solve_too_fast = False, return_data = True, memory_budget = None, force = False, export_csv = False):
+        # The raw timetable is streamed by chunks (see `iter_timetable`), so that the memory needed does not depend on its size
+        if not self.by_area:
+            if (line_id := line_id or self.line_id):
+                self.line_id = line_id
+            else:
+                raise ValueError(f"line_id not defined ? ({line_id}, {self.line_id})")
+        if not force and self.get_status() >= 2:
+            # Already filtered with the same inputs
+            if return_data:
+                return self.get_filtered_data()
+            return
+        self.get_downloaded_filenames(solve_too_fast=solve_too_fast)
+
+        filtered = TransportData.filter_many_data([self], memory_budget=memory_budget, return_data=return_data, force=True, export_csv=export_csv)
+        if return_data:
+            return filtered[0]
+
+    @staticmethod
+    def filter_many_data(transport_datas, memory_budget = None, return_data = False, force = False, export_csv = False):
+        # Filter the data of several TransportData objects (areas or lines) of the same day, reading the raw data once :
+        # a pass over LINIEN_ID/BPUIC to find the lines of each area, and a pass over the rows of all those lines,
+        # each row being sent to the outputs of the objects it belongs to.
+        # Unless `force`, the objects already filtered with the same inputs are skipped.
+        # The filtered tables are saved as parquet files, and also as csv files with `export_csv`.
+        if not force:
+            transport_datas = [td for td in transport_datas if td.get_status() < 2]
+            if len(transport_datas) == 0:
+                return [] if return_data else None
+        reader: TransportData = transport_datas[0]
+        if any(td.date != reader.date for td in transport_datas):
+            raise ValueError("All the TransportData objects must be for the same date")
+
+        # Get stops DataFrame
+        # -------------------
+        with reader.open_stops() as f:
+            stops_df = pd.read_csv(f, delimiter= ";", usecols=STOPS_COLUMNS, low_memory=False)
 
 
         # Filter stops
         # ------------
 
         # Filter based on validity (keep stops valid at the date)
-        stops_df = stops_df.loc[(stops_df.validFrom <= str(self.date)) & (stops_df.validTo >= str(self.date))]
+        stops_df = stops_df.loc[(stops_df.validFrom <= str(reader.date)) & (stops_df.validTo >= str(reader.date))]
         # Filter based on the fact it is a stop (stopPoint = true)
         stops_df = stops_df.loc[stops_df.stopPoint]
         # Only keep interesting columns
         stops_df = stops_df[['number', 'designationOfficial', 'lv95East', 'lv95North']]
 
-        if self.by_area:
-            # Get stops numbers in rectangle
-            stops_numbers = stops_df[self.area.is_inside(stops_df['lv95East'], stops_df['lv95North'])]["number"]
+        # Get stops numbers in each rectangle
+        lines = {}
+        stops_numbers = {}
+        for i, td in enumerate(transport_datas):
+            if td.by_area:
+                stops_numbers[i] = stops_df[td.area.is_inside(stops_df['lv95East'], stops_df['lv95North'])]["number"]
+                lines[i] = set()
+            else:
+                lines[i] = {td.line_id}
 
 
         # Filter timetable_data
         # ---------------------
 
-            # Select the lines that passes through our stops
-            lines = timetable_df.LINIEN_ID[timetable_df.BPUIC.isin(stops_numbers)].unique()
-        else :
-            if (line_id := line_id or self.line_id):
-                self.line_id = line_id
-                lines = [line_id]
-            else:
-                raise ValueError(f"line_id not defined ? ({line_id}, {self.line_id})")
-                
-            
-        # Filter the timetable for only those lines
-        timetable_filtered = timetable_df[timetable_df.LINIEN_ID.isin(lines)]
-
-        # Select all the stops (including outside from the rectangle) from those lines :
-        stops_filtered = stops_df.loc[stops_df.number.isin(timetable_filtered.BPUIC.unique())]
-
-        # Only keep interesting columns from timetable_df and rename them
-        timetable_filtered = timetable_filtered[["LINIEN_ID", "LINIEN_TEXT", "BETREIBER_ABK", "PRODUKT_ID", "FAHRT_BEZEICHNER", "BPUIC", "FAELLT_AUS_TF", "ANKUNFTSZEIT", "AN_PROGNOSE", "AN_PROGNOSE_STATUS", "ABFAHRTSZEIT", "AB_PROGNOSE", "AB_PROGNOSE_STATUS"]].rename(columns={
-            "FAHRT_BEZEICHNER" : "JOURNEY_ID",
-            "BETREIBER_ABK" : "TRANSPORTER",
-            "PRODUKT_ID" : "MEAN_OF_TRANSPORT",
-            "LINIEN_ID" : "LINE_ID",
-            "LINIEN_TEXT" : "LINE_NAME",
-            "FAELLT_AUS_TF" : "CANCELLED",
-            "BPUIC" : "STOP_NUMBER",
-            "ANKUNFTSZEIT" : "ARRIVAL",
-            "AN_PROGNOSE" : "ARRIVAL_REAL",
-            "AN_PROGNOSE_STATUS" : "ARRIVAL_REAL_STATUS",
-            "ABFAHRTSZEIT" : "DEPARTURE",
-            "AB_PROGNOSE" : "DEPARTURE_REAL",
-            "AB_PROGNOSE_STATUS" : "DEPARTURE_REAL_STATUS"
-        })
-
-        # Offload data about lines
-        lines_df = timetable_filtered[["LINE_ID", "LINE_NAME", "TRANSPORTER", "MEAN_OF_TRANSPORT"]].drop_duplicates()
-
-        # Export the filtered stops, timetable and line dataframes
-        os.makedirs(self.path_join(self.filtered_folder, self.name), exist_ok=True)
-        filename = self.path_join(self.filtered_folder, self.name, "{df}.csv")
-
-        stops_filtered.to_csv(filename.format(df = "stops"), sep=";", index=False)
-        timetable_filtered.to_csv(filename.format(df = "timetable"), sep=";", index=False)
-        lines_df.to_csv(filename.format(df="lines"), sep=";", index=False)
-
-        # Update status
-        self.get_status()
+        # Select the lines that passes through the stops of each area (first pass, on two columns only)
+        if len(stops_numbers) > 0:
+            for chunk in reader.iter_timetable(["LINIEN_ID", "BPUIC"], memory_budget):
+                for i, numbers in stops_numbers.items():
+                    lines[i].update(chunk.LINIEN_ID[chunk.BPUIC.isin(numbers)].unique())
+        all_lines = set().union(*lines.values())
+
+        # Filter the timetable for only those lines, and write it chunk by chunk
+        writers = []
+        for td in transport_datas:
+            os.makedirs(td.path_join(td.filtered_folder, td.name), exist_ok=True)
+            writers.append(TableWriter(td.get_filtered_path("timetable"), FILTERED_DTYPES["timetable"], csv=export_csv,
+                                       csv_format=lambda df: format_times(df, reader.date)))
+        stop_numbers = [set() for _ in transport_datas]
+        lines_dfs = [[] for _ in transport_datas]
+        timetable_dfs = [[] for _ in transport_datas]
+        for chunk in reader.iter_timetable(list(TIMETABLE_COLUMNS), memory_budget, lines=all_lines):
+            # Only keep interesting columns from timetable_df and rename them
+            chunk = chunk.rename(columns=TIMETABLE_COLUMNS)
+            chunk = chunk.assign(**{column: nullable_seconds(service_seconds(chunk[column], reader.date)) for column in TIME_COLUMNS})
+            for i, writer in enumerate(writers):
+                timetable_filtered = chunk.loc[chunk.LINE_ID.isin(lines[i])]
+                if len(timetable_filtered) == 0:
+                    continue
+
+                writer.write(timetable_filtered)
+
+                stop_numbers[i].update(timetable_filtered.STOP_NUMBER.unique())
+                # Offload data about lines
+                lines_dfs[i].append(timetable_filtered[["LINE_ID", "LINE_NAME", "TRANSPORTER", "MEAN_OF_TRANSPORT"]].drop_duplicates())
+                if return_data:
+                    timetable_dfs[i].append(timetable_filtered)
+
+        filtered = []
+        for i, (td, writer) in enumerate(zip(transport_datas, writers)):
+            writer.close()
+            if len(lines_dfs[i]) == 0:
+                # No row at all for this object
+                lines_dfs[i].append(pd.DataFrame(columns=["LINE_ID", "LINE_NAME", "TRANSPORTER", "MEAN_OF_TRANSPORT"]))
+                timetable_dfs[i].append(pd.DataFrame(columns=list(TIMETABLE_COLUMNS.values())).astype({column: "Int32" for column in TIME_COLUMNS}))
+            lines_df = pd.concat(lines_dfs[i]).drop_duplicates()
+
+            # Select all the stops (including outside from the rectangle) from those lines :
+            stops_filtered = stops_df.loc[stops_df.number.isin(stop_numbers[i])]
+
+            # Export the filtered stops and line dataframes
+            write_table(stops_filtered, td.get_filtered_path("stops"), FILTERED_DTYPES["stops"], csv=export_csv)
+            write_table(lines_df, td.get_filtered_path("lines"), FILTERED_DTYPES["lines"], csv=export_csv)
+            write_fingerprint(td.path_join(td.filtered_folder, td.name), td.filter_params())
+
+            # Update status
+            td.get_status()
+
+            if return_data:
+                # Return copies (to reduce impact) of the dataframes
+                filtered.append((stops_filtered.copy(deep=True), pd.concat(timetable_dfs[i]), lines_df.copy(deep=True)))
 
         if return_data:
-            # Return copies (to reduce impact) of the dataframes
-            return stops_filtered.copy(deep=True), timetable_filtered.copy(deep=True), lines_df.copy(deep=True)
+            return filtered
+
+    def get_filtered_path(self, df):
+        # Path (without extension) of a filtered table : "stops", "timetable" or "lines"
+        return self.path_join(self.filtered_folder, self.name, df)
 
     def get_filtered_data(self, solve_too_fast = False):
         # Check that the data has already been filtered :
         if self.get_status() >= 2:
             # Data has been filtered previously : all good
-            filename = self.path_join(self.filtered_folder, self.name, "{df}.csv")
-            stops_df = pd.read_csv(filename.format(df = "stops"), sep = "[ \t]*;[ \t]*", engine="python")
-            timetable_df = pd.read_csv(filename.format(df = "timetable"), sep = "[ \t]*;[ \t]*", engine="python")
-            lines_df = pd.read_csv(filename.format(df = "lines"), sep = "[ \t]*;[ \t]*", engine="python")
+            stops_df = read_table(self.get_filtered_path("stops"), FILTERED_READ_DTYPES["stops"])
+            timetable_df = read_timetable(self.get_filtered_path("timetable"), self.date)
+            lines_df = read_table(self.get_filtered_path("lines"), FILTERED_READ_DTYPES["lines"])
         elif solve_too_fast:
             # Filter the data then get it
             stops_df, timetable_df, lines_df = self.filter_data(solve_too_fast=True, return_data=True)
@@ -239,8 +448,15 @@ class TransportData:
                        threshold = 5,
                        verbose= 1,
                        solve_too_fast = False,
-                       return_data = True):
-        lines_df = self.get_filtered_data(solve_too_fast=solve_too_fast)[2]
+                       return_data = True,
+                       force = False,
+                       workers = None,
+                       backend = "thread",
+                       export_csv = False):
+        # The filtered data is loaded once for all the lines, which are then built by `workers` threads or processes
+        # (`backend`, all the cores by default). The lines are saved as binary bundles, and also as csv files with
+        # `export_csv`.
+        stops_df, timetable_df, lines_df = self.get_filtered_data(solve_too_fast=solve_too_fast)
 
         # Filter lines according to modes argument
         if modes is not None:
@@ -278,225 +494,296 @@ class TransportData:
 
         # Run over each line and compute the timetable
         # --------------------------------------------
-        lines_data = LinesData()
+        # The rows (and stops) of each line are extracted once, and each line is built by a worker thread or process
+        line_rows = dict(tuple(timetable_df.loc[timetable_df.LINE_ID.isin(lines_ids)].groupby("LINE_ID", sort=False)))
+        tasks = []
         for line_id in lines_ids:
-            lines_data.add_line(self.generate_timetable(line_id, 
-                       correct_times = correct_times,
-                       threshold = threshold,
-                       verbose= verbose,
-                       solve_too_fast = solve_too_fast,
-                       return_data = True))
-            
+            rows = line_rows.get(line_id, timetable_df.iloc[:0])
+            tasks.append((self.path, line_id, stops_df.loc[stops_df.number.isin(rows.STOP_NUMBER)], rows, lines_df))
+        options = {"service_day": self.date, "correct_times": correct_times, "threshold": threshold, "verbose": verbose, "force": force, "export_csv": export_csv}
+
+        if backend not in ("thread", "process"):
+            raise ValueError(f"`backend` must be 'thread' or 'process', not '{backend}'")
+        workers = max(min(workers or os.cpu_count() or 1, len(tasks)), 1)
+        if workers == 1:
+            results = [run_task(build_timetable, *task, **options) for task in tasks]
+        else:
+            executor_class = ThreadPoolExecutor if backend == "thread" else ProcessPoolExecutor
+            with executor_class(workers) as executor:
+                futures = [executor.submit(build_timetable, *task, **options) for task in tasks]
+            results = [run_task(future.result) for future in futures]
+
+        # Gather the lines in the order they were asked. A line that fails does not prevent the others from being built.
+        lines_data = LinesData()
+        errors = {}
+        for line_id, (line_data, e) in zip(lines_ids, results):
+            if e is not None:
+                errors[line_id] = e
+                print(f"Failed to generate the timetable of line {line_id}: {e!r}")
+            else:
+                lines_data.add_line(line_data)
+        if errors:
+            print(f"{len(errors)} line{'' if len(errors)==1 else 's'} out of {len(lines_ids)} could not be generated: {', '.join(errors)}")
+
         if return_data:
             return lines_data
         
+    def get_lines_catalog(self, max_resident = 64, refresh = True):
+        # Catalog of the lines saved for this date (loaded only when accessed, see `LinesCatalog`)
+        return LinesCatalog(self.path, max_resident=max_resident, refresh=refresh)
+
     def generate_timetable(self,
                            line_id = None,
                            correct_times = True,
                            threshold = 5,
                            verbose= 1,
                            solve_too_fast = False,
-                           return_data = True):
+                           return_data = True,
+                           force = False,
+                           export_csv = False):
         if line_id is None:
             line_id = self.line_id
         stops_df, timetable_df, lines_df = self.get_filtered_data(solve_too_fast=solve_too_fast)
+        line_data = build_timetable(self.path, line_id, stops_df, timetable_df, lines_df, service_day=self.date, correct_times=correct_times, threshold=threshold, verbose=verbose, force=force, export_csv=export_csv)
+        if return_data:
+            return line_data
+
+def run_task(function, *args, **kwargs):
+    # Return (result, None), or (None, exception) if the call failed
+    try:
+        return function(*args, **kwargs), None
+    except Exception as e:
+        return None, e
+
+def line_params(line_id, line_name, mode, service_day, rows = None, stops = None, correct_times = None, threshold = None):
+    # Everything the timetable of a line depends on (the digests of its rows and stops in the filtered data, and the
+    # options of `build_timetable` are None when not known, see LINE_UNKNOWN_PARAMS)
+    return {
+        "version": TIMETABLE_VERSION,
+        "line_id": line_id,
+        "line_name": str(line_name),
+        "mode": mode,
+        "service_day": service_day,
+        "rows": rows,
+        "stops": stops,
+        "correct_times": correct_times,
+        "threshold": threshold
+    }
+
+def build_timetable(path, line_id, stops_df, timetable_df, lines_df, service_day, correct_times = True, threshold = 5, verbose = 1, force = False, export_csv = False):
+    # Build (or load, if it is up to date) the timetable of a line from the filtered data (times in seconds since the
+    # start of `service_day`), and save it in `path`.
+    # Module-level function so that it can be run by a process pool.
+    if verbose > 0:
+        print(line_id)
+    line_data = timetable_df.loc[timetable_df.LINE_ID == line_id, ["STOP_NUMBER", "JOURNEY_ID", "ARRIVAL", "ARRIVAL_REAL", "DEPARTURE", "DEPARTURE_REAL", "ARRIVAL_REAL_STATUS", "DEPARTURE_REAL_STATUS"]]
+    line_name = lines_df.LINE_NAME.loc[lines_df.LINE_ID == line_id].iloc[0]
+    line_mode = lines_df.MEAN_OF_TRANSPORT.loc[lines_df.LINE_ID == line_id].iloc[0]
+
+    # Skip the line if its outputs were generated from the same rows and parameters
+    params = line_params(line_id, line_name, line_mode, service_day, frame_digest(line_data),
+                         frame_digest(stops_df.loc[stops_df.number.isin(line_data.STOP_NUMBER)]), correct_times, threshold)
+    line_path = get_line_path(path, line_id)
+    saved_files = [BUNDLE_FILE.format(line_name=line_name)] + [f"{line_name}_{name}.csv" for name in CSV_TABLES if export_csv]
+    if not force and matches_fingerprint(line_path, params) and all(os.path.isfile(os.path.join(line_path, file)) for file in saved_files):
         if verbose > 0:
-            print(line_id)
-        line_data = timetable_df.loc[timetable_df.LINE_ID == line_id, ["STOP_NUMBER", "JOURNEY_ID", "ARRIVAL", "ARRIVAL_REAL", "DEPARTURE", "DEPARTURE_REAL", "ARRIVAL_REAL_STATUS", "DEPARTURE_REAL_STATUS"]]
-        line_name = lines_df.LINE_NAME.loc[lines_df.LINE_ID == line_id].iloc[0]
-
-        # Remove duplicates (and try to select the lines with the most accurate status (so REAL instead of PROGNOSE))
-        duplicates = (line_data
-                        .sort_values(by=["ARRIVAL_REAL_STATUS", "DEPARTURE_REAL_STATUS"])
-                        .duplicated(subset = ["STOP_NUMBER", "JOURNEY_ID"], keep="last")
-                        )
-        if duplicates.sum() > 0:
-            if verbose > 0:
-                print(f"Removing {duplicates.sum()} duplicates for line {line_name} ({line_id})")
-            line_data = (line_data
-                        .sort_values(by=["ARRIVAL_REAL_STATUS", "DEPARTURE_REAL_STATUS"])
-                        .drop_duplicates(subset = ["STOP_NUMBER", "JOURNEY_ID"], keep="last")
-                        )
-        line_data = line_data.drop(columns = ["ARRIVAL_REAL_STATUS", "DEPARTURE_REAL_STATUS"])
-
-        # Pivot timetable data for the bus line
-        # ----------------------------------------
-        line_timetable = (line_data
-            .pivot(index="STOP_NUMBER", columns="JOURNEY_ID")
-            .stack(level=0, future_stack=True)
-            .apply(pd.to_datetime, format="mixed")
-            )
-        line_timetable.index.set_names("EVENT", level=-1, inplace=True)
-        
-        # ----
-        # Analyse journeys
-        # ----
-
-        # Get the order in which each journey goes to each bus stop
-        orders = (line_timetable
-                    .loc[line_timetable.index.get_level_values("EVENT").str[-4:] == "REAL"]
-                    .groupby("STOP_NUMBER", sort=False).first()
-                    .apply(lambda x : x.dropna().sort_values().argsort(), axis=0)
-                    .fillna(-1))
-        
-        # Count how many time each order appears
-        order_counts = orders.T.value_counts().reset_index().astype("int").set_index("count").T
-        order_counts = order_counts.sort_index(key=lambda x : x.map(order_counts.iloc[:, 0]))
+            print(f"Line {line_name} ({line_id}) is up to date")
+        return LineData(line_id, line_name, path, mode=line_mode)
+
+    # Remove duplicates (and try to select the lines with the most accurate status (so REAL instead of PROGNOSE))
+    duplicates = (line_data
+                    .sort_values(by=["ARRIVAL_REAL_STATUS", "DEPARTURE_REAL_STATUS"])
+                    .duplicated(subset = ["STOP_NUMBER", "JOURNEY_ID"], keep="last")
+                    )
+    if duplicates.sum() > 0:
+        if verbose > 0:
+            print(f"Removing {duplicates.sum()} duplicates for line {line_name} ({line_id})")
+        line_data = (line_data
+                    .sort_values(by=["ARRIVAL_REAL_STATUS", "DEPARTURE_REAL_STATUS"])
+                    .drop_duplicates(subset = ["STOP_NUMBER", "JOURNEY_ID"], keep="last")
+                    )
+    line_data = line_data.drop(columns = ["ARRIVAL_REAL_STATUS", "DEPARTURE_REAL_STATUS"])
+
+    # Pivot timetable data for the bus line
+    # ----------------------------------------
+    line_timetable = pivot_timetable(line_data, service_day)
+    
+    # ----
+    # Analyse journeys
+    # ----
+
+    # Get the order in which each journey goes to each bus stop
+    orders = stop_orders(line_timetable)
+    
+    # Count how many time each order appears
+    order_counts = orders.T.value_counts().reset_index().astype("int").set_index("count").T
+    order_counts = order_counts.sort_index(key=lambda x : x.map(order_counts.iloc[:, 0]))
 
-        # ---
-        # Create a "stops" df to get all the stops of the line in a correct order
-        # ---
+    # ---
+    # Create a "stops" df to get all the stops of the line in a correct order
+    # ---
 
-        stops = pd.merge(line_timetable.index.get_level_values("STOP_NUMBER").to_series(), 
-                         stops_df[["designationOfficial", "lv95East", "lv95North"]].rename(columns = {"designationOfficial": "STOP_NAME", "lv95East": "POSITION_X", "lv95North": "POSITION_Y"}), 
-                         how="left", 
-                         right_on=stops_df["number"], 
-                         left_index=True).drop("key_0", axis=1).set_index("STOP_NUMBER").drop_duplicates()
+    stops = pd.merge(line_timetable.index.get_level_values("STOP_NUMBER").to_series(), 
+                     stops_df[["designationOfficial", "lv95East", "lv95North"]].rename(columns = {"designationOfficial": "STOP_NAME", "lv95East": "POSITION_X", "lv95North": "POSITION_Y"}), 
+                     how="left", 
+                     right_on=stops_df["number"], 
+                     left_index=True).drop("key_0", axis=1).set_index("STOP_NUMBER").drop_duplicates()
 
-        # ---
-        # Add a "distance" column to order the stops
-        # ---
+    # ---
+    # Add a "distance" column to order the stops
+    # ---
 
-        # Select the order which appears the most
-        order = order_counts.iloc[:, 0]
+    # Select the order which appears the most
+    order = order_counts.iloc[:, 0]
 
-        # Compute the distance based on this order
-        distance = ((stops[["POSITION_X", "POSITION_Y"]].loc[order>=0].sort_index(key=lambda x: x.map(order)).diff()**2).sum(axis=1)**0.5).cumsum()
+    # Compute the distance based on this order
+    distance = ((stops[["POSITION_X", "POSITION_Y"]].loc[order>=0].sort_index(key=lambda x: x.map(order)).diff()**2).sum(axis=1)**0.5).cumsum()
 
-        stops["DISTANCE"] = stops.index.map(distance)
+    stops["DISTANCE"] = stops.index.map(distance)
 
-        # Get full order of the stops by interpolation, over subsequent orders
-        # ---
+    # Get full order of the stops by interpolation, over subsequent orders
+    # ---
 
-        # Iterate over other orders to interpolate the distances
-        missing_distances = stops["DISTANCE"].isna().sum()
-        for _, order in order_counts.iloc[:, 1:].items():
-            if verbose > 1:
-                print(missing_distances)
-            
-            distance = ((stops[["POSITION_X", "POSITION_Y"]].loc[order>=0].sort_index(key=lambda x: x.map(order)).diff()**2).sum(axis=1)**0.5).cumsum().rename("distance")
+    # Iterate over other orders to interpolate the distances
+    missing_distances = stops["DISTANCE"].isna().sum()
+    for _, order in order_counts.iloc[:, 1:].items():
+        if verbose > 1:
+            print(missing_distances)
+        
+        distance = ((stops[["POSITION_X", "POSITION_Y"]].loc[order>=0].sort_index(key=lambda x: x.map(order)).diff()**2).sum(axis=1)**0.5).cumsum().rename("distance")
 
-            distance_for_interp = stops["DISTANCE"].loc[distance.index].dropna()
+        distance_for_interp = stops["DISTANCE"].loc[distance.index].dropna()
 
-            index=distance.index
-            distance = interp1d(distance.loc[distance_for_interp.index].values, distance_for_interp.values, fill_value = "extrapolate", assume_sorted=False)(distance.values)
-            distance = pd.Series(distance, index=index, name="distance")
+        index=distance.index
+        distance = interp1d(distance.loc[distance_for_interp.index].values, distance_for_interp.values, fill_value = "extrapolate", assume_sorted=False)(distance.values)
+        distance = pd.Series(distance, index=index, name="distance")
 
-            stops["DISTANCE"] = stops["DISTANCE"].fillna(distance)
+        stops["DISTANCE"] = stops["DISTANCE"].fillna(distance)
 
 
-            missing_distances = stops["DISTANCE"].isna().sum()
-            if missing_distances == 0:
-                break
+        missing_distances = stops["DISTANCE"].isna().sum()
+        if missing_distances == 0:
+            break
 
-        if missing_distances > 0:
-            if verbose > 0:
-                print(f"Still {missing_distances} distances values missing for line {line_name} ({line_id})")
-                print(stops.loc[stops["DISTANCE"].isna()])
-                print()
-        
-        # Sort the stops df
-        stops = stops.sort_values("DISTANCE")
-                
-        # Add stop names to the timetable
-        names = line_timetable.index.get_level_values("STOP_NUMBER").map(stops_df.set_index("number")["designationOfficial"]).rename("STOP_NAME")
-        line_timetable = line_timetable.set_index([names, line_timetable.index])
-        # Sort the timetable based on this distance
-        def sort_function(x: pd.Index):
-            if x.name == "STOP_NUMBER":
-                return x.map(stops["DISTANCE"])
-            else:
-                return x
-        line_timetable = line_timetable.sort_index(level=["STOP_NUMBER", "EVENT"], key = sort_function)
+    if missing_distances > 0:
+        if verbose > 0:
+            print(f"Still {missing_distances} distances values missing for line {line_name} ({line_id})")
+            print(stops.loc[stops["DISTANCE"].isna()])
+            print()
+    
+    # Sort the stops df
+    stops = stops.sort_values("DISTANCE")
+            
+    # Add stop names to the timetable
+    names = line_timetable.index.get_level_values("STOP_NUMBER").map(stops_df.set_index("number")["designationOfficial"]).rename("STOP_NAME")
+    line_timetable = line_timetable.set_index([names, line_timetable.index])
+    # Sort the timetable based on this distance
+    def sort_function(x: pd.Index):
+        if x.name == "STOP_NUMBER":
+            return x.map(stops["DISTANCE"])
+        else:
+            return x
+    line_timetable = line_timetable.sort_index(level=["STOP_NUMBER", "EVENT"], key = sort_function)
 
-        # ----
-        # Analyse routes
-        # ----
+    # ----
+    # Analyse routes
+    # ----
 
 
-        # Get whether journeys stops at each stop
-        stop_mask = orders >= 0
-        
-        # Change stops index :
-        stop_mask.index = stop_mask.index.map(stops["STOP_NAME"])
-        stops = stops.reset_index().set_index("STOP_NAME")
-
-        # Determine the different routes and add them to the "stops" df
-        stop_mask = stop_mask.reindex(stops.index)
-        routes = stop_mask.T.value_counts().rename("Count").reset_index()
-        routes = routes.rename(index= lambda i: f"Route_{chr(65+i)}")
-        stops = stops.merge(routes.T, how="left", left_on="STOP_NAME", right_index=True).sort_values("DISTANCE")
-
-        # ----
-        # Analyse journeys
-        # ----
-
-        # Create a `journeys` df to log journeys, their route and their direction
-        journeys = line_data.JOURNEY_ID.drop_duplicates()
-
-        # Determine the route :
-        routes_map = routes.iloc[:, :-1].apply(lambda x : "".join(np.where(x, "Y", "N")), axis=1).rename("YN").reset_index().set_index("YN")["index"]
-        journeys_routes = stop_mask.apply(lambda x : "".join(np.where(x, "Y", "N")), axis=0).map(routes_map).rename("Route")
-        journeys = pd.DataFrame(journeys_routes, index = journeys)
-        journeys["Number_of_stops"] = stop_mask.T.sum(axis=1)
-
-        # Determine the direction :
-        mask = line_timetable.index.get_level_values("EVENT").str[-4:] == "REAL"
-        planned = line_timetable.loc[~mask]
-        real = line_timetable.loc[mask]
-        journeys["Direction"] = line_timetable.loc[line_timetable.index.get_level_values("EVENT") == "DEPARTURE_REAL"].diff().map(lambda x : np.where(x<pd.Timedelta(0), "R", "O"), na_action="ignore").mode().loc[0]
-
-        # Add a direction to routes in the routes dataframe
-        def get_direction(group):
-            v = group.value_counts()
-            return "".join(v.index)
-        routes["Direction"] = journeys.groupby("Route")["Direction"].apply(get_direction)
-
-        # Add start and end stops
-        journeys["Start"] = real.droplevel(["STOP_NUMBER", "EVENT"]).idxmin(axis=0).T
-        journeys["Start_time_Planned"] = planned.min(axis=0).T
-        journeys["Start_time_Real"] = real.min(axis=0).T
-        journeys["End"] = real.droplevel(["STOP_NUMBER", "EVENT"]).idxmax(axis=0).T
-        journeys["End_time_Planned"] = planned.max(axis=0).T
-        journeys["End_time_Real"] = real.max(axis=0).T
-
-        # Sort journeys and line_timetable DataFrame
-        journeys = journeys.sort_values("Start_time_Planned")
-        line_timetable = line_timetable[journeys.index.tolist()]
-
-        # ----
-        # Correct the data
-        # ----
-        
-        # Correct time data
-        if correct_times:
-            line_timetable.loc[mask, journeys.loc[journeys.Direction == "O"].index] = line_timetable.loc[mask, journeys.loc[journeys.Direction == "O"].index].apply(lambda col : pd.to_datetime(((col.dropna()- pd.Timestamp("1970-01-01")) // pd.Timedelta("1s")).expanding(1).max(), unit="s"), axis = 0)
-            line_timetable.loc[mask, journeys.loc[journeys.Direction == "R"].index] = line_timetable.loc[mask, journeys.loc[journeys.Direction == "R"].index].apply(lambda col : pd.to_datetime(((col.dropna().iloc[::-1].reindex(["ARRIVAL_REAL", "DEPARTURE_REAL"], level=2)- pd.Timestamp("1970-01-01")) // pd.Timedelta("1s")).expanding(1).max(), unit="s"), axis = 0)
-
-        # Drop the routes that share minimal number of stops with the "main" route
-        if threshold > 0:
-            only_routes = routes.drop(columns =["Count", "Direction"])
-            route_similitude = (only_routes * only_routes.loc["Route_A"]).sum(axis=1)
-            routes_to_drop = route_similitude.index[route_similitude < threshold]
-
-            if len(routes_to_drop) > 0:
-                print(f"Dropping routes {', '.join(routes_to_drop)} as their similitude with Route_A is smaller than the threshold ({threshold})")
-
-                routes = routes.drop(index=routes_to_drop)
-                stops = stops.drop(columns=routes_to_drop) # Remove the route
-                stops = stops.loc[~stops.any(axis=1, bool_only=True)] # Remove stops where no route is going through it
-                journeys_to_drop = journeys.index[journeys["Route"].isin(routes_to_drop)]
-                print(f"Consequently, dropping journeys {', '.join(journeys_to_drop)}")
-                journeys = journeys.drop(index=journeys_to_drop) # Remove concerned journeys from 'journeys' DataFrame
-                line_timetable = line_timetable.drop(columns=journeys_to_drop) # Remove concerned journeys from the timetable
-                line_timetable = line_timetable.dropna(how="all") # Remove stops where no journey is going through it
-                print()
-
-        # ----
-        # Finalise and export
-        # ----
-
-        line_data = LineData(line_id, line_name, self.path, timetable = line_timetable, stops = stops, routes = routes, journeys= journeys)
-        line_data.save_data()
-        if return_data:
-            return line_data
\ No newline at end of file
+    # Get whether journeys stops at each stop
+    stop_mask = orders >= 0
+    
+    # Change stops index :
+    stop_mask.index = stop_mask.index.map(stops["STOP_NAME"])
+    stops = stops.reset_index().set_index("STOP_NAME")
+
+    # Determine the different routes (journeys with the same stops bitset) and add them to the "stops" df
+    stop_mask = stop_mask.reindex(stops.index, fill_value=False)
+    signatures = pack_routes(stop_mask)
+    route_signatures, route_counts, journey_routes = classify_routes(signatures)
+    route_names = [f"Route_{chr(65+i)}" for i in range(len(route_signatures))]
+    routes = pd.DataFrame(np.unpackbits(route_signatures, axis=1, count=len(stop_mask)).astype(bool), index=route_names, columns=stop_mask.index.tolist())
+    routes["Count"] = route_counts
+    stops = stops.merge(routes.T, how="left", left_on="STOP_NAME", right_index=True).sort_values("DISTANCE")
+
+    # ----
+    # Analyse journeys
+    # ----
+
+    # Create a `journeys` df to log journeys, their route and their direction
+    journeys = line_data.JOURNEY_ID.drop_duplicates()
+
+    # Determine the route :
+    journeys_routes = pd.Series(np.array(route_names, dtype=object)[journey_routes], index=stop_mask.columns, name="Route")
+    journeys = pd.DataFrame(journeys_routes, index = journeys)
+    journeys["Number_of_stops"] = pd.Series(count_stops(signatures), index=stop_mask.columns)
+
+    # Determine the direction :
+    mask = line_timetable.index.get_level_values("EVENT").str[-4:] == "REAL"
+    planned = line_timetable.loc[~mask]
+    real = line_timetable.loc[mask]
+    departures = times_array(line_timetable.loc[line_timetable.index.get_level_values("EVENT") == "DEPARTURE_REAL"])
+    journeys["Direction"] = pd.Series(journey_directions(departures), index=line_timetable.columns)
+
+    # Add a direction to routes in the routes dataframe
+    def get_direction(group):
+        v = group.value_counts()
+        return "".join(v.index)
+    routes["Direction"] = journeys.groupby("Route")["Direction"].apply(get_direction)
+
+    # Add start and end stops
+    start, start_real, end, end_real = journey_bounds(times_array(real), real.index.get_level_values("STOP_NAME"))
+    _, start_planned, _, end_planned = journey_bounds(times_array(planned), planned.index.get_level_values("STOP_NAME"))
+    bounds = pd.DataFrame({"Start": start, "Start_time_Planned": start_planned, "Start_time_Real": start_real,
+                           "End": end, "End_time_Planned": end_planned, "End_time_Real": end_real}, index=line_timetable.columns)
+    journeys = journeys.join(bounds)
+
+    # Sort journeys and line_timetable DataFrame
+    journeys = journeys.sort_values("Start_time_Planned")
+    line_timetable = line_timetable[journeys.index.tolist()]
+
+    # ----
+    # Correct the data
+    # ----
+    
+    # Correct time data
+    if correct_times:
+        values = times_array(line_timetable).copy()
+        values[mask] = correct_real_times(values[mask], line_timetable.index.get_level_values("STOP_NUMBER")[mask], journeys.Direction.to_numpy())
+        line_timetable = to_frame(values, line_timetable.index, line_timetable.columns)
+
+    # Drop the routes that share minimal number of stops with the "main" route
+    if threshold > 0:
+        route_similitude = pd.Series(count_stops(route_signatures, route_signatures[0]), index=route_names)
+        routes_to_drop = route_similitude.index[route_similitude < threshold]
+
+        if len(routes_to_drop) > 0:
+            print(f"Dropping routes {', '.join(routes_to_drop)} as their similitude with Route_A is smaller than the threshold ({threshold})")
+
+            routes = routes.drop(index=routes_to_drop)
+            stops = stops.drop(columns=routes_to_drop) # Remove the route
+            stops = stops.loc[~stops.any(axis=1, bool_only=True)] # Remove stops where no route is going through it
+            journeys_to_drop = journeys.index[journeys["Route"].isin(routes_to_drop)]
+            print(f"Consequently, dropping journeys {', '.join(journeys_to_drop)}")
+            journeys = journeys.drop(index=journeys_to_drop) # Remove concerned journeys from 'journeys' DataFrame
+            line_timetable = line_timetable.drop(columns=journeys_to_drop) # Remove concerned journeys from the timetable
+            line_timetable = line_timetable.dropna(how="all") # Remove stops where no journey is going through it
+            print()
+
+    # ----
+    # Finalise and export
+    # ----
+
+    line_data = LineData(line_id, line_name, path, timetable = line_timetable, stops = stops, routes = routes, journeys= journeys, mode = line_mode)
+    line_data.save_data(csv=export_csv)
+    write_fingerprint(line_data.path, params)
+    return line_data
+
+def filter_many(targets: dict, date = datetime.datetime.today().date(), memory_budget = None, solve_too_fast = False, export_csv = False, **kwargs):
+    # Filter the data for many areas and lines at once (see `TransportData.filter_many_data`).
+    # `targets` is a dict {name: Area or line_id}. Returns a dict {name: TransportData}.
+    transport_datas = {name: TransportData(name, area=target, date=date, **kwargs) if isinstance(target, Area) else TransportData(name, line_id=target, date=date, **kwargs)
+                       for name, target in targets.items()}
+    next(iter(transport_datas.values())).get_downloaded_filenames(solve_too_fast=solve_too_fast)
+    TransportData.filter_many_data(list(transport_datas.values()), memory_budget=memory_budget, export_csv=export_csv)
+    return transport_datas
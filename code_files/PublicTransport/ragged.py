@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+from .timetable import EVENTS, MISSING_SECONDS, NAT, day_start, times_array, to_frame, to_nanoseconds
+
+# Event types of the entries (the planned and real times of an arrival, or of a departure)
+ARRIVAL, DEPARTURE = 0, 1
+EVENT_NAMES = ["ARRIVAL", "DEPARTURE"]
+
+class RaggedTimetable:
+    # Compact (CSR) version of a line timetable : the entries of journey j (one per stop and event type the journey has
+    # a time for, in the order of the stops along the line) are entries[offsets[j]:offsets[j+1]], stored in flat arrays
+    # (stop index, event type, planned and real seconds since the start of the service day, MISSING_SECONDS if missing).
+    # The rows of the DataFrame version (STOP_NAME, STOP_NUMBER, EVENT) are kept, so that `to_frame` gives it back.
+    def __init__(self, journey_ids, stop_names, stop_numbers, offsets, stop_index, event, planned, real, service_day, row_stop, row_event):
+        self.journey_ids = pd.Index(journey_ids, name="JOURNEY_ID")
+        self.stop_names = np.asarray(stop_names, dtype=object)
+        self.stop_numbers = np.asarray(stop_numbers, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.stop_index = np.asarray(stop_index, dtype=np.int32)
+        self.event = np.asarray(event, dtype=np.int8)
+        self.planned = np.asarray(planned, dtype=np.int32)
+        self.real = np.asarray(real, dtype=np.int32)
+        self.service_day = service_day
+        # Rows of the DataFrame version : stop index and event (index in EVENTS)
+        self.row_stop = np.asarray(row_stop, dtype=np.int32)
+        self.row_event = np.asarray(row_event, dtype=np.int8)
+        self._by_stop = None
+
+    @classmethod
+    def from_frame(cls, timetable: pd.DataFrame, service_day = None):
+        # Build from a timetable DataFrame (rows (STOP_NAME, STOP_NUMBER, EVENT), one column per journey).
+        # By default, the service day is the day of the first time of the timetable.
+        values = times_array(timetable)
+        if service_day is None:
+            first = values[values != NAT].min(initial=np.iinfo(np.int64).max)
+            service_day = pd.Timestamp(first if first != np.iinfo(np.int64).max else 0).date()
+        if len(timetable) == 0:
+            # No stop at all (e.g. every journey was dropped) : no entry for any journey
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(timetable.columns, [], [], np.zeros(values.shape[1] + 1, dtype=np.int64), empty, empty, empty, empty, service_day, empty, empty)
+
+        stop_codes, stops = timetable.index.droplevel("EVENT").factorize()
+        row_event = pd.Index(EVENTS).get_indexer(timetable.index.get_level_values("EVENT"))
+        if (row_event < 0).any():
+            raise ValueError(f"The EVENT level of the timetable must only contain {', '.join(EVENTS)}")
+
+        # One pair per stop and event type, in the order of their first row
+        pair_codes, pairs = pd.factorize(stop_codes * 2 + row_event // 2)
+        is_real = (row_event % 2).astype(bool)
+        planned = np.full((len(pairs), values.shape[1]), NAT)
+        real = np.full((len(pairs), values.shape[1]), NAT)
+        planned[pair_codes[~is_real]] = values[~is_real]
+        real[pair_codes[is_real]] = values[is_real]
+
+        # Entries : journey by journey, the pairs with a time
+        journeys, entries = np.nonzero(((planned != NAT) | (real != NAT)).T)
+        offsets = np.searchsorted(journeys, np.arange(values.shape[1] + 1))
+        start = day_start(service_day)
+        def to_seconds(times):
+            times = times[entries, journeys]
+            return np.where(times != NAT, times // 10**9 - start, MISSING_SECONDS)
+
+        return cls(timetable.columns, stops.get_level_values(0), stops.get_level_values(1),
+                   offsets, pairs[entries] // 2, pairs[entries] % 2, to_seconds(planned), to_seconds(real),
+                   service_day, stop_codes, row_event)
+
+    def to_frame(self):
+        # DataFrame version of the timetable (as given to `from_frame`)
+        rows = np.full((len(self.stop_names), len(EVENTS)), -1)
+        rows[self.row_stop, self.row_event] = np.arange(len(self.row_stop))
+        journeys = np.repeat(np.arange(len(self.journey_ids)), np.diff(self.offsets))
+        values = np.full((len(self.row_stop), len(self.journey_ids)), NAT)
+        for times, real in [(self.planned, 0), (self.real, 1)]:
+            present = times != MISSING_SECONDS
+            values[rows[self.stop_index[present], 2 * self.event[present] + real], journeys[present]] = to_nanoseconds(times[present], self.service_day)
+
+        index = pd.MultiIndex.from_arrays([self.stop_names[self.row_stop], self.stop_numbers[self.row_stop], np.array(EVENTS, dtype=object)[self.row_event]],
+                                          names=["STOP_NAME", "STOP_NUMBER", "EVENT"])
+        return to_frame(values, index, self.journey_ids)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in [self.offsets, self.stop_index, self.event, self.planned, self.real, self.row_stop, self.row_event])
+
+    def journey_entries(self, journey):
+        # Slice of the entries of a journey (its id, or its position)
+        j = journey if isinstance(journey, (int, np.integer)) else self.journey_ids.get_loc(journey)
+        return slice(self.offsets[j], self.offsets[j + 1])
+
+    def stop_entries(self, stop_number):
+        # Positions of the entries at a stop, journey by journey
+        if self._by_stop is None:
+            order = np.argsort(self.stop_index, kind="stable")
+            self._by_stop = order, np.searchsorted(self.stop_index[order], np.arange(len(self.stop_names) + 1))
+        order, offsets = self._by_stop
+        stops = np.flatnonzero(self.stop_numbers == stop_number)
+        if len(stops) == 0:
+            raise KeyError(stop_number)
+        return np.concatenate([order[offsets[s]:offsets[s + 1]] for s in stops])
+
+    def entries_frame(self, entries):
+        # DataFrame of some entries (a slice or positions), with the times as datetimes
+        journeys = np.repeat(np.arange(len(self.journey_ids)), np.diff(self.offsets))[entries]
+        stop_index = self.stop_index[entries]
+        return pd.DataFrame({
+            "JOURNEY_ID": self.journey_ids[journeys],
+            "STOP_NAME": self.stop_names[stop_index],
+            "STOP_NUMBER": self.stop_numbers[stop_index],
+            "EVENT": np.array(EVENT_NAMES, dtype=object)[self.event[entries]],
+            "PLANNED": to_nanoseconds(self.planned[entries], self.service_day).view("M8[ns]"),
+            "REAL": to_nanoseconds(self.real[entries], self.service_day).view("M8[ns]")
+        })
+
+    def get_journey(self, journey):
+        return self.entries_frame(self.journey_entries(journey))
+
+    def get_stop(self, stop_number):
+        return self.entries_frame(self.stop_entries(stop_number))
@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+
+from scipy.spatial import cKDTree
+
+from .linedata import LineData
+from .ragged import ARRIVAL, DEPARTURE
+from .timetable import MISSING_SECONDS, day_start
+
+# Earliest arrival of the stops that cannot be reached (seconds since the start of the service day)
+UNREACHED = np.iinfo(np.int32).max
+# Number of queries answered by one scan of the connections
+QUERY_BATCH_SIZE = 1024
+# Number of connections first looked at for the end of a block of connections
+BLOCK_WINDOW = 256
+
+def line_connections(ragged, times = "real"):
+    # Connections (departure stop number, arrival stop number, departure time, arrival time, journey) of a
+    # RaggedTimetable, from each stop of a journey to the next one (stops sorted by time). With `times` "real", the
+    # real times are used, and the planned ones when they are missing.
+    journey = np.repeat(np.arange(len(ragged.journey_ids)), np.diff(ragged.offsets))
+    time = ragged.planned if times == "planned" else np.where(ragged.real != MISSING_SECONDS, ragged.real, ragged.planned)
+    present = time != MISSING_SECONDS
+    journey, stop_index, event, time = journey[present], ragged.stop_index[present], ragged.event[present], time[present]
+
+    # One visit per journey and stop, with its arrival and departure times (one for the other when missing)
+    visits, visit = np.unique(journey.astype(np.int64) * len(ragged.stop_names) + stop_index, return_inverse=True)
+    arrival = np.full(len(visits), MISSING_SECONDS, dtype=np.int32)
+    departure = np.full(len(visits), MISSING_SECONDS, dtype=np.int32)
+    arrival[visit[event == ARRIVAL]] = time[event == ARRIVAL]
+    departure[visit[event == DEPARTURE]] = time[event == DEPARTURE]
+    arrival = np.where(arrival != MISSING_SECONDS, arrival, departure)
+    departure = np.where(departure != MISSING_SECONDS, departure, arrival)
+    journey, stop = visits // len(ragged.stop_names), ragged.stop_numbers[visits % len(ragged.stop_names)]
+
+    # Consecutive visits of each journey
+    order = np.lexsort((arrival, departure, journey))
+    journey, stop, arrival, departure = journey[order], stop[order], arrival[order], departure[order]
+    keep = (journey[1:] == journey[:-1]) & (stop[1:] != stop[:-1]) & (arrival[1:] >= departure[:-1])
+    return stop[:-1][keep], stop[1:][keep], departure[:-1][keep], arrival[1:][keep], journey[:-1][keep]
+
+def minimum_at(arrivals, stops, times):
+    # arrivals[stops] = min(arrivals[stops], times), row by row : the rows at the same stop are applied in turns (much
+    # faster than np.minimum.at on rows, as few rows share a stop)
+    order = np.argsort(stops, kind="stable")
+    sorted_stops = stops[order]
+    first = np.r_[True, sorted_stops[1:] != sorted_stops[:-1]]
+    turn = np.arange(len(stops)) - np.maximum.accumulate(np.where(first, np.arange(len(stops)), 0))
+    for t in range(turn.max() + 1 if len(stops) else 0):
+        rows = order[turn == t]
+        arrivals[stops[rows]] = np.minimum(arrivals[stops[rows]], times[rows])
+
+def connection_blocks(departure, arrival, trip):
+    # End of the blocks of consecutive connections (sorted by departure) that cannot depend on each other : all of them
+    # leave before any of them arrives, and each is on a different trip
+    previous = np.full(len(trip), -1)
+    order = np.argsort(trip, kind="stable")
+    same = trip[order][1:] == trip[order][:-1]
+    previous[order[1:][same]] = order[:-1][same]
+
+    ends = []
+    start = 0
+    while start < len(departure):
+        # Up to the first connection leaving once one of the block arrives, or on the trip of one of the block
+        window = BLOCK_WINDOW
+        while True:
+            stop = min(start + window, len(departure))
+            arrived = np.minimum.accumulate(arrival[start:stop - 1])
+            breaks = np.flatnonzero((departure[start + 1:stop] >= arrived) | (previous[start + 1:stop] >= start))
+            if len(breaks) or stop == len(departure):
+                break
+            window *= 2
+        start = start + 1 + breaks[0] if len(breaks) else stop
+        ends.append(start)
+    return np.array(ends, dtype=np.int64)
+
+class ConnectionScan:
+    # Time-dependent routing over the timetables of lines (a LineData, a LinesData or a LinesCatalog), with the
+    # Connection Scan Algorithm : the connections (a vehicle going from a stop to the next one) of all the journeys,
+    # sorted by departure time, are scanned once per batch of queries, keeping the earliest arrival at every stop for
+    # each query of the batch. Transfers are possible at the same stop, and by walking between stops at most
+    # `transfer_radius` meters apart (at `walking_speed` m/s). The times are in seconds since the start of the service
+    # day of the first line. The connections are scanned by blocks of connections that cannot depend on each other (all
+    # leaving before any of them arrives, each on a different trip), each block at once for all the queries.
+    def __init__(self, lines, times = "real", transfer_radius = 150, walking_speed = 1.2):
+        if times not in ("real", "planned"):
+            raise ValueError(f"`times` must be 'real' or 'planned', not '{times}'")
+        lines = [lines] if isinstance(lines, LineData) else list(lines.values())
+        if not lines:
+            raise ValueError("ConnectionScan needs at least one line")
+        self.walking_speed = walking_speed
+
+        # Connections of all the lines (each journey of each line is a trip). The lines without any connection (e.g.
+        # all their journeys were dropped) are skipped : their service day could be anything.
+        connections = []
+        trips = 0
+        service_day = None
+        for line in lines:
+            ragged = line.ragged
+            departure_stop, arrival_stop, departure, arrival, journey = line_connections(ragged, times)
+            if len(departure_stop) == 0:
+                continue
+            service_day = ragged.service_day if service_day is None else service_day
+            shift = day_start(ragged.service_day) - day_start(service_day)
+            connections.append((departure_stop, arrival_stop, departure + shift, arrival + shift, journey + trips))
+            trips += len(ragged.journey_ids)
+        if not connections:
+            raise ValueError("ConnectionScan needs at least one line with a connection")
+        self.service_day = service_day
+        departure_stop, arrival_stop, departure, arrival, trip = (np.concatenate(arrays) for arrays in zip(*connections))
+
+        # Stops (by STOP_NUMBER) and their positions
+        positions = pd.concat([line.stops[["STOP_NUMBER", "POSITION_X", "POSITION_Y"]] for line in lines]).drop_duplicates("STOP_NUMBER").set_index("STOP_NUMBER")
+        self.stop_numbers = np.union1d(positions.index.to_numpy(dtype=np.int64), np.concatenate([departure_stop, arrival_stop]).astype(np.int64))
+        self.positions = positions.reindex(self.stop_numbers)[["POSITION_X", "POSITION_Y"]].to_numpy(dtype=np.float64)
+        located = np.flatnonzero(~np.isnan(self.positions).any(axis=1))
+        self.tree = cKDTree(self.positions[located])
+        self.located = located
+
+        order = np.lexsort((arrival, departure))
+        self.departure_stop = np.searchsorted(self.stop_numbers, departure_stop[order])
+        self.arrival_stop = np.searchsorted(self.stop_numbers, arrival_stop[order])
+        self.departure = departure[order].astype(np.int32)
+        self.arrival = arrival[order].astype(np.int32)
+        self.trip = trip[order]
+        self.n_trips = trips
+        self.block_offsets = connection_blocks(self.departure, self.arrival, self.trip)
+
+        # Footpaths between the stops near each other (both ways), by departure stop (CSR)
+        pairs = self.tree.query_pairs(transfer_radius, output_type="ndarray")
+        start, end = located[np.concatenate([pairs[:, 0], pairs[:, 1]])], located[np.concatenate([pairs[:, 1], pairs[:, 0]])]
+        duration = np.ceil(np.linalg.norm(self.positions[start] - self.positions[end], axis=1) / walking_speed).astype(np.int32)
+        order = np.argsort(start, kind="stable")
+        self.footpath_offsets = np.searchsorted(start[order], np.arange(len(self.stop_numbers) + 1))
+        self.footpath_stop = end[order]
+        self.footpath_duration = duration[order]
+
+    def __len__(self):
+        return len(self.departure)
+
+    def stop_positions(self, stop_numbers):
+        # Positions (rows of `self.stop_numbers`) of stops given by their STOP_NUMBER
+        stop_numbers = np.asarray(stop_numbers, dtype=np.int64)
+        positions = np.searchsorted(self.stop_numbers, stop_numbers).clip(max=len(self.stop_numbers) - 1)
+        if len(stop_numbers) and (self.stop_numbers[positions] != stop_numbers).any():
+            raise KeyError(f"Unknown stops: {', '.join(map(str, np.unique(stop_numbers[self.stop_numbers[positions] != stop_numbers])))}")
+        return positions
+
+    def nearest_stops(self, x, y):
+        # STOP_NUMBER of the nearest stop of each point, and its distance
+        distance, i = self.tree.query(np.column_stack((np.asarray(x, dtype=np.float64).ravel(), np.asarray(y, dtype=np.float64).ravel())))
+        return self.stop_numbers[self.located[i]], distance
+
+    def footpaths(self, stops):
+        # Footpaths (position in `self.footpath_stop`) from each of `stops`, and the position in `stops` of their start
+        counts = self.footpath_offsets[stops + 1] - self.footpath_offsets[stops]
+        start = np.repeat(np.arange(len(stops)), counts)
+        return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + self.footpath_offsets[stops][start], start
+
+    def scan(self, sources, departures, targets):
+        # Earliest arrival at `targets` of one batch of queries (positions of stops), leaving `sources` at `departures`
+        queries = np.arange(len(sources))
+        arrivals = np.full((len(self.stop_numbers), len(sources)), UNREACHED, dtype=np.int32)
+        arrivals[sources, queries] = departures
+        footpaths, query = self.footpaths(sources)
+        np.minimum.at(arrivals, (self.footpath_stop[footpaths], query), departures[query] + self.footpath_duration[footpaths])
+        on_trip = np.zeros((self.n_trips, len(sources)), dtype=bool)
+
+        first = np.searchsorted(self.departure, departures.min()) if len(sources) else len(self)
+        blocks = self.block_offsets[np.searchsorted(self.block_offsets, first, side="right"):]
+        for start, end in zip(np.concatenate([[first], blocks[:-1]]), blocks):
+            # Stop when no connection can improve the arrival at the targets anymore
+            if self.departure[start] > arrivals[targets, queries].max():
+                break
+            trip = self.trip[start:end]
+            boarded = on_trip[trip] | (arrivals[self.departure_stop[start:end]] <= self.departure[start:end, None])
+            if not boarded.any():
+                continue
+            on_trip[trip] = boarded
+            # The arrivals of the connections boarded (at the stop, then by walking from it) : none of them can be used
+            # by a connection of the same block
+            used = np.flatnonzero(boarded.any(axis=1))
+            stops, boarded = self.arrival_stop[start:end][used], boarded[used]
+            reached = np.where(boarded, self.arrival[start:end][used, None], UNREACHED)
+            minimum_at(arrivals, stops, reached)
+            footpaths, connection = self.footpaths(stops)
+            if len(footpaths):
+                walked = np.where(boarded[connection], reached[connection] + self.footpath_duration[footpaths, None], UNREACHED)
+                minimum_at(arrivals, self.footpath_stop[footpaths], walked)
+        return arrivals[targets, queries]
+
+    def earliest_arrival(self, from_stops, departures, to_stops, batch_size = QUERY_BATCH_SIZE):
+        # Earliest arrival (seconds since the start of the service day, NaN if unreachable) at each of `to_stops`,
+        # leaving the corresponding `from_stops` (STOP_NUMBER) at `departures` (seconds). The queries are answered by
+        # batches of `batch_size`, sorted by departure time so that each scan starts as late as possible.
+        sources, targets = self.stop_positions(from_stops), self.stop_positions(to_stops)
+        departures = np.broadcast_to(np.asarray(departures, dtype=np.int32), sources.shape)
+        order = np.argsort(departures, kind="stable")
+        arrivals = np.full(len(sources), np.nan)
+        for start in range(0, len(sources), batch_size):
+            batch = order[start:start + batch_size]
+            reached = self.scan(sources[batch], departures[batch], targets[batch])
+            arrivals[batch] = np.where(reached != UNREACHED, reached, np.nan)
+        return arrivals
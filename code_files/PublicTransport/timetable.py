@@ -0,0 +1,212 @@
+import numpy as np
+import pandas as pd
+
+# Events of each stop, in the order of the timetable rows
+EVENTS = ["ARRIVAL", "ARRIVAL_REAL", "DEPARTURE", "DEPARTURE_REAL"]
+# Missing times (NaT) in the int64 arrays, and in the int32 seconds since the start of the service day
+NAT = np.iinfo(np.int64).min
+INT64_MAX = np.iinfo(np.int64).max
+MISSING_SECONDS = np.iinfo(np.int32).min
+DAY_SECONDS = 24 * 3600
+
+# Fixed layouts of the timestamps : istdaten (planned times to the minute, real times to the second), and the csv
+# files written by `LineData.save_data`. (length, positions of the year, month, day, hour, minute and second, separators)
+TIMESTAMP_LAYOUTS = [
+    (16, (6, 3, 0, 11, 14, None), {2: ".", 5: ".", 10: " ", 13: ":"}),               # dd.mm.yyyy HH:MM
+    (19, (6, 3, 0, 11, 14, 17), {2: ".", 5: ".", 10: " ", 13: ":", 16: ":"}),        # dd.mm.yyyy HH:MM:SS
+    (19, (0, 5, 8, 11, 14, 17), {4: "-", 7: "-", 10: " ", 13: ":", 16: ":"}),        # yyyy-mm-dd HH:MM:SS
+]
+
+def parse_layout(text, layout):
+    # Parse the timestamps in `text` (an array of bytes strings) that follow `layout` to seconds since 1970.
+    # Returns the seconds, and whether each value follows the layout.
+    length, (year, month, day, hour, minute, second), separators = layout
+    chars = np.frombuffer(text.tobytes(), dtype=np.uint8).reshape(len(text), text.itemsize)[:, :length].astype(np.int64)
+    def number(start, width = 2):
+        return sum((chars[:, start + i] - 48) * 10**(width - 1 - i) for i in range(width)) if start is not None else 0
+    digits = np.delete(chars, list(separators), axis=1)
+    valid = (np.char.str_len(text) == length) & ((digits >= 48) & (digits <= 57)).all(axis=1)
+    for position, separator in separators.items():
+        valid &= chars[:, position] == ord(separator)
+    months = (number(year, 4) - 1970) * 12 + number(month) - 1
+    valid &= (number(month) >= 1) & (number(month) <= 12) & (number(day) >= 1) & (number(day) <= 31)
+    days = np.where(valid, months, 0).astype("M8[M]").astype("M8[D]").astype(np.int64) + number(day) - 1
+    return days * DAY_SECONDS + number(hour) * 3600 + number(minute) * 60 + number(second), valid
+
+def parse_timestamps(values):
+    # Parse a column of timestamps to int64 seconds since 1970 (NAT when missing). Each distinct value is parsed once,
+    # with the layout of TIMESTAMP_LAYOUTS detected on the first one ; the values that do not follow it are parsed by pandas.
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    uniques = np.asarray(uniques, dtype=object)
+    seconds = np.full(len(uniques), NAT)
+    if len(uniques) > 0:
+        try:
+            text = uniques.astype("S20")
+        except UnicodeEncodeError:
+            text = np.zeros(len(uniques), dtype="S20")
+        for layout in TIMESTAMP_LAYOUTS:
+            parsed, valid = parse_layout(text[:1], layout)
+            if valid[0]:
+                parsed, valid = parse_layout(text, layout)
+                seconds[valid] = parsed[valid]
+                break
+        else:
+            valid = np.zeros(len(uniques), dtype=bool)
+        if not valid.all():
+            others = pd.to_datetime(pd.Series(uniques[~valid]), format="mixed", dayfirst=True)
+            seconds[~valid] = np.where(others.notna(), others.to_numpy("M8[s]").view("i8"), NAT)
+    return np.append(seconds, NAT)[codes]
+
+def parse_datetimes(values):
+    # Parse timestamps to a datetime64[ns] array (NaT when missing)
+    seconds = parse_timestamps(values)
+    return np.where(seconds != NAT, seconds * 10**9, NAT).view("M8[ns]")
+
+def day_start(service_day):
+    # Seconds since 1970 at the start of the service day (a date)
+    return int(np.datetime64(service_day, "D").astype(np.int64)) * DAY_SECONDS
+
+def service_seconds(values, service_day):
+    # Parse a column of timestamps to int32 seconds since the start of the service day (MISSING_SECONDS when missing).
+    # Times after midnight, of journeys that started on the service day, are above 24 hours.
+    seconds = parse_timestamps(values)
+    return np.where(seconds != NAT, seconds - day_start(service_day), MISSING_SECONDS).astype(np.int32)
+
+def to_nanoseconds(seconds, service_day):
+    # int64 nanoseconds since 1970 (NAT when missing) from int32 seconds since the start of the service day
+    seconds = np.asarray(seconds)
+    return np.where(seconds != MISSING_SECONDS, (seconds.astype(np.int64) + day_start(service_day)) * 10**9, NAT)
+
+def format_seconds(seconds, service_day, format = "%d.%m.%Y %H:%M:%S"):
+    # Timestamps (strings, NaN when missing) from seconds since the start of the service day (Int32 or MISSING_SECONDS)
+    seconds = pd.Series(seconds).astype("Int64")
+    seconds = seconds.mask(seconds == MISSING_SECONDS)
+    return pd.to_datetime(seconds + day_start(service_day), unit="s").dt.strftime(format)
+
+def nullable_seconds(seconds):
+    # Nullable pandas array (Int32) of seconds since the start of the service day
+    return pd.arrays.IntegerArray(seconds, seconds == MISSING_SECONDS)
+
+def to_frame(values, index, columns):
+    # DataFrame of datetimes from an int64 nanoseconds array
+    return pd.DataFrame(values.view("M8[ns]"), index=index, columns=columns)
+
+def times_array(df: pd.DataFrame):
+    # int64 nanoseconds array of a DataFrame of datetimes
+    return df.to_numpy(dtype="M8[ns]").view("i8")
+
+def pivot_timetable(line_data: pd.DataFrame, service_day):
+    # Dense timetable of a line : one row per (STOP_NUMBER, EVENT), one column per JOURNEY_ID (both sorted), as the
+    # pivot of `line_data` (one row per stop and journey, times in seconds since the start of `service_day`) would give.
+    stop_codes, stop_numbers = pd.factorize(line_data.STOP_NUMBER, sort=True)
+    journey_codes, journey_ids = pd.factorize(line_data.JOURNEY_ID, sort=True)
+    values = np.full((len(stop_numbers), len(EVENTS), len(journey_ids)), NAT)
+    for i, event in enumerate(EVENTS):
+        values[stop_codes, i, journey_codes] = to_nanoseconds(line_data[event].to_numpy(dtype=np.int32, na_value=MISSING_SECONDS), service_day)
+    index = pd.MultiIndex.from_product([stop_numbers, EVENTS], names=["STOP_NUMBER", "EVENT"])
+    return to_frame(values.reshape(-1, len(journey_ids)), index, pd.Index(journey_ids, name="JOURNEY_ID"))
+
+def stop_orders(line_timetable: pd.DataFrame):
+    # Order in which each journey (column) goes to each stop (row), based on the first real time at the stop
+    # (-1 if the journey does not stop there). `line_timetable` is the output of `pivot_timetable`.
+    stop_numbers = line_timetable.index.get_level_values("STOP_NUMBER")[::len(EVENTS)]
+    values = times_array(line_timetable).reshape(len(stop_numbers), len(EVENTS), -1)
+    first = np.where(values[:, 1] != NAT, values[:, 1], values[:, 3])
+    valid = first != NAT
+
+    # The journeys that go through the same stops are ranked together. The stops are sorted by time, and then the sorted
+    # times are argsorted again (both with quicksort, on the times of the stops of the journeys only), as pandas would
+    # do with `x.dropna().sort_values().argsort()` : the stops with the same time are ranked the same way.
+    ranks = np.full(first.shape, -1)
+    sequences = np.full(first.shape, -1)
+    patterns, inverse = np.unique(valid.T, axis=0, return_inverse=True)
+    for pattern, columns in zip(patterns, [np.flatnonzero(inverse.ravel() == p) for p in range(len(patterns))]):
+        rows = np.flatnonzero(pattern)
+        times = first[np.ix_(rows, columns)].view("M8[ns]")
+        by_time = np.argsort(times, axis=0, kind="quicksort")
+        ranks[rows[by_time], columns] = np.argsort(np.take_along_axis(times, by_time, axis=0), axis=0, kind="quicksort")
+        sequences[:len(rows), columns] = rows[by_time]
+
+    # The stops are in the order of the journeys if they all go through the same stops in the same order,
+    # otherwise sorted by number
+    if len(patterns) == 1 and (sequences == sequences[:, :1]).all():
+        rows = sequences[:valid[:, 0].sum(), 0]
+    else:
+        rows = np.flatnonzero(valid.any(axis=1))
+    return pd.DataFrame(ranks[rows], index=pd.Index(stop_numbers[rows], name="STOP_NUMBER"), columns=line_timetable.columns)
+
+def journey_directions(departures):
+    # "O" or "R" for each journey (column) of the real departures (one row per stop, sorted along the line) : "R" if
+    # the journey goes backwards between most of its consecutive stops, NaN if it has no consecutive stops.
+    valid = (departures[1:] != NAT) & (departures[:-1] != NAT)
+    backwards = (valid & (departures[1:] < departures[:-1])).sum(axis=0)
+    forwards = valid.sum(axis=0) - backwards
+    directions = np.full(departures.shape[1], np.nan, dtype=object)
+    directions[forwards > 0] = "O"
+    directions[backwards > forwards] = "R"
+    return directions
+
+def journey_bounds(values, names):
+    # First and last stop (from `names`, one per row) of each journey (column), and the corresponding times.
+    # Journeys without any time get NaN and NaT.
+    valid = (values != NAT).any(axis=0)
+    start = np.where(values != NAT, values, INT64_MAX).argmin(axis=0)
+    end = values.argmax(axis=0)
+    columns = np.arange(values.shape[1])
+    return (np.where(valid, np.asarray(names, dtype=object)[start], np.nan),
+            np.where(valid, values[start, columns], NAT).view("M8[ns]"),
+            np.where(valid, np.asarray(names, dtype=object)[end], np.nan),
+            np.where(valid, values[end, columns], NAT).view("M8[ns]"))
+
+def running_max(values):
+    # Cumulative maximum along the rows, ignoring (and keeping) the missing times
+    return np.where(values != NAT, np.maximum.accumulate(values, axis=0), NAT)
+
+def correct_real_times(real, stops, directions):
+    # Make the real times of each journey (column) increase along its direction : forwards for "O", from the last stop
+    # for "R" (arrival before departure at each stop). The times are first floored to the second.
+    # `real` has the real time rows (ARRIVAL_REAL, DEPARTURE_REAL) of the timetable, and `stops` their stop (one per row).
+    corrected = real.copy()
+    real = np.where(real != NAT, real // 10**9 * 10**9, NAT)
+
+    outward = directions == "O"
+    corrected[:, outward] = running_max(real[:, outward])
+
+    # Backwards : the rows of each stop are together (arrival, then departure) in the general case
+    returning = np.flatnonzero(directions == "R")
+    stops = np.asarray(stops)
+    if len(stops) % 2 == 0 and (stops[::2] == stops[1::2]).all() and (len(stops) < 4 or (stops[2::2] != stops[:-2:2]).all()):
+        backwards = real[:, returning].reshape(-1, 2, len(returning))[::-1].reshape(-1, len(returning))
+        corrected[:, returning] = running_max(backwards).reshape(-1, 2, len(returning))[::-1].reshape(-1, len(returning))
+    else:
+        # Stops that are interleaved (same distance along the line) : order the rows journey by journey
+        for j in returning:
+            rows = np.flatnonzero(real[::-1, j] != NAT)
+            rows_stops = stops[::-1][rows]
+            runs = np.concatenate([[0], np.cumsum(rows_stops[1:] != rows_stops[:-1])])
+            rows = len(stops) - 1 - rows[np.lexsort((len(stops) - 1 - rows, runs))]
+            corrected[rows, j] = np.maximum.accumulate(real[rows, j])
+    return corrected
+
+# Number of bits set in each byte
+POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+def pack_routes(stop_mask):
+    # Bitset signature of each route (or journey) : `stop_mask` has one row per stop and one column per route, the
+    # result one row of packed bytes per route (the first stop being the highest bit of the first byte)
+    return np.packbits(np.asarray(stop_mask, dtype=bool), axis=0).T.copy()
+
+def count_stops(signatures, reference = None):
+    # Number of stops of each signature, or number of stops it shares with the `reference` signature
+    if reference is not None:
+        signatures = signatures & reference
+    return POPCOUNT[signatures].sum(axis=1, dtype=np.int64)
+
+def classify_routes(signatures):
+    # Group the journeys by signature. Returns the signatures of the routes (the most frequent first, the same order as
+    # `DataFrame.value_counts`), the number of journeys of each route, and the route of each journey.
+    unique, inverse, counts = np.unique(signatures, axis=0, return_inverse=True, return_counts=True)
+    order = pd.Series(counts).sort_values(ascending=False).index.to_numpy()
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return unique[order], counts[order], rank[inverse.ravel()]
@@ -1,15 +1,232 @@
+import os
+import shutil
+from collections import OrderedDict
+
 import pandas as pd
 import numpy as np
 
 from ..download import DownloadManager
 
 from ..area import Area
+from ..PublicTransport.fingerprint import read_fingerprint, write_fingerprint
+
+# Hectare grids of the geostat datasets (one folder per dataset and year, one .npy file per column), sorted by tile
+GEOSTAT_FOLDER = os.path.join("raw_data", "3_geostat")
+TILE_SIZE = 10000
+TILES_FILE = "tiles.npy"
+# Hectares of the last areas read, by (dataset, year, area)
+GRID_CACHE = OrderedDict()
+GRID_CACHE_SIZE = 32
+
+def convert_grid(dl: DownloadManager, url, name, zip_file_name, columns, folder):
+    # One-time conversion of a geostat csv (only `columns`) into a grid folder : the hectares are sorted by tile of
+    # TILE_SIZE meters, and tiles.npy gives the rows of each tile (tile_x, tile_y, start, end)
+    with dl.open_with_cache(url, name, zip=True, zip_file_name=zip_file_name) as f:
+        df = pd.read_csv(f, sep=";", usecols=columns)
+    x, y = df["E_KOORD"].to_numpy(), df["N_KOORD"].to_numpy()
+    order = np.lexsort((y, x, y // TILE_SIZE, x // TILE_SIZE))
+    tile_x, tile_y = x[order] // TILE_SIZE, y[order] // TILE_SIZE
+    starts = np.flatnonzero(np.r_[True, (tile_x[1:] != tile_x[:-1]) | (tile_y[1:] != tile_y[:-1])]) if len(order) else np.zeros(0, dtype=np.int64)
+    tiles = np.column_stack((tile_x[starts], tile_y[starts], starts, np.r_[starts[1:], len(order)]))
+
+    part = folder + ".part"
+    shutil.rmtree(part, ignore_errors=True)
+    os.makedirs(part)
+    for column in columns:
+        np.save(os.path.join(part, f"{column}.npy"), df[column].to_numpy()[order])
+    np.save(os.path.join(part, TILES_FILE), tiles)
+    write_fingerprint(part, {"url": url, "name": name, "columns": sorted(columns)})
+    shutil.rmtree(folder, ignore_errors=True)
+    os.replace(part, folder)
+
+def read_grid(dl: DownloadManager, dataset, year, url, name, zip_file_name, columns, area: Area):
+    # `columns` of the hectares of a geostat dataset with at least one square meter inside `area`. Only the tiles
+    # intersecting the area are read (memory-mapped), and the last areas read are kept in memory.
+    key = (dataset, year, url, area.x_min, area.x_max, area.y_min, area.y_max, tuple(columns))
+    if key in GRID_CACHE:
+        GRID_CACHE.move_to_end(key)
+        return GRID_CACHE[key].copy()
+
+    folder = os.path.join(GEOSTAT_FOLDER, f"{dataset}{year}")
+    saved = read_fingerprint(folder)
+    if saved is None or saved["params"]["url"] != url or not set(columns) <= set(saved["params"]["columns"]):
+        convert_grid(dl, url, name, zip_file_name, sorted(set(columns) | set(saved["params"]["columns"] if saved and saved["params"]["url"] == url else [])), folder)
+
+    tiles = np.load(os.path.join(folder, TILES_FILE))
+    # Tiles with a hectare (of 100 meters) that may intersect the area
+    selected = ((tiles[:, 0] + 1) * TILE_SIZE > area.x_min - 100) & (tiles[:, 0] * TILE_SIZE < area.x_max) & \
+               ((tiles[:, 1] + 1) * TILE_SIZE > area.y_min - 100) & (tiles[:, 1] * TILE_SIZE < area.y_max)
+    rows = np.concatenate([np.arange(start, end) for _, _, start, end in tiles[selected]] or [np.zeros(0, dtype=np.int64)])
+    df = pd.DataFrame({column: np.load(os.path.join(folder, f"{column}.npy"), mmap_mode="r")[rows] for column in columns})
+    df = df.loc[area.is_inside_hecto(X = df["E_KOORD"], Y = df["N_KOORD"])].reset_index(drop=True)
+
+    GRID_CACHE[key] = df
+    while len(GRID_CACHE) > GRID_CACHE_SIZE:
+        GRID_CACHE.popitem(last=False)
+    return df.copy()
+
+def jitter_offsets(precision):
+    # Offsets of the points a hectare can be jittered to (along each axis), as in `STAT.jitter`
+    if precision < 100:
+        return (np.arange(100 // precision) + 0.5) * precision
+    return np.array([50.0])
+
+def alias_table(masses):
+    # Walker alias table (Vose's method) of a discrete distribution proportional to `masses` : drawing a column i
+    # uniformly, then i with probability prob[i] and alias[i] otherwise, draws i with probability masses[i] / sum.
+    prob = (masses * (len(masses) / masses.sum())).tolist()
+    alias = list(range(len(masses)))
+    small = [i for i, p in enumerate(prob) if p < 1]
+    large = [i for i, p in enumerate(prob) if p >= 1]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        alias[s] = l
+        prob[l] -= 1 - prob[s]
+        (small if prob[l] < 1 else large).append(l)
+    # The remaining columns are full (up to rounding errors)
+    for i in small + large:
+        prob[i] = 1
+    return np.array(prob), np.array(alias)
+
+def splitmix64(values):
+    # Hash of uint64 values (splitmix64 finaliser), to derive pseudo-random numbers from identifiers
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+HECTARE = 100
+
+class DemandRaster:
+    # Dense raster of hectare weights (lower left corners `x`, `y`) on the 100 m grid, with its summed-area table :
+    # the sum of the weights of any rectangle of cells takes 4 lookups, and points can be drawn coarse-to-fine (by
+    # quadrants of quadrants... of the grid). Integer weights are summed exactly (int64).
+    def __init__(self, x, y, weights):
+        x, y, weights = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), np.nan_to_num(np.asarray(weights, dtype=np.float64))
+        self.x0 = x.min() if len(x) else 0.0
+        self.y0 = y.min() if len(y) else 0.0
+        i, j = self.cell(x, y)
+        shape = (int(i.max()) + 1, int(j.max()) + 1) if len(x) else (0, 0)
+        dtype = np.int64 if np.array_equal(weights, np.round(weights)) and np.abs(weights).sum() < 2**53 else np.float64
+        self.values = np.zeros(shape, dtype=dtype)
+        np.add.at(self.values, (i, j), weights.astype(dtype))
+        self.sat = np.zeros((shape[0] + 1, shape[1] + 1), dtype=dtype)
+        self.sat[1:, 1:] = self.values.cumsum(axis=0).cumsum(axis=1)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    def cell(self, x, y):
+        # Cell (row along x, column along y) of hectare corners
+        return np.round((x - self.x0) / HECTARE).astype(np.intp), np.round((y - self.y0) / HECTARE).astype(np.intp)
+
+    def cell_sum(self, i0, i1, j0, j1):
+        # Sum of the cells [i0, i1) x [j0, j1) (clipped to the grid)
+        i0, i1 = np.clip(i0, 0, self.shape[0]), np.clip(i1, 0, self.shape[0])
+        j0, j1 = np.clip(j0, 0, self.shape[1]), np.clip(j1, 0, self.shape[1])
+        i1, j1 = np.maximum(i0, i1), np.maximum(j0, j1)
+        return self.sat[i1, j1] - self.sat[i0, j1] - self.sat[i1, j0] + self.sat[i0, j0]
+
+    def rect_sum(self, x_min, x_max, y_min, y_max):
+        # Sum of the weights of the hectares intersecting rectangles (arrays of bounds, or single values)
+        i0 = np.floor((np.asarray(x_min) - self.x0) / HECTARE).astype(np.intp)
+        i1 = np.ceil((np.asarray(x_max) - self.x0) / HECTARE).astype(np.intp)
+        j0 = np.floor((np.asarray(y_min) - self.y0) / HECTARE).astype(np.intp)
+        j1 = np.ceil((np.asarray(y_max) - self.y0) / HECTARE).astype(np.intp)
+        return self.cell_sum(i0, i1, j0, j1)
+
+    def sum_around(self, x, y, radius):
+        # Sum of the weights of the hectares intersecting squares of half-side `radius` around points (e.g. catchments)
+        x, y = np.asarray(x), np.asarray(y)
+        return self.rect_sum(x - radius, x + radius, y - radius, y + radius)
+
+    def sample_cells(self, n, rng: np.random.Generator):
+        # `n` cells drawn proportionally to their weight (which must not be negative), coarse-to-fine : starting from a
+        # square block of 2^k cells covering the grid, each draw goes down one of the 4 quadrants of its block,
+        # proportionally to their sums, until it reaches a cell
+        size = 1 << int(np.ceil(np.log2(max(self.shape + (1, )))))
+        i, j = np.zeros(n, dtype=np.intp), np.zeros(n, dtype=np.intp)
+        while size > 1:
+            size //= 2
+            # Summed-area table at the corners and middles of the blocks, then sums of their quadrants
+            rows = [np.minimum(i + k * size, self.shape[0]) for k in range(3)]
+            columns = [np.minimum(j + k * size, self.shape[1]) for k in range(3)]
+            sat = [[self.sat[r, c] for c in columns] for r in rows]
+            low_low = sat[1][1] - sat[0][1] - sat[1][0] + sat[0][0]
+            low_high = sat[1][2] - sat[0][2] - sat[1][1] + sat[0][1]
+            high_low = sat[2][1] - sat[1][1] - sat[2][0] + sat[1][0]
+            high_high = sat[2][2] - sat[1][2] - sat[2][1] + sat[1][1]
+            # Quadrant of each draw, u falling in [0, low_low), [low_low, low_low + low_high)...
+            u = rng.random(n) * (low_low + low_high + high_low + high_high)
+            high = u >= low_low + low_high
+            u -= np.where(high, low_low + low_high, 0)
+            i += np.where(high, size, 0)
+            j += np.where(u >= np.where(high, high_low, low_low), size, 0)
+        return i, j
+
+class HectareSampler:
+    # Exact sampler of jittered points of hectares (lower left corners `x`, `y`), with probabilities proportional to
+    # `masses`, restricted to the points inside `area`. The area is a rectangle, so the jitter points of a hectare that
+    # are inside it are a range of offsets along each axis : each hectare is drawn (with an alias table) proportionally
+    # to its mass times its number of points inside, then one of these points uniformly. Nothing is rejected.
+    # With `method` "hierarchical", the hectares are drawn coarse-to-fine from a DemandRaster of these masses instead
+    # (the hectares must then be distinct).
+    def __init__(self, x, y, masses, area: Area, precision = 100, method = "alias"):
+        if method not in ("alias", "hierarchical"):
+            raise ValueError(f"`method` must be 'alias' or 'hierarchical', not '{method}'")
+        self.offsets = jitter_offsets(precision)
+        x, y, masses = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), np.nan_to_num(np.asarray(masses, dtype=np.float64))
+        if (masses < 0).any():
+            raise ValueError("The weights must not be negative")
+        # Range of the offsets inside the area (open bounds, as `Area.is_inside`)
+        x_start, x_count = self.inside_offsets(area.x_min - x, area.x_max - x)
+        y_start, y_count = self.inside_offsets(area.y_min - y, area.y_max - y)
+        masses = masses * x_count * y_count
+        if not masses.sum() > 0:
+            raise ValueError("No point can be generated : no weight inside the area")
+
+        kept = np.flatnonzero(masses > 0)
+        self.x, self.y = x[kept], y[kept]
+        self.x_start, self.x_count = x_start[kept], x_count[kept]
+        self.y_start, self.y_count = y_start[kept], y_count[kept]
+        if method == "alias":
+            self.raster = None
+            self.prob, self.alias = alias_table(masses[kept])
+        else:
+            self.raster = DemandRaster(self.x, self.y, masses[kept])
+            self.hectare_of_cell = np.zeros(self.raster.shape, dtype=np.intp)
+            self.hectare_of_cell[self.raster.cell(self.x, self.y)] = np.arange(len(kept))
+
+    def inside_offsets(self, low, high):
+        start = np.searchsorted(self.offsets, low, side="right")
+        return start, np.maximum(np.searchsorted(self.offsets, high, side="left") - start, 0)
+
+    def sample_hectares(self, n, rng: np.random.Generator):
+        # Positions (in the kept hectares) of `n` hectares drawn from the alias table (or the raster)
+        if self.raster is not None:
+            return self.hectare_of_cell[self.raster.sample_cells(n, rng)]
+        column = rng.integers(len(self.prob), size=n)
+        return np.where(rng.random(n) < self.prob[column], column, self.alias[column])
+
+    def sample(self, n, rng: np.random.Generator):
+        hectares = self.sample_hectares(n, rng)
+        points = np.empty((n, 2))
+        for axis, (corner, start, count) in enumerate([(self.x, self.x_start, self.x_count), (self.y, self.y_start, self.y_count)]):
+            offsets = start[hectares] + (rng.random(n) * count[hectares]).astype(np.intp)
+            points[:, axis] = corner[hectares] + self.offsets[offsets]
+        return points
 
 class STAT:
-    def __init__(self, area: Area, df: pd.DataFrame, default_weights = None):
-        self.df = df
+    def __init__(self, area: Area, df: pd.DataFrame = None, default_weights = None):
+        # `df` may be left out by subclasses that give it as a property
+        if df is not None:
+            self.df = df
         self.default_weights = default_weights
         self.area = area
+        # Samplers of `generate_n` (by weights column, precision and method) and rasters of `get_raster`
+        self.samplers = {}
+        self.rasters = {}
 
     def jitter(self, precision, n, seed=None):
         shape = (n, 2)
@@ -22,35 +239,39 @@ class STAT:
 
         return precision_array
 
-    def generate_n(self, n:int, precision_in_meter = 100, seed=None, weights = None, **kwargs):
-        if weights is None:
-            weights = self.default_weights
-
-        sample = self.df.sample(
-            n = 2*n, # 2*n because after we remove some points outside of the area area
-            replace = True,
-            weights = weights,
-            random_state=seed,
-            **kwargs
-        )
-
-        sample_array = sample[["POSITION_X", "POSITION_Y"]].to_numpy("float", copy=True)
-
-        sample_array += self.jitter(precision_in_meter, 2*n, seed)
+    def sampling_points(self, weights = None):
+        # Points the generated points are jittered from (x, y), and their masses (`weights` column, 1 if None)
+        masses = np.ones(len(self.df)) if weights is None else self.df[weights].to_numpy()
+        return self.df["POSITION_X"].to_numpy(), self.df["POSITION_Y"].to_numpy(), masses
 
-        # Remove points outside of area area
-        X, Y = sample_array.T
-        sample_array = sample_array[self.area.is_inside(X, Y)]
+    def get_sampler(self, precision_in_meter = 100, weights = None, method = "alias"):
+        # Sampler of `generate_n` (built once for each weights column, precision and method)
+        key = (weights, precision_in_meter, method)
+        if key not in self.samplers:
+            self.samplers[key] = HectareSampler(*self.sampling_points(weights), self.area, precision_in_meter, method)
+        return self.samplers[key]
 
-        # Take n first points
-        sample_array = sample_array[:n]
+    def get_raster(self, weights = None):
+        # DemandRaster of a weights column (the default one if None, the number of rows if neither), for sums over
+        # rectangles
+        if weights is None:
+            weights = self.default_weights
+        if weights not in self.rasters:
+            self.rasters[weights] = DemandRaster(*self.sampling_points(weights))
+        return self.rasters[weights]
 
-        return sample_array
+    def generate_n(self, n:int, precision_in_meter = 100, seed=None, weights = None, method = "alias"):
+        # Exactly `n` points inside the area : hectares drawn proportionally to `weights` (a column, uniform if there is
+        # no default either) with an alias table, or coarse-to-fine with `method` "hierarchical", then jittered with a
+        # precision of `precision_in_meter`
+        if weights is None:
+            weights = self.default_weights
+        return self.get_sampler(precision_in_meter, weights, method).sample(n, np.random.default_rng(seed))
 
     def generate_per_proportion(self, proportion: float,  *args, weights=None, **kwargs):
         if weights is None:
             weights = self.default_weights
-        return self.generate_n(int(proportion * self.df[weights].sum()), *args, weights=weights)
+        return self.generate_n(int(proportion * np.nansum(self.sampling_points(weights)[2])), *args, weights=weights, **kwargs)
     
     def plot(self, ax = None, type = "density"):
         if ax is None:
@@ -63,48 +284,42 @@ class STAT:
 class STATPOP (STAT):
     def __init__(self, area: Area, year = 2023, asset_number = 32686751, **kwargs):
         dl: DownloadManager = kwargs.get("download_manager", area.dl)
-        filename = dl.download_with_cache(
+        # Read the hectares inside the area (i.e. with at least one square meter inside the area) from the grid of the
+        # year (converted from the csv of the zip archive the first time)
+        df = read_grid(dl, "STATPOP", year,
             f"https://www.bfs.admin.ch/bfsstatic/dam/assets/{asset_number}/master",
             f"STATPOP{year}.csv",
-            zip=True,
-            zip_file_name=f"STATPOP{year}.csv",
-            method="GET"
+            f"STATPOP{year}.csv",
+            ["E_KOORD", "N_KOORD", "BBTOT"],
+            area
         )
 
-        df = pd.read_csv(filename, sep=";")
-
-        # Keep only hectares inside the area area(i.e. with at least one square meter inside the area)
-        df = df.loc[area.is_inside_hecto(X = df["E_KOORD"], Y = df["N_KOORD"])]
-
-        # Reframe the dataframe, keep only interesting columsn and rename them
-        df = df[["E_KOORD", "N_KOORD", "BBTOT"]].rename(columns = {
+        # Rename the interesting columns
+        df = df.rename(columns = {
             "E_KOORD": "POSITION_X",
             "N_KOORD": "POSITION_Y",
             "BBTOT": "POPULATION"
         })
 
         # Save the dataframe by running the super() call to __init__ :
-        super().__init__(area, df.copy(deep=True), default_weights="POPULATION")
+        super().__init__(area, df, default_weights="POPULATION")
 
 
 class STATENT(STAT):
     def __init__(self, area: Area, year = 2022, asset_number = 32258837, **kwargs):
         dl: DownloadManager = kwargs.get("download_manager", area.dl)
-        filename = dl.download_with_cache(
+        # Read the hectares inside the area (i.e. with at least one square meter inside the area) from the grid of the
+        # year (converted from the csv of the zip archive the first time)
+        df = read_grid(dl, "STATENT", year,
             f"https://www.bfs.admin.ch/bfsstatic/dam/assets/{asset_number}/master",
             f"STATENT{year}.csv",
-            zip=True,
-            zip_file_name=f"STATENT_{year}.csv",
-            method="GET"
+            f"STATENT_{year}.csv",
+            ["E_KOORD", "N_KOORD", "B0847AS", "B0847EMP", "B0847VZA", "B0847KB1", "B0847KB2", "B0847KB3", "B0847KB4"],
+            area
         )
 
-        df = pd.read_csv(filename, sep=";")
-        
-        # Keep only hectares inside the area area (i.e. with at least one square meter inside the area)
-        df = df.loc[area.is_inside_hecto(X = df["E_KOORD"], Y = df["N_KOORD"])]
-
-        # Reframe the dataframe, keep only interesting columsn and rename them
-        df = df[["E_KOORD", "N_KOORD", "B0847AS", "B0847EMP", "B0847VZA", "B0847KB1", "B0847KB2", "B0847KB3", "B0847KB4"]].rename(columns = {
+        # Rename the interesting columns
+        df = df.rename(columns = {
             "E_KOORD": "POSITION_X",
             "N_KOORD": "POSITION_Y",
             "B0847AS" : "SHOPS",
@@ -117,18 +332,85 @@ class STATENT(STAT):
         })
 
         # Save the dataframe by running the super() call to __init__ :
-        super().__init__(area, df.copy(deep=True), default_weights="SHOPS")
+        super().__init__(area, df, default_weights="SHOPS")
+
+    def get_entreprises(self, precision_in_meter = 100, seed=None):
+        # Enterprises of the hectares (SHOPS of them per hectare, sharing its SHOPS_EMP and SHOPS_ETP), jittered with
+        # a precision of `precision_in_meter`, and kept if they are inside the area. They are not expanded into rows :
+        # see `Enterprises`.
+        return Enterprises(self.area, self.df, precision_in_meter, seed)
+
+
+class Enterprises(STAT):
+    # Enterprises of STATENT hectares, described by the hectares only : the enterprises of hectare h are numbered from
+    # first[h] to first[h+1]-1, their SHOPS_EMP and SHOPS_ETP are the ones of the hectare divided by its number of
+    # enterprises, and their jitter is derived from their number (and the seed). The enterprises outside the area are
+    # left out. `df` gives them as rows (built when accessed), `generate_n` samples them without building it : the
+    # enterprises at the same position are sampled together (see `units`).
+    def __init__(self, area: Area, hectares: pd.DataFrame, precision_in_meter = 100, seed = None):
+        super().__init__(area, default_weights="SHOPS_ETP")
+        hectares = hectares.loc[hectares.SHOPS > 0]
+        self.x, self.y = hectares.POSITION_X.to_numpy(dtype=np.float64), hectares.POSITION_Y.to_numpy(dtype=np.float64)
+        self.count = hectares.SHOPS.to_numpy(dtype=np.int64)
+        self.first = np.concatenate([[0], np.cumsum(self.count)])
+        self.weights = {column: hectares[column].to_numpy(dtype=np.float64) / self.count for column in ["SHOPS_EMP", "SHOPS_ETP"]}
+        self.offsets = jitter_offsets(precision_in_meter)
+        self.key = np.random.SeedSequence(seed).generate_state(1, np.uint64)[0]
+        self._units = None
+
+    def __len__(self):
+        # Number of enterprises (including the ones outside the area)
+        return int(self.first[-1])
+
+    def jitter_indices(self, enterprises):
+        # Indices (in `self.offsets`) of the jitter of enterprises along each axis
+        z = splitmix64(np.asarray(enterprises, dtype=np.uint64) ^ self.key)
+        n_offsets = np.uint64(len(self.offsets))
+        return ((z & np.uint64(0xFFFFFFFF)) % n_offsets).astype(np.intp), ((z >> np.uint64(32)) % n_offsets).astype(np.intp)
+
+    def positions(self, enterprises, hectares = None):
+        # Jittered positions of enterprises (their numbers, and optionally their hectares)
+        if hectares is None:
+            hectares = np.searchsorted(self.first, enterprises, side="right") - 1
+        i, j = self.jitter_indices(enterprises)
+        return self.x[hectares] + self.offsets[i], self.y[hectares] + self.offsets[j]
+
+    def units(self):
+        # Distinct positions of the enterprises inside the area : their hectare, position and number of enterprises
+        if self._units is None:
+            hectares = np.repeat(np.arange(len(self.count)), self.count)
+            i, j = self.jitter_indices(np.arange(len(self)))
+            codes, counts = np.unique((hectares * len(self.offsets) + i) * len(self.offsets) + j, return_counts=True)
+            hectares = codes // len(self.offsets)**2
+            x = self.x[hectares] + self.offsets[codes // len(self.offsets) % len(self.offsets)]
+            y = self.y[hectares] + self.offsets[codes % len(self.offsets)]
+            inside = self.area.is_inside(x, y)
+            self._units = hectares[inside], x[inside], y[inside], counts[inside]
+        return self._units
 
-    def get_entreprises(self, precision_in_meter = 100, seed=None): 
-        sample_df = self.df.loc[self.df.index.repeat(self.df.SHOPS)].reset_index(drop=True).copy(deep=True)
-        
-        sample_df[["SHOPS_EMP", "SHOPS_ETP"]] = sample_df[["SHOPS_EMP", "SHOPS_ETP"]].div(sample_df["SHOPS"], axis="index")
-        columns_to_keep = ["POSITION_X", "POSITION_Y", "SHOPS_EMP", "SHOPS_ETP"]
-        sample_df = sample_df[columns_to_keep]
+    @property
+    def df(self):
+        hectares = np.repeat(np.arange(len(self.count)), self.count)
+        x, y = self.positions(np.arange(len(self)), hectares)
+        inside = self.area.is_inside(x, y)
+        return pd.DataFrame({"POSITION_X": x[inside], "POSITION_Y": y[inside],
+                             **{column: values[hectares[inside]] for column, values in self.weights.items()}})
 
-        sample_df[["POSITION_X", "POSITION_Y"]] += self.jitter(precision_in_meter, len(sample_df))
+    def sampling_points(self, weights = None):
+        # The distinct positions of the enterprises, with the total weight of their enterprises
+        hectares, x, y, counts = self.units()
+        return x, y, counts if weights is None else self.weights[weights][hectares] * counts
 
-        # Remove those that are not in the area area
-        sample_df = sample_df.loc[self.area.is_inside(sample_df.POSITION_X, sample_df.POSITION_Y)]
+    def get_sampler(self, precision_in_meter = 100, weights = None, method = "alias"):
+        # The positions of the enterprises are on the grid of hectares only if they are all at the same offset
+        if method == "hierarchical" and len(self.offsets) > 1:
+            raise ValueError("The enterprises can only be sampled with `method` 'hierarchical' if they were generated with a precision of 100")
+        return super().get_sampler(precision_in_meter, weights, method)
 
-        return STAT(self.area, sample_df, "SHOPS_ETP")
\ No newline at end of file
+    def get_raster(self, weights = None):
+        # DemandRaster of the total weight of the enterprises of each hectare (their number if `weights` is None),
+        # without building `df`
+        if weights not in self.rasters:
+            masses = self.count if weights is None else self.weights[weights] * self.count
+            self.rasters[weights] = DemandRaster(self.x, self.y, masses)
+        return self.rasters[weights]
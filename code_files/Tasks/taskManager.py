@@ -5,6 +5,20 @@ import matplotlib.pyplot as plt
 from ..area import Area
 from .geostat import STATENT, STATPOP
 from ..PublicTransport.linedata import LineData, LinesData
+from ..PublicTransport.columnar import TableWriter, infer_dtypes
+from ..PublicTransport.routing import QUERY_BATCH_SIZE, ConnectionScan
+from ..PublicTransport.stopindex import StopIndex
+
+# Number of tasks per chunk of `TaskManager.iter_improvement` and `TaskManager.iter_tasks`
+TASK_CHUNK_SIZE = 1 << 18
+# Number of tasks generated with the same seeds : the tasks do not depend on how they are chunked
+TASK_BLOCK_SIZE = 1 << 16
+
+def block_seeds(random_seed, block):
+    # Seeds of the customers and of the shops of a block of tasks : the two children of the `block`-th child of
+    # SeedSequence(random_seed) (as given by `spawn`), built directly so that any block can be generated alone
+    root = random_seed if isinstance(random_seed, np.random.SeedSequence) else np.random.SeedSequence(random_seed)
+    return np.random.SeedSequence(root.entropy, spawn_key=root.spawn_key + (block, ), pool_size=root.pool_size).spawn(2)
 
 class TaskManager:
     def __init__(self, area: Area, precision_in_meters = 1, random_seed = None):
@@ -19,48 +33,120 @@ class TaskManager:
         self.customers = STATPOP(area)
 
     def get_tasks(self, n, random_seed = None):
-        demand = self.customers.generate_n(n, self.precision_in_meters, seed=random_seed) # Here precision serves to generate random customers
-        supply = self.shops.generate_n(n, seed=random_seed) # No need to add a precision here, already done in __init__
+        # `n` tasks at once (the same as the chunks of `iter_tasks` put together)
+        return pd.concat(self.iter_tasks(n, random_seed, chunk_size=max(n, 1)))
 
-        tasks = pd.DataFrame(np.hstack((supply, demand)), columns=["pickup_x", "pickup_y", "delivery_x", "delivery_y"])
-        tasks["distance"] = ((tasks["delivery_x"] - tasks["pickup_x"])**2 + (tasks["delivery_y"] - tasks["pickup_y"])**2)**0.5
+    def get_task_block(self, block, n, random_seed):
+        # Tasks of block `block` (tasks block * TASK_BLOCK_SIZE to (block + 1) * TASK_BLOCK_SIZE - 1, the last block
+        # being cut at `n`), with their own seeds for the customers and the shops. `random_seed` must be the same for all
+        # the blocks (an int or a SeedSequence, not None).
+        start = block * TASK_BLOCK_SIZE
+        size = min(TASK_BLOCK_SIZE, n - start)
+        customer_seed, shop_seed = block_seeds(random_seed, block)
+        demand = self.customers.generate_n(size, self.precision_in_meters, seed=customer_seed) # Here precision serves to generate random customers
+        supply = self.shops.generate_n(size, seed=shop_seed) # No need to add a precision here, already done in __init__
 
+        tasks = pd.DataFrame({"pickup_x": supply[:, 0], "pickup_y": supply[:, 1], "delivery_x": demand[:, 0], "delivery_y": demand[:, 1]},
+                             index=pd.RangeIndex(start, start + size))
+        tasks["distance"] = ((tasks["delivery_x"] - tasks["pickup_x"])**2 + (tasks["delivery_y"] - tasks["pickup_y"])**2)**0.5
         return tasks
-    
-    def compute_improvement(self, tasks: pd.DataFrame, lines : LineData | LinesData):
-        tasks = tasks.copy(deep=True)
-        try :
-            len(lines)
-        except TypeError:
-            lines = LinesData(lines)
-        pickup_stop_x = np.zeros((len(tasks), len(lines)))
-        pickup_stop_y = np.zeros((len(tasks), len(lines)))
-        delivery_stop_x = np.zeros((len(tasks), len(lines)))
-        delivery_stop_y = np.zeros((len(tasks), len(lines)))
-        distance_transport = np.full((len(tasks), len(lines)), np.inf)
-        line_names = np.zeros(len(lines), dtype=object)
-        for i, line in enumerate(lines.values()):
-            line_names[i] = str(line.line_name)
-            pickup_stop_x[:, i], pickup_stop_y[:, i] = line.get_nearest_stops(tasks.pickup_x.values, tasks.pickup_y.values)
-            delivery_stop_x[:, i], delivery_stop_y[:, i] = line.get_nearest_stops(tasks.delivery_x.values, tasks.delivery_y.values)
-        
-            distance_transport[:, i] = ((pickup_stop_x[:, i] - tasks["pickup_x"])**2 + (pickup_stop_y[:, i] - tasks["pickup_y"])**2)**0.5 \
-                                        + ((delivery_stop_x[:, i] - tasks["delivery_x"])**2 + (delivery_stop_y[:, i] - tasks["delivery_y"])**2)**0.5
-        idx = np.argmin(distance_transport, axis= 1)
-        tasks["pickup_stop_x"] = pickup_stop_x[np.arange(len(tasks)), idx]
-        tasks["pickup_stop_y"] = pickup_stop_y[np.arange(len(tasks)), idx]
-        tasks["delivery_stop_x"] = delivery_stop_x[np.arange(len(tasks)), idx]
-        tasks["delivery_stop_y"] = delivery_stop_y[np.arange(len(tasks)), idx]
-        tasks["distance_transport"] = distance_transport[np.arange(len(tasks)), idx]
-        
-        tasks["improvement"] = tasks["distance"] - tasks["distance_transport"]
-        tasks["line"] = line_names[idx]
-        tasks["line"] = tasks["line"].where(tasks["improvement"] > 0, "Direct")
 
-        return tasks
+    def iter_tasks(self, n, random_seed = None, chunk_size = TASK_CHUNK_SIZE, blocks = None):
+        # `n` tasks, yielded by chunks of `chunk_size` (the last one can be smaller), indexed by their number. They are
+        # generated by blocks of TASK_BLOCK_SIZE (see `get_task_block`), so they only depend on `random_seed` : not on
+        # `chunk_size`, nor on which worker generates which blocks (`blocks`, all of them by default, e.g.
+        # range(worker, n_blocks, n_workers)), as long as they are given the same `random_seed` (with None, the
+        # tasks are only the same within one call). The chunks can be given to `compute_improvement`.
+        root = random_seed if isinstance(random_seed, np.random.SeedSequence) else np.random.SeedSequence(random_seed)
+        if blocks is None:
+            blocks = range(-(-n // TASK_BLOCK_SIZE))
+        # Tasks generated but not yielded yet (less than `chunk_size`, plus the last block)
+        pending, n_pending = [], 0
+        for block in blocks:
+            pending.append(self.get_task_block(block, n, root))
+            n_pending += len(pending[-1])
+            if n_pending >= chunk_size:
+                tasks = pd.concat(pending)
+                end = n_pending - n_pending % chunk_size
+                for start in range(0, end, chunk_size):
+                    yield tasks.iloc[start:start + chunk_size]
+                pending, n_pending = [tasks.iloc[end:]], n_pending - end
+        if n_pending > 0 or n == 0:
+            yield pd.concat(pending) if pending else self.get_task_block(0, 0, root)
+
+    def compute_improvement(self, tasks: pd.DataFrame, lines : LineData | LinesData | StopIndex, cutoff = None, chunk_size = TASK_CHUNK_SIZE, dtype = np.float64, output = None):
+        # Best line of each task (its nearest stops to the pickup and the delivery), found with a StopIndex of the lines
+        # (one can be given to reuse it between calls). Without `cutoff`, every line is considered. With `cutoff`
+        # (meters), only the lines with a stop within `cutoff` of both ends of a task are (the other tasks are
+        # "Direct", without stops) : this is faster, the tasks far from the lines being left out early.
+        # The tasks are processed by chunks of `chunk_size` (see `iter_improvement`). With `output` (a path without
+        # extension), the chunks are written to a columnar file as they are computed, and nothing is returned.
+        chunks = self.iter_improvement(tasks, lines, cutoff=cutoff, chunk_size=chunk_size, dtype=dtype)
+        if output is None:
+            return pd.concat(chunks)
+        writer = None
+        for chunk in chunks:
+            if writer is None:
+                writer = TableWriter(output, infer_dtypes(chunk))
+            writer.write(chunk)
+        if writer is not None:
+            writer.close()
+
+    def iter_improvement(self, tasks: pd.DataFrame, lines : LineData | LinesData | StopIndex, cutoff = None, chunk_size = TASK_CHUNK_SIZE, dtype = np.float64):
+        # Same as `compute_improvement`, yielding the tasks by chunks of `chunk_size` with their improvement columns.
+        # `tasks` can also be an iterable of DataFrames (e.g. `iter_tasks`), each of them being chunked in turn.
+        # With `dtype` np.float32, the new columns are stored as float32 (the distances are still computed in float64,
+        # as the coordinates are too large for float32 to keep them to the meter).
+        index = lines if isinstance(lines, StopIndex) else StopIndex(lines)
+        line_names = np.append(index.line_names, "Direct")
+        # Buffers of the improvement and of the "Direct" tasks, reused for every chunk
+        improvement = np.empty(0)
+        direct = np.empty(0, dtype=bool)
+
+        for batch in [tasks] if isinstance(tasks, pd.DataFrame) else tasks:
+            pickup_x, pickup_y = batch["pickup_x"].to_numpy(dtype=np.float64), batch["pickup_y"].to_numpy(dtype=np.float64)
+            delivery_x, delivery_y = batch["delivery_x"].to_numpy(dtype=np.float64), batch["delivery_y"].to_numpy(dtype=np.float64)
+            distance = batch["distance"].to_numpy(dtype=np.float64)
+            if len(improvement) < min(chunk_size, len(batch)):
+                improvement = np.empty(min(chunk_size, len(batch)))
+                direct = np.empty(len(improvement), dtype=bool)
+
+            for start in range(0, max(len(batch), 1), chunk_size):
+                end = min(start + chunk_size, len(batch))
+                n = end - start
+                line, pickup_stop_x, pickup_stop_y, delivery_stop_x, delivery_stop_y, distance_transport = index.best_lines(
+                    pickup_x[start:end], pickup_y[start:end], delivery_x[start:end], delivery_y[start:end], cutoff=cutoff)
+                np.subtract(distance[start:end], distance_transport, out=improvement[:n])
+                np.greater(improvement[:n], 0, out=direct[:n])
+                np.logical_not(direct[:n], out=direct[:n])
+                line[direct[:n]] = -1
+
+                yield batch.iloc[start:end].assign(
+                    pickup_stop_x = pickup_stop_x.astype(dtype, copy=False),
+                    pickup_stop_y = pickup_stop_y.astype(dtype, copy=False),
+                    delivery_stop_x = delivery_stop_x.astype(dtype, copy=False),
+                    delivery_stop_y = delivery_stop_y.astype(dtype, copy=False),
+                    distance_transport = distance_transport.astype(dtype, copy=False),
+                    improvement = improvement[:n].astype(dtype),
+                    line = line_names[line])
+
+    def compute_transit(self, tasks: pd.DataFrame, engine: ConnectionScan, departures, batch_size = QUERY_BATCH_SIZE):
+        # Timetable-aware evaluation of the tasks : each task leaves the stop nearest to its pickup at `departures`
+        # (seconds since the start of the service day of the engine, one per task or the same for all), and arrives as
+        # early as possible at the stop nearest to its delivery, with transfers (NaN if it cannot).
+        pickup_stop, pickup_stop_distance = engine.nearest_stops(tasks["pickup_x"].values, tasks["pickup_y"].values)
+        delivery_stop, delivery_stop_distance = engine.nearest_stops(tasks["delivery_x"].values, tasks["delivery_y"].values)
+        departures = np.broadcast_to(np.asarray(departures, dtype=np.int32), (len(tasks), ))
+        arrivals = engine.earliest_arrival(pickup_stop, departures, delivery_stop, batch_size=batch_size)
+        return tasks.assign(
+            pickup_stop = pickup_stop,
+            pickup_stop_distance = pickup_stop_distance,
+            delivery_stop = delivery_stop,
+            delivery_stop_distance = delivery_stop_distance,
+            departure_time = departures,
+            arrival_time = arrivals,
+            transit_time = arrivals - departures)
 
-            
-    
     def plot(self, ax = None, tasks: pd.DataFrame = None, with_lines = False):
         if ax is None:
             fig, ax = self.area.plot()
@@ -1,4 +1,4 @@
 from code_files.area import Area
 from code_files.PublicTransport.processing import TransportData
-from code_files.PublicTransport.linedata import LineData, LinesData
+from code_files.PublicTransport.linedata import LineData, LinesCatalog, LinesData
 from code_files.Tasks.taskManager import TaskManager
\ No newline at end of file
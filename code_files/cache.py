@@ -0,0 +1,186 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST_FILE = os.path.join("raw_data", "manifest.json")
+HASH_CHUNK_SIZE = 1 << 20
+
+def file_checksum(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+class DownloadCache:
+    # Manifest of the downloaded artifacts : {path: {"size", "mtime", "sha256", "url", "etag", "last_modified", "last_access", "verified"}}
+    # The checksum is only computed when needed (deduplication, or verification of a file modified since it was registered).
+    # Files registered without being checked against the server (see `DownloadManager.adopt`) are not "verified".
+    def __init__(self, manifest_file = MANIFEST_FILE, budget = None):
+        self.manifest_file = manifest_file
+        self.budget = budget
+        self.lock = threading.RLock()
+
+        self.entries = {}
+        if os.path.isfile(manifest_file):
+            with open(manifest_file) as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        with self.lock:
+            os.makedirs(os.path.dirname(self.manifest_file) or ".", exist_ok=True)
+            with open(self.manifest_file + ".tmp", "w") as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(self.manifest_file + ".tmp", self.manifest_file)
+
+    def now(self):
+        return datetime.datetime.now().isoformat(timespec="seconds")
+
+    def checksum(self, path):
+        with self.lock:
+            entry = self.entries[os.path.normpath(path)]
+            if entry.get("sha256") is None:
+                entry["sha256"] = file_checksum(path)
+            return entry["sha256"]
+
+    def is_valid(self, path, verify = False):
+        # A file is a valid cache hit if it is registered, exists and has the size it had when it was registered.
+        # Files present before the manifest existed are not (they may be truncated) : see `DownloadManager.adopt`.
+        path = os.path.normpath(path)
+        if not os.path.isfile(path):
+            return False
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return False
+            if stat.st_size != entry["size"]:
+                return False
+            if (verify or stat.st_mtime != entry["mtime"]) and entry.get("sha256") is not None:
+                if file_checksum(path) != entry["sha256"]:
+                    return False
+                entry["mtime"] = stat.st_mtime
+            return True
+
+    def is_registered(self, path):
+        with self.lock:
+            return os.path.normpath(path) in self.entries
+
+    def is_verified(self, path):
+        with self.lock:
+            return self.entries.get(os.path.normpath(path), {}).get("verified", True)
+
+    def touch(self, path):
+        with self.lock:
+            if (entry := self.entries.get(os.path.normpath(path))) is not None:
+                entry["last_access"] = self.now()
+
+    def find(self, url):
+        # Return a valid cached file downloaded from `url` (the most recent one), if any
+        with self.lock:
+            candidates = [(entry["last_access"], path) for path, entry in self.entries.items() if entry.get("url") == url]
+        for _, path in sorted(candidates, reverse=True):
+            with self.lock:
+                if self.is_valid(path) and (entry := self.entries.get(path)) is not None:
+                    return path, dict(entry)
+
+    def add(self, path, url = None, etag = None, last_modified = None, deduplicate = True, verified = True):
+        path = os.path.normpath(path)
+        stat = os.stat(path)
+        with self.lock:
+            self.entries[path] = {
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+                "sha256": None,
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "last_access": self.now(),
+                "verified": verified
+            }
+            if deduplicate:
+                self.deduplicate(path)
+            self.save()
+
+    def link(self, source, path, **entry):
+        # Make `path` a hard link to the cached `source` (copying its manifest entry)
+        source, path = os.path.normpath(source), os.path.normpath(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.lexists(path):
+            os.remove(path)
+        os.link(source, path)
+        with self.lock:
+            self.entries[path] = dict(self.entries[source], last_access=self.now(), **entry)
+            self.save()
+
+    def deduplicate(self, path):
+        # Replace `path` by a hard link if an identical payload is already cached
+        entry = self.entries[path]
+        same_size = [p for p, e in self.entries.items() if p != path and e["size"] == entry["size"] and os.path.isfile(p)]
+        if not same_size:
+            return
+        checksum = self.checksum(path)
+        for other in same_size:
+            if os.path.samefile(other, path):
+                continue
+            if self.checksum(other) == checksum:
+                tmp_path = path + ".link"
+                try:
+                    os.link(other, tmp_path)
+                except OSError:
+                    # Different file systems (or no hard links) : keep both copies
+                    return
+                os.replace(tmp_path, path)
+                entry["mtime"] = os.stat(path).st_mtime
+                self.entries[other]["mtime"] = entry["mtime"]
+                return
+
+    def disk_usage(self):
+        # Size of the cached files, counting the hard links to the same file only once
+        inodes = {}
+        with self.lock:
+            for path, entry in self.entries.items():
+                if os.path.isfile(path):
+                    stat = os.stat(path)
+                    inodes[(stat.st_dev, stat.st_ino)] = stat.st_size
+        return sum(inodes.values())
+
+    def evict(self, budget = None, protect = ()):
+        # Remove the least recently used files until the cache fits in `budget` bytes
+        budget = budget if budget is not None else self.budget
+        if budget is None:
+            return []
+        protect = {os.path.normpath(p) for p in protect if p}
+
+        with self.lock:
+            # Drop the entries of files removed by hand
+            for path in [p for p in self.entries if not os.path.isfile(p)]:
+                del self.entries[path]
+
+            # Group the hard links of a same file : the space is only freed once all of them are removed
+            groups = {}
+            for path, entry in self.entries.items():
+                stat = os.stat(path)
+                group = groups.setdefault((stat.st_dev, stat.st_ino), {"size": stat.st_size, "paths": [], "last_access": ""})
+                group["paths"].append(path)
+                group["last_access"] = max(group["last_access"], entry["last_access"])
+
+            usage = sum(group["size"] for group in groups.values())
+            removed = []
+            for group in sorted(groups.values(), key=lambda g: g["last_access"]):
+                if usage <= budget:
+                    break
+                if protect.intersection(group["paths"]):
+                    continue
+                for path in group["paths"]:
+                    os.remove(path)
+                    del self.entries[path]
+                    removed.append(path)
+                usage -= group["size"]
+            self.save()
+
+        if removed:
+            print(f"Evicted {len(removed)} file{'' if len(removed)==1 else 's'} from the download cache: {', '.join(removed)}")
+        return removed
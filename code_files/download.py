@@ -1,19 +1,110 @@
 import pandas as pd
 import datetime
+import email.utils
+import json
 import os
-import urllib.request
+import re
+import string
+import shutil
+import threading
+import warnings
+import http.client
 import urllib.error
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
 from zipfile import ZipFile, BadZipFile
 
+from .cache import DownloadCache, MANIFEST_FILE
+
 ZIP_FOLDER = os.path.join("raw_data", "0_zip")
 DOWNLOAD_FOLDER = os.path.join("raw_data", "1_downloaded")
+PROBE_INDEX_FILE = os.path.join("raw_data", "probe_index.json")
 PRE_PROCESSED_FOLDER = "Pre-processed"
 SIMPLE_FOLDER = "TP_Simple"
 
+PART_SUFFIX = ".part"
+CHUNK_SIZE = 1 << 20
+MAX_REDIRECTS = 10
+
+class ConnectionPool:
+    # Keep-alive HTTP(S) connections, shared between threads and keyed by (scheme, host, port)
+    def __init__(self, timeout = 60):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    def acquire(self, scheme, netloc):
+        with self.lock:
+            connections = self.idle.get((scheme, netloc))
+            if connections:
+                return connections.pop(), True
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout), False
+        elif scheme == "http":
+            return http.client.HTTPConnection(netloc, timeout=self.timeout), False
+        raise ValueError(f"Unsupported URL scheme '{scheme}'")
+
+    def release(self, scheme, netloc, connection):
+        with self.lock:
+            self.idle.setdefault((scheme, netloc), []).append(connection)
+
+    def request(self, method, url, headers = None):
+        # Send the request, following redirects. The response body must be read entirely before calling `.close_response`
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS):
+            parts = urllib.parse.urlsplit(url)
+            path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+            connection, reused = self.acquire(parts.scheme, parts.netloc)
+            try:
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.BadStatusLine):
+                connection.close()
+                if not reused:
+                    raise
+                # The server closed an idle keep-alive connection : retry on a new one
+                connection, _ = self.acquire(parts.scheme, parts.netloc)
+                try:
+                    connection.request(method, path, headers=headers)
+                    response = connection.getresponse()
+                except BaseException:
+                    connection.close()
+                    raise
+            response.pool_key = (parts.scheme, parts.netloc, connection)
+
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                response.read()
+                self.close_response(response)
+                url = urllib.parse.urljoin(url, response.getheader("Location"))
+                if response.status == 303:
+                    method = "GET"
+                continue
+            response.url = url
+            return response
+        raise urllib.error.URLError(f"Too many redirects for {url}")
+
+    def close_response(self, response):
+        scheme, netloc, connection = response.pool_key
+        if response.will_close or not response.isclosed():
+            connection.close()
+        else:
+            self.release(scheme, netloc, connection)
+
 class DownloadManager:
-    def __init__(self, zip_folder = ZIP_FOLDER, download_folder = DOWNLOAD_FOLDER):
+    def __init__(self, zip_folder = ZIP_FOLDER, download_folder = DOWNLOAD_FOLDER, probe_index_file = PROBE_INDEX_FILE, manifest_file = MANIFEST_FILE, cache_budget = None, max_workers = 8, retries = 3, missing_ttl = datetime.timedelta(hours=6)):
         self.zip_folder = zip_folder
         self.download_folder = download_folder
+        # Cached files, and disk budget (in bytes) beyond which the least recently used ones are removed
+        self.cache = DownloadCache(manifest_file, cache_budget)
+        self.max_workers = max_workers
+        self.retries = retries
+        self.pool = ConnectionPool()
+        self.lock = threading.Lock()
+
+        # Results of the previous existence checks, {url: {"exists": bool, "timestamp": str}}, loaded when needed
+        self.probe_index_file = probe_index_file
+        self.probe_index = None
+        self.missing_ttl = missing_ttl
 
         # Create folders if they do not exist yet
         os.makedirs(zip_folder, exist_ok=True)
@@ -21,101 +112,346 @@ class DownloadManager:
 
     def get_path(self, filename):
         return os.path.join(self.download_folder, filename)
-    
-    def is_file_downloaded(self, filename):
-        return os.path.isfile(self.get_path(filename))
-    
-    def get_latest_downloaded(self, name, date = datetime.datetime.today().date): 
+
+    def get_latest_downloaded(self, name, date = None):
+        if date is None:
+            date = datetime.date.today()
         if not isinstance(date, datetime.date):
             date = datetime.date(*date)
 
-        def generator(name, date):
-            while date > datetime.date(1900, 1, 1):
-                yield name.format(date=date), date
-                date = date - datetime.timedelta(days=1)
-        for try_name, date in generator(name, date):
-            save_path = os.path.join(self.download_folder, try_name)
-            if os.path.isfile(save_path):
-                return save_path, date
-    
-    def get_latest_date(self, url, date = datetime.datetime.today().date, method="HEAD", verbose = 1):
+        # Build a regex from `name` (e.g. "Timetable_{date}.csv") and parse the dates of the files already there
+        pattern, date_formats = "", []
+        for literal, field, spec, _ in string.Formatter().parse(name):
+            pattern += re.escape(literal)
+            if field is not None:
+                pattern += "(.+?)"
+                date_formats.append(spec or "%Y-%m-%d")
+        pattern = re.compile(pattern + "$")
+        if not date_formats:
+            # No date in the name : the file itself, if it was downloaded (without a date)
+            path = os.path.join(self.download_folder, name)
+            return (path, None) if os.path.isfile(path) else None
+
+        found = []
+        for filename in os.listdir(self.download_folder):
+            match = pattern.match(filename)
+            if match is None:
+                continue
+            try:
+                file_date = datetime.datetime.strptime(match.group(1), date_formats[0]).date()
+            except ValueError:
+                continue
+            if file_date <= date and os.path.isfile(os.path.join(self.download_folder, filename)):
+                found.append((file_date, filename))
+        if found:
+            file_date, filename = max(found)
+            return os.path.join(self.download_folder, filename), file_date
+
+    def load_probe_index(self):
+        if self.probe_index is None:
+            self.probe_index = {}
+            if os.path.isfile(self.probe_index_file):
+                with open(self.probe_index_file) as f:
+                    self.probe_index = json.load(f)
+        return self.probe_index
+
+    def save_probe_index(self):
+        with self.lock:
+            index = dict(self.load_probe_index())
+            os.makedirs(os.path.dirname(self.probe_index_file) or ".", exist_ok=True)
+            with open(self.probe_index_file + ".tmp", "w") as f:
+                json.dump(index, f, indent=1)
+            os.replace(self.probe_index_file + ".tmp", self.probe_index_file)
+
+    def record_probe(self, url, exists):
+        with self.lock:
+            self.load_probe_index()[url] = {"exists": exists, "timestamp": datetime.datetime.now().isoformat(timespec="seconds")}
+
+    def cached_probe(self, url):
+        # Existing files are assumed to stay available, missing ones are checked again once `self.missing_ttl`
+        # has passed (they may have been published since). Returns None if the index cannot tell.
+        entry = self.load_probe_index().get(url)
+        if entry is not None:
+            if entry["exists"] or datetime.datetime.now() - datetime.datetime.fromisoformat(entry["timestamp"]) < self.missing_ttl:
+                return entry["exists"]
+
+    def probe(self, url, method = "HEAD", verbose = 1):
+        # Check whether `url` exists, using the probe index when possible
+        if (exists := self.cached_probe(url)) is not None:
+            return exists
+
+        # With GET, only ask for the first byte
+        response = self.pool.request(method, url, {"Range": "bytes=0-0"} if method == "GET" else {})
+        response.read()
+        self.pool.close_response(response)
+        if response.status not in (200, 206, 404, 410):
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+        exists = response.status in (200, 206)
+        if not exists and verbose > 0:
+            print(f"File not found at {url} ({response.status} {response.reason}).")
+        self.record_probe(url, exists)
+        return exists
+
+    def probe_dates(self, url, dates, method = "HEAD", verbose = 1, stop_on = None):
+        # Probe several dates at once, returns a dict {date: exists}.
+        # If `stop_on` is given, the dates after the first one known from the index to have that result are skipped.
+        if stop_on is not None:
+            cached = [self.cached_probe(url.format(date=date)) for date in dates]
+            if stop_on in cached:
+                dates = dates[:cached.index(stop_on) + 1]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(lambda date: self.probe(url.format(date=date), method, verbose), dates))
+        self.save_probe_index()
+        return dict(zip(dates, results))
+
+    def get_latest_date(self, url, date = None, method="HEAD", verbose = 1, min_date = datetime.date(1900, 1, 1)):
+        # Galloping search backwards from `date` (1, 2, 4, 8... days before) for a first existing date, then every date
+        # between it and `date` is probed (newest first), as files can be missing for some days (gaps in the feed).
+        # Each round probes up to `self.max_workers` dates concurrently, and the dates known from the probe index are
+        # not probed again.
+        if date is None:
+            date = datetime.date.today()
         if not isinstance(date, datetime.date):
             date = datetime.date(*date)
 
-        def generator(url, date):
-            while date > datetime.date(1900, 1, 1):
-                yield url.format(date=date), date
-                date = date - datetime.timedelta(days=1)
+        # Galloping search
+        existing = None
+        offset = 0
+        while existing is None and date - datetime.timedelta(days=offset) >= min_date:
+            offsets = []
+            while len(offsets) < self.max_workers and date - datetime.timedelta(days=offset) >= min_date:
+                offsets.append(offset)
+                offset = 2 * offset if offset > 0 else 1
+            results = self.probe_dates(url, [date - datetime.timedelta(days=o) for o in offsets], method, verbose, stop_on=True)
+            existing = next((try_date for try_date, exists in results.items() if exists), None)
+        if existing is None:
+            if verbose > 0:
+                print(f"No file found for {url} between {min_date} and {date}")
+            return None
+
+        # Newest existing date between `existing` and `date`
+        dates = [date - datetime.timedelta(days=o) for o in range((date - existing).days)]
+        for start in range(0, len(dates), self.max_workers):
+            results = self.probe_dates(url, dates[start:start + self.max_workers], method, verbose)
+            newer = [try_date for try_date, exists in results.items() if exists]
+            if newer:
+                existing = max(newer)
+                break
 
-        for try_url, date in generator(url, date):
-            request = urllib.request.Request(try_url, method=method)
+        if verbose > 0 and existing != date:
+            print(f"Latest file found for {url} : {existing}")
+        return existing
+
+    def fetch(self, url, save_path, headers = None):
+        # Download `url` to `save_path` through a ".part" file, resuming it with a Range request if it already exists.
+        # The file is only renamed to `save_path` once complete. Returns the (read) response.
+        os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+        part_path = save_path + PART_SUFFIX
+
+        for attempt in range(self.retries + 1):
+            offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+            # Conditional headers (`headers`) are only sent for a fresh download
+            request_headers = {"Range": f"bytes={offset}-"} if offset > 0 else dict(headers or {})
+            response = None
             try:
-                with urllib.request.urlopen(request) as response:
-                    if response.status == 200:  # URL exists
-                        return date
-            except urllib.error.HTTPError as e:
-                print(e)
-                if verbose >0 :
-                    print(f"File not found at {try_url} ({e}). Current date : {date}. Trying an earlier date.")
-                continue
+                response = self.pool.request("GET", url, request_headers)
+                if response.status == 304:
+                    # Not modified : nothing to download
+                    response.read()
+                    return response
+                if response.status == 416:
+                    response.read()
+                    # Nothing left to download if the ".part" file has the size of the file on the server
+                    total = re.fullmatch(r"bytes \*/(\d+)", response.getheader("Content-Range") or "")
+                    if offset > 0 and total is not None and int(total.group(1)) == offset:
+                        break
+                    if offset == 0:
+                        raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+                    # Otherwise it is not a part of this file : download it again from zero
+                    print(f"Partial download of {url} does not match the file on the server, downloading it again")
+                    os.remove(part_path)
+                    continue
+                if response.status not in (200, 206):
+                    response.read()
+                    raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+
+                # If the server ignores the Range header, start again from zero
+                if response.status == 200:
+                    offset = 0
+                with open(part_path, "ab" if offset > 0 else "wb") as f:
+                    shutil.copyfileobj(response, f, CHUNK_SIZE)
+
+                # http.client silently stops at a closed connection : check that the whole body arrived
+                length = response.getheader("Content-Length")
+                if length is not None and os.path.getsize(part_path) < offset + int(length):
+                    raise http.client.IncompleteRead(b"", offset + int(length) - os.path.getsize(part_path))
+                break
+            except (http.client.IncompleteRead, ConnectionError, TimeoutError) as e:
+                if attempt == self.retries:
+                    raise e
+                print(f"Download of {url} interrupted ({e!r}), resuming at {os.path.getsize(part_path) if os.path.isfile(part_path) else 0} bytes")
+            finally:
+                if response is not None:
+                    self.pool.close_response(response)
+        else:
+            raise urllib.error.URLError(f"Could not download {url} in {self.retries + 1} attempts")
+
+        os.replace(part_path, save_path)
+        self.record_probe(url, True)
+        self.save_probe_index()
+        return response
+
+    def download(self, url, save_path):
+        # Download `url` to `save_path` and register it in the cache. If a file from the same url is already cached,
+        # ask the server whether it changed, and link to it (without downloading) if it did not.
+        headers = {}
+        if (cached := self.cache.find(url)) is not None:
+            cached_path, entry = cached
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = self.fetch(url, save_path, headers if headers else None)
+        if response.status == 304:
+            self.cache.link(cached_path, save_path)
+        else:
+            self.cache.add(save_path, url, etag=response.getheader("ETag"), last_modified=response.getheader("Last-Modified"))
+        return save_path
+
+    def adopt(self, url, path):
+        # Register in the cache a file that was there before the manifest. It is verified if the server gives its size
+        # (Content-Length), which must be the size of the file, and its Last-Modified date, which must be before the
+        # file was written (so that a permalink whose file changed since is not taken for the same file). Otherwise it
+        # is kept as it is, but registered as unverified. Returns whether there was such a file.
+        if not os.path.isfile(path) or self.cache.is_registered(path):
+            return False
+        response = None
+        try:
+            response = self.pool.request("HEAD", url)
+            response.read()
+            self.pool.close_response(response)
+        except (OSError, http.client.HTTPException):
+            pass
+        length = response.getheader("Content-Length") if response is not None and response.status == 200 else None
+        last_modified = response.getheader("Last-Modified") if length is not None else None
+        try:
+            modified_before = last_modified is not None and email.utils.parsedate_to_datetime(last_modified).timestamp() <= os.path.getmtime(path)
+        except (TypeError, ValueError):
+            modified_before = False
+        if length is not None and int(length) == os.path.getsize(path) and modified_before:
+            self.cache.add(path, url, etag=response.getheader("ETag"), last_modified=last_modified)
+        else:
+            print(f"{path} was downloaded before the download manifest, and could not be checked against {url}: it is used "
+                  "as it is (remove it to download it again)")
+            self.cache.add(path, url, verified=False)
+        return True
+
+    def get_zip_path(self, filename):
+        return os.path.join(self.zip_folder, filename.rsplit(".", 1)[0] + ".zip")
+
+    def is_file_downloaded(self, filename, zip = False):
+        # With `zip`, the archive is enough (its members can be read without extracting them). The files that were there
+        # before the manifest count too (they are checked, see `adopt`, when they are used).
+        def is_there(path):
+            return self.cache.is_valid(path) or (os.path.isfile(path) and not self.cache.is_registered(path))
+        return is_there(self.get_path(filename)) or (zip and is_there(self.get_zip_path(filename)))
+
+    def get_zip_member(self, zip_file: ZipFile, filename, zip_file_name = None):
+        files = zip_file.namelist()
+        if zip_file_name is None:
+            extension = filename.rsplit(".", 1)[-1]
+            files2 = [f for f in files if f.endswith(extension)]
+            if len(files2)>0:
+                return files2[0]
+            return files[0]
+        files3 = [f for f in files if f.endswith(zip_file_name)]
+        if len(files3) == 0:
+            e = KeyError(zip_file_name)
+            e.add_note(f"No file '{zip_file_name}' found in archive. Found : {files}")
+            raise e
+        return files3[0]
+
+    def open_zip_member(self, filename, zip_file_name = None):
+        zip_save_path = self.get_zip_path(filename)
+        try:
+            # The member stays readable after the ZipFile is closed (the file handle is shared)
+            with ZipFile(zip_save_path) as zip_file:
+                return zip_file.open(self.get_zip_member(zip_file, filename, zip_file_name))
+        except BadZipFile as e:
+            e.add_note(zip_save_path)
+            raise e
+
+    def open_downloaded(self, filename, zip = False, zip_file_name = None):
+        # Binary file-like object over a downloaded file : the extracted copy if there is one, else the member of
+        # the zip archive (decompressed on the fly)
+        save_path = self.get_path(filename)
+        if self.cache.is_valid(save_path) or not zip:
+            self.cache.touch(save_path)
+            return open(save_path, "rb")
+        self.cache.touch(self.get_zip_path(filename))
+        return self.open_zip_member(filename, zip_file_name)
+
+    def open_with_cache(self, url : str, name: str, zip = False, zip_file_name = None):
+        self.download_with_cache(url, name, zip=zip, zip_file_name=zip_file_name, extract=False)
+        return self.open_downloaded(name, zip=zip, zip_file_name=zip_file_name)
 
     def download_with_cache(self,
                             url : str,
                             name: str,
                             zip = False,
                             zip_file_name = None,
-                            method = "HEAD"):     
+                            extract = True,
+                            evict = True,
+                            method = None):
+        # With `zip` and `extract=False`, only the archive is downloaded and its path is returned (see `open_downloaded`).
+        # With `evict`, the least recently used files are then removed from the cache if it is over budget.
+        # `method` is not used anymore (the existence of the file is not checked before downloading it).
+        if method is not None:
+            warnings.warn("The `method` argument of `download_with_cache` is ignored", DeprecationWarning, stacklevel=2)
         save_path = os.path.join(self.download_folder, name)
-        zip_save_path = ""
-        if zip :
-            n, extension = name.rsplit(".", 1)
-            zip_save_path = os.path.join(self.zip_folder, n + "." + "zip")
-            
-        if os.path.isfile(save_path):
+        zip_save_path = self.get_zip_path(name) if zip else ""
+
+        if self.cache.is_valid(save_path) or (not zip and self.adopt(url, save_path)):
+            self.cache.touch(save_path)
             return save_path
-        
-        if not (zip and os.path.isfile(zip_save_path)):
-            request = urllib.request.Request(url, method=method)
-            with urllib.request.urlopen(request) as response:
-                if response.status == 200:  # URL exists
-                    # Proceed to download the file
-                    # Create directories if they don't exist
-                    os.makedirs(os.path.dirname(zip_save_path if zip else save_path), exist_ok=True)
-                    # Download and save the file
-                    urllib.request.urlretrieve(url, zip_save_path if zip else save_path)
-            
+
+        if not (zip and (self.cache.is_valid(zip_save_path) or self.adopt(url, zip_save_path))):
+            self.download(url, zip_save_path if zip else save_path)
+        elif zip:
+            self.cache.touch(zip_save_path)
+
+        if zip and not extract:
+            if evict:
+                self.cache.evict(protect=(zip_save_path, ))
+            return zip_save_path
+
         if zip:
-            try:
-                with ZipFile(zip_save_path) as zip_file:
-                    files = zip_file.namelist()
-                    if zip_file_name is None:
-                        files2 = [f for f in files if f.endswith(extension)]
-                        if len(files2)>0:
-                            file = files2[0]
-                        else :
-                            file = files[0]
-                    else:
-                        files3 = [f for f in files if f.endswith(zip_file_name)]
-                        if len(files3) == 0:
-                            print(f"No file '{zip_file_name}' found in archive. Found : {files}")
-                        file = files3[0]
-                    try:    
-                        zip_file.extract(file, self.download_folder)
-                    except KeyError as e:
-                        print(files)
-                        raise e
-            except BadZipFile as e:
-                print(zip_save_path)
-                raise e
-
-
-            os.rename(os.path.join(self.download_folder, file), save_path)
-
-            # Clean any remaining empty folder in `self.download_folder`
-            for item in os.listdir(self.download_folder):
-                item_path = os.path.join(self.download_folder,item)
-                if os.path.isdir(item_path):
-                    if not os.listdir(item_path):
-                        os.removedirs(item_path)
-            
-        return save_path
\ No newline at end of file
+            # Stream the member to its final name
+            with self.open_zip_member(name, zip_file_name) as member, open(save_path + PART_SUFFIX, "wb") as f:
+                shutil.copyfileobj(member, f, CHUNK_SIZE)
+            os.replace(save_path + PART_SUFFIX, save_path)
+
+            self.cache.add(save_path)
+
+        # Keep the cache within its disk budget
+        if evict:
+            self.cache.evict(protect=(save_path, zip_save_path))
+
+        return save_path
+
+    def download_many(self, downloads, max_workers = None):
+        # Run several `download_with_cache` calls at once. `downloads` is an iterable of dicts of arguments
+        # (or of (url, name) tuples). Returns the paths in the same order. The downloads to the same `name` are only
+        # run once (they would write the same files). The cache is only evicted once all of them are done, keeping
+        # every file of the batch.
+        downloads = [d if isinstance(d, dict) else dict(zip(("url", "name"), d)) for d in downloads]
+        unique = {}
+        for d in downloads:
+            if unique.setdefault(d["name"], d) != d:
+                raise ValueError(f"Different downloads to the same file '{d['name']}': {unique[d['name']]} and {d}")
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+            futures = {name: executor.submit(self.download_with_cache, **d, evict=False) for name, d in unique.items()}
+            paths = {name: future.result() for name, future in futures.items()}
+        self.cache.evict(protect=list(paths.values()) + [self.get_zip_path(name) for name, d in unique.items() if d.get("zip")])
+        return [paths[d["name"]] for d in downloads]
@@ -0,0 +1,41 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from code_files.PublicTransport.columnar import pa, read_table, write_table
+from code_files.PublicTransport.processing import FILTERED_DTYPES, TIME_COLUMNS, format_times, read_timetable
+
+SHIPPED_TIMETABLE = os.path.join(os.path.dirname(__file__), "..", "transport_data", "2025_01_07", "0_filtered_data", "705", "timetable")
+SERVICE_DAY = datetime.date(2025, 1, 7)
+
+class TableWriterTest(unittest.TestCase):
+    @unittest.skipIf(pa is None, "needs pyarrow")
+    def test_existing_csv_is_kept(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "table")
+            df = pd.DataFrame({"A": [1, 2]})
+            write_table(df, path, {"A": "Int64"}, csv=True)
+            write_table(df.iloc[:1], path, {"A": "Int64"})
+            self.assertTrue(os.path.isfile(path + ".csv"))
+            self.assertEqual(len(read_table(path)), 1)
+            # Only the csv : the parquet file would be read instead, it is removed
+            write_table(df, path, {"A": "Int64"}, parquet=False)
+            self.assertFalse(os.path.isfile(path + ".parquet"))
+            self.assertEqual(len(read_table(path)), 2)
+
+    def test_csv_times(self):
+        # The csv export has timestamps (as the shipped tables), read back as seconds since the start of the service day
+        timetable = read_timetable(SHIPPED_TIMETABLE, SERVICE_DAY)
+        self.assertTrue(all(str(timetable[column].dtype) == "Int32" for column in TIME_COLUMNS))
+        raw = read_table(SHIPPED_TIMETABLE)
+        pd.testing.assert_frame_equal(format_times(timetable, SERVICE_DAY)[TIME_COLUMNS].fillna(""), raw[TIME_COLUMNS].fillna("").astype(str))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "timetable")
+            write_table(timetable, path, FILTERED_DTYPES["timetable"], parquet=False, csv_format=lambda df: format_times(df, SERVICE_DAY))
+            pd.testing.assert_frame_equal(read_timetable(path, SERVICE_DAY)[TIME_COLUMNS], timetable[TIME_COLUMNS])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+import datetime
+import http.client
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from code_files.download import DownloadManager, PART_SUFFIX
+
+PAYLOAD = bytes(range(256)) * 4096
+ETAG = '"payload-v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Local stand-in for the data portals : serves PAYLOAD with Range, ETag and If-None-Match support. The behaviour of
+    # each request is taken from `server.plan` ("ok" when empty) : "cut" sends half of the body then closes the
+    # connection, "drop" closes the connection without answering.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.server.requests.append(("HEAD", dict(self.headers)))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.requests.append(("GET", dict(self.headers)))
+        action = self.server.plan.pop(0) if self.server.plan else "ok"
+        if action == "drop":
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].split("=")[1].split("-")[0])
+            if start >= len(PAYLOAD):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(PAYLOAD)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        body = PAYLOAD[start:]
+        self.send_response(206 if start > 0 else 200)
+        if start > 0:
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", ETAG)
+        self.end_headers()
+        if action == "cut":
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+        else:
+            self.wfile.write(body)
+
+class DownloadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/payload.bin"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.plan = []
+        self.server.requests = []
+        self.folder = tempfile.TemporaryDirectory()
+        path = self.folder.name
+        self.dl = DownloadManager(zip_folder=os.path.join(path, "zip"), download_folder=os.path.join(path, "downloaded"),
+                                  probe_index_file=os.path.join(path, "probe_index.json"), manifest_file=os.path.join(path, "manifest.json"))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_resume_interrupted_body(self):
+        self.server.plan = ["cut", "cut"]
+        save_path = self.dl.get_path("payload.bin")
+        self.dl.fetch(self.url, save_path)
+        self.assertEqual(self.read(save_path), PAYLOAD)
+        self.assertFalse(os.path.exists(save_path + PART_SUFFIX))
+        ranges = [headers.get("Range") for _, headers in self.server.requests]
+        self.assertEqual(ranges, [None, f"bytes={len(PAYLOAD) // 2}-", f"bytes={len(PAYLOAD) - len(PAYLOAD) // 4}-"])
+
+    def test_retry_connection_error_on_reconnect(self):
+        self.server.plan = ["cut", "drop", "ok"]
+        save_path = self.dl.get_path("payload.bin")
+        self.dl.fetch(self.url, save_path)
+        self.assertEqual(self.read(save_path), PAYLOAD)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_complete_part_file_416(self):
+        save_path = self.dl.get_path("payload.bin")
+        with open(save_path + PART_SUFFIX, "wb") as f:
+            f.write(PAYLOAD)
+        response = self.dl.fetch(self.url, save_path)
+        self.assertEqual(response.status, 416)
+        self.assertEqual(self.read(save_path), PAYLOAD)
+        self.assertFalse(os.path.exists(save_path + PART_SUFFIX))
+
+    def test_mismatched_part_file_416(self):
+        # A ".part" file bigger than the file on the server is not a part of it : downloaded again
+        save_path = self.dl.get_path("payload.bin")
+        with open(save_path + PART_SUFFIX, "wb") as f:
+            f.write(PAYLOAD + b"stale")
+        response = self.dl.fetch(self.url, save_path)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.read(save_path), PAYLOAD)
+        self.assertEqual([headers.get("Range") for _, headers in self.server.requests], [f"bytes={len(PAYLOAD) + 5}-", None])
+
+    def test_reconnect_fails_twice(self):
+        # The idle connection is dropped, then the new one too : the error is raised, and no connection is kept
+        self.dl.fetch(self.url, self.dl.get_path("payload.bin"))
+        self.assertTrue(any(self.dl.pool.idle.values()))
+        self.server.plan = ["drop", "drop"]
+        with self.assertRaises((ConnectionError, http.client.HTTPException)):
+            self.dl.pool.request("GET", self.url)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertFalse(any(self.dl.pool.idle.values()))
+
+    def test_method_is_ignored(self):
+        with self.assertWarns(DeprecationWarning):
+            path = self.dl.download_with_cache(self.url, "payload.bin", method="HEAD")
+        self.assertEqual(self.read(path), PAYLOAD)
+
+    def test_latest_downloaded(self):
+        for name in ["Timetable_2025-01-06.csv", "Timetable_2025-01-08.csv", "stops.csv"]:
+            with open(self.dl.get_path(name), "wb") as f:
+                f.write(b"")
+        self.assertEqual(self.dl.get_latest_downloaded("Timetable_{date}.csv", (2025, 1, 7)), (self.dl.get_path("Timetable_2025-01-06.csv"), datetime.date(2025, 1, 6)))
+        self.assertEqual(self.dl.get_latest_downloaded("stops.csv"), (self.dl.get_path("stops.csv"), None))
+        self.assertIsNone(self.dl.get_latest_downloaded("other.csv"))
+
+    def test_adopt_legacy_file(self):
+        # A complete file written after the last modification on the server : verified, and not downloaded again
+        with open(self.dl.get_path("payload.bin"), "wb") as f:
+            f.write(PAYLOAD)
+        self.assertTrue(self.dl.is_file_downloaded("payload.bin"))
+        path = self.dl.download_with_cache(self.url, "payload.bin")
+        self.assertEqual([method for method, _ in self.server.requests], ["HEAD"])
+        self.assertTrue(self.dl.cache.is_valid(path))
+        self.assertTrue(self.dl.cache.is_verified(path))
+
+    def test_adopt_unverified_file(self):
+        # A file older than the file on the server (e.g. of a permalink) : kept, but not verified
+        path = self.dl.get_path("payload.bin")
+        with open(path, "wb") as f:
+            f.write(PAYLOAD[:10])
+        os.utime(path, (1577836800, 1577836800))
+        self.assertEqual(self.dl.download_with_cache(self.url, "payload.bin"), path)
+        self.assertEqual([method for method, _ in self.server.requests], ["HEAD"])
+        self.assertEqual(self.read(path), PAYLOAD[:10])
+        self.assertFalse(self.dl.cache.is_verified(path))
+        self.assertTrue(self.dl.is_file_downloaded("payload.bin"))
+
+    def test_not_modified_304(self):
+        first = self.dl.download(self.url, self.dl.get_path("first.bin"))
+        second = self.dl.download(self.url, self.dl.get_path("second.bin"))
+        self.assertEqual(self.server.requests[-1][1].get("If-None-Match"), ETAG)
+        self.assertEqual(self.read(second), PAYLOAD)
+        self.assertTrue(os.path.samefile(first, second))
+
+    def test_download_many_same_name_once(self):
+        paths = self.dl.download_many([(self.url, "payload.bin"), (self.url, "payload.bin")])
+        self.assertEqual(paths, [self.dl.get_path("payload.bin")] * 2)
+        self.assertEqual(self.read(paths[0]), PAYLOAD)
+        self.assertEqual(sum(method == "GET" for method, _ in self.server.requests), 1)
+
+if __name__ == "__main__":
+    unittest.main()
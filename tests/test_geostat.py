@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from code_files.area import Area
+from code_files.Tasks.geostat import STAT, Enterprises
+
+def hectares():
+    # 4 x 3 hectares, weighted by their column (the first column has no weight)
+    x, y = np.meshgrid(np.arange(4) * 100.0 + 2500000, np.arange(3) * 100.0 + 1150000, indexing="ij")
+    return pd.DataFrame({"POSITION_X": x.ravel(), "POSITION_Y": y.ravel(), "POPULATION": (x.ravel() - 2500000) / 100})
+
+def enterprise_hectares():
+    # STATENT-like hectares : 1 to 12 enterprises, with as many jobs per enterprise as their column (+1)
+    df = hectares().drop(columns="POPULATION")
+    column = (df.POSITION_X - 2500000) // 100
+    return df.assign(SHOPS=np.arange(len(df)) + 1, SHOPS_EMP=(column + 1) * (np.arange(len(df)) + 1), SHOPS_ETP=(column + 1) * (np.arange(len(df)) + 1))
+
+# Cuts the last column of hectares, and the lower half of the first row
+AREA = Area(2500000, 2500350, 1150050, 1150300)
+
+class GenerateTest(unittest.TestCase):
+    def test_exact_n(self):
+        stat = STAT(AREA, hectares(), "POPULATION")
+        for method in ["alias", "hierarchical"]:
+            for precision in [100, 10]:
+                points = stat.generate_n(1000, precision, seed=0, method=method)
+                self.assertEqual(points.shape, (1000, 2))
+                self.assertTrue(AREA.is_inside(*points.T).all())
+                # Never in the hectares without weight
+                self.assertTrue((points[:, 0] >= 2500100).all())
+
+    def test_seed(self):
+        stat = STAT(AREA, hectares(), "POPULATION")
+        np.testing.assert_array_equal(stat.generate_n(100, 10, seed=1), stat.generate_n(100, 10, seed=1))
+
+    def test_unknown_arguments(self):
+        stat = STAT(AREA, hectares(), "POPULATION")
+        with self.assertRaises(TypeError):
+            stat.generate_n(10, replace=True)
+        with self.assertRaises(TypeError):
+            stat.generate_per_proportion(0.5, replace=True)
+        self.assertEqual(len(stat.generate_per_proportion(0.5, method="hierarchical")), int(0.5 * hectares().POPULATION.sum()))
+
+class EnterprisesTest(unittest.TestCase):
+    def test_exact_n(self):
+        enterprises = Enterprises(AREA, enterprise_hectares(), 10, seed=0)
+        points = enterprises.generate_n(20000, seed=0)
+        self.assertEqual(points.shape, (20000, 2))
+        self.assertTrue(AREA.is_inside(*points.T).all())
+
+        # Each enterprise inside the area is drawn proportionally to its SHOPS_ETP, then jittered by 50 m (as from the rows
+        # of `df`), when it stays inside the area
+        df = enterprises.df
+        df = df.loc[AREA.is_inside(df.POSITION_X + 50, df.POSITION_Y + 50)]
+        expected = df.groupby(["POSITION_X", "POSITION_Y"]).SHOPS_ETP.sum()
+        expected /= expected.sum()
+        found = pd.DataFrame(points - 50, columns=["POSITION_X", "POSITION_Y"]).value_counts(normalize=True)
+        found = found.reindex(expected.index, fill_value=0)
+        self.assertAlmostEqual(found.sum(), 1)
+        self.assertLess((found - expected).abs().max(), 0.01)
+
+    def test_hierarchical(self):
+        points = Enterprises(AREA, enterprise_hectares(), 100, seed=0).generate_n(100, seed=0, method="hierarchical")
+        self.assertTrue(AREA.is_inside(*points.T).all())
+        with self.assertRaises(ValueError):
+            Enterprises(AREA, enterprise_hectares(), 10, seed=0).generate_n(100, method="hierarchical")
+
+if __name__ == "__main__":
+    unittest.main()
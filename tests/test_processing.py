@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from code_files.download import DownloadManager
+from code_files.PublicTransport.fingerprint import read_fingerprint, write_fingerprint
+from code_files.PublicTransport.linedata import get_line_path
+from code_files.PublicTransport.processing import TransportData
+
+SHIPPED_FILTERED = os.path.join(os.path.dirname(__file__), "..", "transport_data", "2025_01_07", "0_filtered_data", "705")
+LINE_ID = "85:764:705"
+
+class StatusTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        shutil.copytree(SHIPPED_FILTERED, os.path.join(self.folder, "2025_01_07", "0_filtered_data", "705"))
+        dl = DownloadManager(*(os.path.join(self.folder, name) for name in ["zip", "download", "probe.json", "manifest.json"]))
+        self.td = TransportData("705", line_id=LINE_ID, date=(2025, 1, 7), folder=self.folder, download_manager=dl)
+
+    def test_status(self):
+        # The shipped filtered data has no fingerprint
+        self.assertEqual(self.td.get_status(), 0)
+        write_fingerprint(self.td.path_join(self.td.filtered_folder, self.td.name), self.td.filter_params())
+        self.assertEqual(self.td.get_status(), 2)
+
+        self.td.get_lines_data(verbose=0, workers=1)
+        self.assertEqual(self.td.get_status(), 3)
+
+        # A line built by another version of `build_timetable` (or without any fingerprint) is not up to date
+        line_path = get_line_path(self.td.path, LINE_ID)
+        saved = read_fingerprint(line_path)
+        write_fingerprint(line_path, {**saved["params"], "version": saved["params"]["version"] - 1})
+        self.assertEqual(self.td.get_status(), 2)
+        os.remove(os.path.join(line_path, "fingerprint.json"))
+        self.assertEqual(self.td.get_status(), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import datetime
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from code_files.PublicTransport.linedata import LineData
+from code_files.PublicTransport.ragged import RaggedTimetable
+from code_files.PublicTransport.timetable import EVENTS
+
+SERVICE_DAY = datetime.date(2025, 1, 7)
+
+def timetable_frame(n_stops = 3, n_journeys = 2):
+    # Timetable of `n_journeys` journeys going through `n_stops` stops, one minute apart, without the real arrival
+    # at the first stop
+    index = pd.MultiIndex.from_tuples([(f"Stop {s}", 8500000 + s, event) for s in range(n_stops) for event in EVENTS],
+                                      names=["STOP_NAME", "STOP_NUMBER", "EVENT"])
+    start = pd.Timestamp(SERVICE_DAY) + pd.Timedelta(hours=8)
+    values = {f"J{j}": [start + pd.Timedelta(minutes=10 * j + s, seconds=30 * (event.endswith("REAL"))) for s in range(n_stops) for event in EVENTS]
+              for j in range(n_journeys)}
+    df = pd.DataFrame(values, index=index).rename_axis(columns="JOURNEY_ID")
+    df.iloc[1] = pd.NaT
+    return df
+
+def empty_timetable():
+    # Timetable of a line whose journeys were all dropped, as read back from its csv files
+    index = pd.MultiIndex.from_arrays([[], [], []], names=["STOP_NAME", "STOP_NUMBER", "EVENT"])
+    return pd.DataFrame(index=index, columns=pd.Index([], name="JOURNEY_ID", dtype=object), dtype="M8[ns]")
+
+class RaggedTimetableTest(unittest.TestCase):
+    def test_round_trip(self):
+        df = timetable_frame()
+        ragged = RaggedTimetable.from_frame(df)
+        self.assertEqual(ragged.service_day, SERVICE_DAY)
+        # 3 stops x 2 event types per journey
+        np.testing.assert_array_equal(ragged.offsets, [0, 6, 12])
+        pd.testing.assert_frame_equal(ragged.to_frame(), df)
+
+    def test_empty_timetable(self):
+        df = empty_timetable()
+        ragged = RaggedTimetable.from_frame(df, SERVICE_DAY)
+        self.assertEqual(len(ragged.journey_ids), 0)
+        np.testing.assert_array_equal(ragged.offsets, [0])
+        self.assertEqual(ragged.to_frame().shape, (0, 0))
+        self.assertEqual(list(ragged.to_frame().index.names), ["STOP_NAME", "STOP_NUMBER", "EVENT"])
+
+    def test_empty_timetable_with_journeys(self):
+        df = timetable_frame().iloc[:0]
+        ragged = RaggedTimetable.from_frame(df, SERVICE_DAY)
+        np.testing.assert_array_equal(ragged.offsets, [0, 0, 0])
+        self.assertEqual(list(ragged.to_frame().columns), ["J0", "J1"])
+
+    def test_compact_does_not_keep_the_frame(self):
+        with tempfile.TemporaryDirectory() as folder:
+            stops = pd.DataFrame({"STOP_NUMBER": [8500000], "POSITION_X": [0.0], "POSITION_Y": [0.0]}, index=pd.Index(["Stop 0"], name="STOP_NAME"))
+            line = LineData("85:1:1", "1", folder, timetable=timetable_frame(), stops=stops, routes=pd.DataFrame(), journeys=pd.DataFrame())
+            line.compact()
+            pd.testing.assert_frame_equal(line.timetable, timetable_frame())
+            self.assertIsNone(line._timetable)
+
+    def test_empty_timetable_bundle(self):
+        with tempfile.TemporaryDirectory() as folder:
+            stops = pd.DataFrame({"STOP_NUMBER": [8500000], "POSITION_X": [0.0], "POSITION_Y": [0.0]}, index=pd.Index(["Stop 0"], name="STOP_NAME"))
+            line = LineData("85:1:1", "1", folder, timetable=empty_timetable(), stops=stops, routes=pd.DataFrame(), journeys=pd.DataFrame())
+            line.save_data()
+            loaded = LineData("85:1:1", "1", folder)
+            self.assertEqual(loaded.timetable.shape, (0, 0))
+            self.assertEqual(len(loaded.ragged.journey_ids), 0)
+            self.assertEqual(len(loaded.stops), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from code_files.PublicTransport.linedata import LineData, LinesData
+from code_files.PublicTransport.routing import ConnectionScan
+from tests.test_ragged import empty_timetable
+from tests.test_stopindex import shipped_lines
+
+TRANSFER_RADIUS = 150
+
+def reference(engine, source, departure, target):
+    # Earliest arrival of one query, scanning the connections one by one, with the footpaths from the distances between
+    # all the stops : a trip is boarded at a stop reached in time, and one can walk from wherever a trip stops
+    distances = np.hypot(*(engine.positions[:, None] - engine.positions[None]).transpose(2, 0, 1))
+    arrivals = np.full(len(engine.stop_numbers), np.inf)
+    def reach(stop, time):
+        arrivals[stop] = min(arrivals[stop], time)
+        near = np.flatnonzero(distances[stop] <= TRANSFER_RADIUS)
+        near = near[near != stop]
+        arrivals[near] = np.minimum(arrivals[near], time + np.ceil(distances[stop, near] / engine.walking_speed))
+
+    reach(source, departure)
+    boarded = set()
+    for c in range(len(engine)):
+        if engine.trip[c] in boarded or arrivals[engine.departure_stop[c]] <= engine.departure[c]:
+            boarded.add(engine.trip[c])
+            reach(engine.arrival_stop[c], engine.arrival[c])
+    return arrivals[target] if np.isfinite(arrivals[target]) else np.nan
+
+class ConnectionScanTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        lines = shipped_lines()
+        cls.lines = LinesData(*[lines[line_id] for line_id in sorted(lines)[:6]])
+        cls.engine = ConnectionScan(cls.lines, transfer_radius=TRANSFER_RADIUS)
+        rng = np.random.default_rng(0)
+        n = 40
+        cls.sources = rng.choice(cls.engine.stop_numbers, n)
+        cls.targets = rng.choice(cls.engine.stop_numbers, n)
+        cls.departures = rng.integers(6 * 3600, 20 * 3600, n)
+
+    def test_reference(self):
+        arrivals = self.engine.earliest_arrival(self.sources, self.departures, self.targets, batch_size=16)
+        sources, targets = self.engine.stop_positions(self.sources), self.engine.stop_positions(self.targets)
+        expected = [reference(self.engine, *query) for query in zip(sources, self.departures, targets)]
+        np.testing.assert_array_equal(arrivals, expected)
+        self.assertGreater(np.isfinite(arrivals).sum(), len(arrivals) // 2)
+
+    def test_empty_line_is_skipped(self):
+        with tempfile.TemporaryDirectory() as folder:
+            stops = pd.DataFrame({"STOP_NUMBER": [1], "POSITION_X": [0.0], "POSITION_Y": [0.0]}, index=pd.Index(["Nowhere"], name="STOP_NAME"))
+            empty = LineData("85:1:1", "1", folder, timetable=empty_timetable(), stops=stops, routes=pd.DataFrame(), journeys=pd.DataFrame())
+            engine = ConnectionScan(LinesData(empty, *self.lines.values()), transfer_radius=TRANSFER_RADIUS)
+            self.assertEqual(engine.service_day, self.engine.service_day)
+            np.testing.assert_array_equal(engine.earliest_arrival(self.sources, self.departures, self.targets),
+                                          self.engine.earliest_arrival(self.sources, self.departures, self.targets))
+            with self.assertRaises(ValueError):
+                ConnectionScan(empty)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import unittest
+
+import numpy as np
+
+from code_files.PublicTransport.linedata import LineData, LinesData
+from code_files.PublicTransport.stopindex import StopIndex
+
+SHIPPED_DATE = os.path.join(os.path.dirname(__file__), "..", "transport_data", "2025_01_07")
+
+def shipped_lines():
+    # Lines of the shipped 2025_01_07 network (their stops only, from the csv files)
+    lines = LinesData()
+    for folder in sorted(os.listdir(SHIPPED_DATE)):
+        stops = [file for file in os.listdir(os.path.join(SHIPPED_DATE, folder)) if file.endswith("_stops.csv")]
+        if len(stops) == 1:
+            lines.add_line(LineData(folder, stops[0][:-len("_stops.csv")], SHIPPED_DATE))
+    return lines
+
+def brute_force(lines, pickup_x, pickup_y, delivery_x, delivery_y):
+    # Best line of each task from the dense (tasks x lines) distances, as `compute_improvement` used to do
+    distances, stops = [], []
+    for line in lines.values():
+        pickup_stop_x, pickup_stop_y = line.get_nearest_stops(pickup_x, pickup_y)
+        delivery_stop_x, delivery_stop_y = line.get_nearest_stops(delivery_x, delivery_y)
+        distances.append(((pickup_stop_x - pickup_x)**2 + (pickup_stop_y - pickup_y)**2)**0.5
+                         + ((delivery_stop_x - delivery_x)**2 + (delivery_stop_y - delivery_y)**2)**0.5)
+        stops.append([pickup_stop_x, pickup_stop_y, delivery_stop_x, delivery_stop_y])
+    distances, stops = np.array(distances), np.array(stops)
+    best = np.argmin(distances, axis=0)
+    tasks = np.arange(len(pickup_x))
+    return best, *stops[best, :, tasks].T, distances[best, tasks]
+
+class BestLinesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.lines = shipped_lines()
+        cls.index = StopIndex(cls.lines)
+        area = cls.lines.get_area(margin=3000)
+        rng = np.random.default_rng(0)
+        n = 5000
+        cls.tasks = [rng.uniform(area.x_min, area.x_max, n), rng.uniform(area.y_min, area.y_max, n),
+                     rng.uniform(area.x_min, area.x_max, n), rng.uniform(area.y_min, area.y_max, n)]
+        cls.expected = brute_force(cls.lines, *cls.tasks)
+
+    def assert_same(self, result):
+        for name, expected, found in zip(["line", "pickup_stop_x", "pickup_stop_y", "delivery_stop_x", "delivery_stop_y", "distance"], self.expected, result):
+            np.testing.assert_array_equal(found, expected, err_msg=name)
+
+    def test_shipped_network(self):
+        self.assertGreater(len(self.lines), 40)
+        self.assert_same(self.index.best_lines(*self.tasks))
+
+    def test_loop_and_nearest_agree(self):
+        self.assert_same(self.index.best_lines_loop(*self.tasks))
+        self.assert_same(self.index.best_lines_nearest(*self.tasks))
+
+    def test_cutoff(self):
+        line, *stops, distance = self.index.best_lines(*self.tasks, cutoff=500)
+        pickup_x, pickup_y, delivery_x, delivery_y = self.tasks
+        _, pickup_stop_x, pickup_stop_y, delivery_stop_x, delivery_stop_y, best_distance = self.expected
+        # When the best line has a stop within the cutoff of both ends, it is found
+        within = (np.hypot(pickup_stop_x - pickup_x, pickup_stop_y - pickup_y) <= 500) & (np.hypot(delivery_stop_x - delivery_x, delivery_stop_y - delivery_y) <= 500)
+        np.testing.assert_array_equal(line[within], self.expected[0][within])
+        self.assertTrue((distance >= best_distance).all())
+        self.assertTrue((np.isinf(distance) == (line < 0)).all())
+
+if __name__ == "__main__":
+    unittest.main()
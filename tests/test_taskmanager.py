@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from code_files.Tasks.geostat import STAT, Enterprises
+from code_files.Tasks.taskManager import TASK_BLOCK_SIZE, TaskManager, block_seeds
+from tests.test_geostat import AREA, enterprise_hectares, hectares
+
+def task_manager(precision_in_meters = 1):
+    # A TaskManager on the synthetic hectares of test_geostat (without downloading STATENT and STATPOP)
+    tm = TaskManager.__new__(TaskManager)
+    tm.area = AREA
+    tm.precision_in_meters = precision_in_meters
+    tm.shops = Enterprises(AREA, enterprise_hectares(), precision_in_meters, seed=0)
+    tm.customers = STAT(AREA, hectares(), "POPULATION")
+    return tm
+
+class BlockSeedsTest(unittest.TestCase):
+    def test_spawn(self):
+        # The same seeds as spawning the root, whatever the block and however the root is given
+        root = np.random.SeedSequence(42)
+        for block, child in enumerate(root.spawn(3)):
+            expected = [seed.generate_state(4) for seed in child.spawn(2)]
+            for random_seed in [42, np.random.SeedSequence(42)]:
+                found = [seed.generate_state(4) for seed in block_seeds(random_seed, block)]
+                np.testing.assert_array_equal(found, expected)
+
+class TasksTest(unittest.TestCase):
+    def test_chunks(self):
+        # The tasks only depend on the seed : not on the chunk size, nor on which blocks are generated together
+        tm = task_manager()
+        n = TASK_BLOCK_SIZE + 1000
+        tasks = tm.get_tasks(n, random_seed=7)
+        self.assertEqual(len(tasks), n)
+        pd.testing.assert_index_equal(tasks.index, pd.RangeIndex(n))
+        self.assertTrue(AREA.is_inside(tasks.pickup_x, tasks.pickup_y).all() and AREA.is_inside(tasks.delivery_x, tasks.delivery_y).all())
+        for chunk_size in [1000, 3 * TASK_BLOCK_SIZE]:
+            chunks = list(tm.iter_tasks(n, random_seed=7, chunk_size=chunk_size))
+            self.assertTrue(all(len(chunk) == chunk_size for chunk in chunks[:-1]))
+            pd.testing.assert_frame_equal(pd.concat(chunks), tasks)
+        # One worker per block
+        workers = [pd.concat(tm.iter_tasks(n, random_seed=7, blocks=[block])) for block in [1, 0]]
+        pd.testing.assert_frame_equal(pd.concat(workers).sort_index(), tasks)
+        self.assertFalse(tm.get_tasks(1000, random_seed=8).equals(tasks.iloc[:1000]))
+
+    def test_empty(self):
+        self.assertEqual(len(task_manager().get_tasks(0, random_seed=0)), 0)
+
+if __name__ == "__main__":
+    unittest.main()
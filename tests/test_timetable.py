@@ -0,0 +1,34 @@
+import datetime
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from code_files.PublicTransport.timetable import MISSING_SECONDS, NAT, parse_timestamps, service_seconds
+
+def seconds(*timestamps):
+    return pd.to_datetime(list(timestamps), format="ISO8601").to_numpy("M8[s]").view("i8")
+
+class ParseTimestampsTest(unittest.TestCase):
+    def test_day_first(self):
+        # Days up to 12 could be read as months : istdaten gives the day first
+        days = [datetime.datetime(2025, 3, day, 10, 0) for day in range(1, 13)]
+        np.testing.assert_array_equal(parse_timestamps([day.strftime("%d.%m.%Y %H:%M") for day in days]), seconds(*days))
+        np.testing.assert_array_equal(parse_timestamps([day.strftime("%d.%m.%Y %H:%M:07") for day in days]), seconds(*days) + 7)
+
+    def test_layouts(self):
+        np.testing.assert_array_equal(parse_timestamps(["2025-03-05 10:00:07", "2025-12-01 23:59:59"]),
+                                      seconds("2025-03-05 10:00:07", "2025-12-01 23:59:59"))
+
+    def test_missing_and_other_layouts(self):
+        # The values that do not follow the layout of the first one are parsed by pandas (day first)
+        parsed = parse_timestamps(["05.03.2025 10:00", None, "", np.nan, "05.03.2025 10:00:30", "05/03/2025 11:00"])
+        np.testing.assert_array_equal(parsed, np.r_[seconds("2025-03-05 10:00"), [NAT] * 3, seconds("2025-03-05 10:00:30", "2025-03-05 11:00")])
+
+    def test_service_seconds(self):
+        # After midnight, the times of the service day are above 24 hours
+        np.testing.assert_array_equal(service_seconds(["07.01.2025 06:18", "08.01.2025 00:30", None], datetime.date(2025, 1, 7)),
+                                      [6 * 3600 + 18 * 60, 24 * 3600 + 30 * 60, MISSING_SECONDS])
+
+if __name__ == "__main__":
+    unittest.main()